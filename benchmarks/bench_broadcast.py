@@ -0,0 +1,90 @@
+"""
+Рассылка на локальной имитации Telegram с выдачей 429 и заблокированными чатами.
+
+Запускает рассылку, на середине останавливает ее как при перезапуске бота,
+продолжает с сохраненного курсора и проверяет, что каждый получатель получил
+сообщение, а заблокировавшие бота пропущены.
+
+Запуск: python -m benchmarks.bench_broadcast [--users 1000] [--rate 100] [--retry-after-rate 0.05]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from collections import Counter
+
+from benchmarks.fake_telegram import FakeTelegramServer
+from bot.middlewares.outbound_queue import outbound_queue
+from bot.utils.broadcast import BroadcastEngine, BroadcastJob, format_progress
+from main import create_bot
+
+FIRST_USER = 10_000
+ADMIN = 1
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=100.0)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--retry-after-rate", type=float, default=0.05)
+    parser.add_argument("--blocked", type=int, default=50)
+    parser.add_argument("--api-latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    recipients = list(range(FIRST_USER, FIRST_USER + args.users))
+    blocked = set(recipients[::max(1, args.users // args.blocked)][:args.blocked])
+    fake = FakeTelegramServer(latency=args.api_latency, retry_after_rate=args.retry_after_rate,
+                              retry_after=1, blocked_chats=blocked)
+    delivered = Counter()
+    fake.listeners.append(lambda method, params, result: method == "copyMessage" and delivered.update([int(params["chat_id"])]))
+    await fake.start()
+
+    # Скорость задает лимит рассылки, 429 повторяет общая очередь исходящих запросов
+    outbound_queue.set_rate(0)
+    bot = create_bot(token="42:bench", api_url=fake.url)
+    state_file = os.path.join(tempfile.mkdtemp(), "broadcast.json")
+
+    async def progress(job: BroadcastJob, rate: float):
+        print(format_progress(job, rate).replace("\n", " | "))
+
+    removed = set()
+
+    def remove_blocked(user_ids: list[int]) -> int:
+        removed.update(user_ids)
+        return len(user_ids)
+
+    started = time.perf_counter()
+    engine = BroadcastEngine(state_file, rate=args.rate, workers=args.workers, progress_interval=2.0,
+                             remove_blocked=remove_blocked)
+    engine.start(bot, BroadcastJob(source_chat_id=ADMIN, source_message_id=1, admin_chat_id=ADMIN,
+                                   total=len(recipients)), recipients, progress)
+
+    # Имитируем перезапуск бота посередине рассылки
+    while engine.job.processed < len(recipients) // 2:
+        await asyncio.sleep(0.05)
+    await engine.close()
+    print(f"-- остановлено на {engine.job.processed}, курсор {engine.job.cursor}")
+
+    engine = BroadcastEngine(state_file, rate=args.rate, workers=args.workers, progress_interval=2.0,
+                             remove_blocked=remove_blocked)
+    job = engine.load()
+    await engine.start(bot, job, recipients, progress)
+    elapsed = time.perf_counter() - started
+
+    missing = [user for user in recipients if user not in blocked and not delivered[user]]
+    duplicates = sum(1 for count in delivered.values() if count > 1)
+    print(f"Получателей: {len(recipients)}, заблокировали бота: {len(blocked)}")
+    print(f"Время: {elapsed:.1f} с, {job.processed / elapsed:.1f} сообщ/с при лимите {args.rate:.0f}")
+    print(f"Ответов 429: {fake.rejected['copyMessage']}, повторов: {outbound_queue.retries + job.retried}")
+    print(f"Не доставлено: {len(missing)}, доставлено повторно (на перезапуске): {duplicates}")
+    print(f"Удалено из получателей: {len(removed)}, из них не блокировали бота: {len(removed - blocked)}, "
+          f"блокировали, но не удалены: {len(blocked - removed)}")
+
+    await bot.session.close()
+    await fake.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,74 @@
+"""
+Сколько одновременно проходящих курс пользователей выдерживает бот.
+
+Поднимает локальную имитацию Telegram и бота на long polling, затем тысячи
+синтетических пользователей проходят настоящие разделы из bot/scenarios
+(см. benchmarks/load_harness.py). Выводит обновления в секунду,
+p50/p95/p99 задержки шага, вызовы API на шаг и память на пользователя.
+
+Ответы, аналитика и расписание пишутся во временный каталог, белый список
+на диске не меняется.
+
+Запуск: python -m benchmarks.bench_load [--users 2000] [--ramp 5] [--think 0] [--scenarios day_1 day_2]
+        [--api-latency 0.02] [--trace-memory]
+
+Переход между шагами задается как у бота, переменной STEP_TRANSITION
+(sequential, fast или edit), например: STEP_TRANSITION=edit python -m benchmarks.bench_load
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+
+# До импорта бота: данные нагрузочного теста не должны попасть в рабочие файлы
+DATA_DIR = tempfile.mkdtemp(prefix="bench_load_")
+for name, file_name in (("ANSWERS_PATH", "answers.sqlite3"), ("ANALYTICS_PATH", "analytics.sqlite3"),
+                        ("DRIP_PATH", "drip.sqlite3"), ("FSM_SQLITE_PATH", "fsm.sqlite3"),
+                        ("BROADCAST_STATE_FILE", "broadcast.json"), ("USERS_DIR", "users")):
+    os.environ.setdefault(name, os.path.join(DATA_DIR, file_name))
+
+from benchmarks.fake_telegram import FakeTelegramServer
+from benchmarks.load_harness import run_load
+from bot.middlewares import exist_middleware
+from bot.middlewares.outbound_queue import outbound_queue
+from bot.config import STEP_TRANSITION
+from bot.utils.scenario_registry import scenario_registry
+from main import create_bot, create_dispatcher
+
+FIRST_USER = 10_000
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--ramp", type=float, default=5.0)
+    parser.add_argument("--think", type=float, default=0.0)
+    parser.add_argument("--scenarios", nargs="*", default=None)
+    parser.add_argument("--api-latency", type=float, default=0.02)
+    parser.add_argument("--step-timeout", type=float, default=30.0)
+    parser.add_argument("--trace-memory", action="store_true")
+    args = parser.parse_args()
+
+    scenarios = args.scenarios or sorted(scenario_registry.names())
+    fake = FakeTelegramServer(latency=args.api_latency)
+    await fake.start()
+
+    # Пользователи стенда получают доступ только в памяти процесса
+    exist_middleware.store.users.update(range(FIRST_USER, FIRST_USER + args.users))
+    # Имитация не ограничивает скорость, меряем сам бот, а не лимит Telegram
+    outbound_queue.set_rate(0)
+    bot = create_bot(token="42:bench", api_url=fake.url)
+    dp = create_dispatcher()
+
+    print(f"Разделы: {', '.join(scenarios)}; переход между шагами: {STEP_TRANSITION}; данные: {DATA_DIR}")
+    report = await run_load(bot, dp, fake, scenarios, args.users, first_user=FIRST_USER, ramp=args.ramp,
+                            think_time=args.think, step_timeout=args.step_timeout,
+                            trace_memory=args.trace_memory)
+    print(report.format())
+
+    await bot.session.close()
+    await fake.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
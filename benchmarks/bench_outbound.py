@@ -0,0 +1,99 @@
+"""
+Общая очередь исходящих запросов на локальной имитации Telegram с выдачей 429.
+
+Одновременно идут массовая рассылка (низший приоритет), ответы пользователям
+по несколько сообщений в один чат и ответы на нажатия кнопок. Проверяется,
+что обработчики не видят 429, сообщения в один чат приходят по порядку, а
+ответы на кнопки ждут в очереди меньше, чем рассылка.
+
+Запуск: python -m benchmarks.bench_outbound [--bulk 1000] [--users 100] [--rate 200] [--retry-after-rate 0.02]
+"""
+import argparse
+import asyncio
+import time
+from collections import defaultdict
+
+from aiogram.exceptions import TelegramAPIError
+
+from benchmarks.fake_telegram import FakeTelegramServer
+from bot.middlewares.outbound_queue import outbound_queue, bulk_traffic
+from main import create_bot
+
+FIRST_BULK_USER = 100_000
+FIRST_USER = 10_000
+MESSAGES_PER_USER = 5
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bulk", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=200.0)
+    parser.add_argument("--retry-after-rate", type=float, default=0.02)
+    parser.add_argument("--api-latency", type=float, default=0.01)
+    args = parser.parse_args()
+
+    fake = FakeTelegramServer(latency=args.api_latency, retry_after_rate=args.retry_after_rate, retry_after=1)
+    received = defaultdict(list)
+    fake.listeners.append(lambda method, params, result: method == "sendMessage"
+                          and received[int(params["chat_id"])].append(params["text"]))
+    await fake.start()
+
+    outbound_queue.set_rate(args.rate)
+    bot = create_bot(token="42:bench", api_url=fake.url)
+    latencies = defaultdict(list)
+    errors = []
+
+    async def timed(kind: str, coro):
+        started = time.perf_counter()
+        try:
+            await coro
+        except TelegramAPIError as e:
+            errors.append(e)
+        latencies[kind].append(time.perf_counter() - started)
+
+    async def bulk():
+        with bulk_traffic():
+            await asyncio.gather(*(timed("bulk", bot.send_message(chat_id, "рассылка"))
+                                   for chat_id in range(FIRST_BULK_USER, FIRST_BULK_USER + args.bulk)))
+
+    async def user(chat_id: int):
+        # Обработчик отвечает несколькими сообщениями подряд, не дожидаясь каждого
+        await asyncio.sleep(0.001 * (chat_id - FIRST_USER))
+        await asyncio.gather(
+            timed("callback", bot.answer_callback_query(f"cb{chat_id}")),
+            *(timed("normal", bot.send_message(chat_id, str(i))) for i in range(MESSAGES_PER_USER)),
+        )
+
+    started = time.perf_counter()
+    await asyncio.gather(bulk(), *(user(chat_id) for chat_id in range(FIRST_USER, FIRST_USER + args.users)))
+    elapsed = time.perf_counter() - started
+
+    expected = [str(i) for i in range(MESSAGES_PER_USER)]
+    out_of_order = sum(1 for chat_id in range(FIRST_USER, FIRST_USER + args.users) if received[chat_id] != expected)
+    total = sum(len(values) for values in latencies.values())
+    print(f"Запросов: {total} за {elapsed:.1f} с ({total / elapsed:.0f} запр/с при лимите {args.rate:.0f})")
+    print(f"Ответов 429 от сервера: {sum(fake.rejected.values())}, ошибок у вызывающих: {len(errors)}")
+    print(f"Чатов с нарушенным порядком сообщений: {out_of_order} из {args.users}")
+    for kind in ("callback", "normal", "bulk"):
+        values = latencies[kind]
+        print(f"  {kind:>8}: p50 {percentile(values, 0.5) * 1000:7.1f} мс, "
+              f"p99 {percentile(values, 0.99) * 1000:7.1f} мс ({len(values)})")
+    metrics = outbound_queue.metrics()
+    depth = ", ".join(f"{name} {count}" for name, count in metrics["depth_by_priority"].items())
+    print(f"Очередь: повторов {metrics['retries']}, среднее ожидание {metrics['wait_avg'] * 1000:.1f} мс, "
+          f"максимум {metrics['wait_max'] * 1000:.1f} мс, "
+          f"глубина после завершения: {depth}")
+
+    await outbound_queue.close()
+    await bot.session.close()
+    await fake.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
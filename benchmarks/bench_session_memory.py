@@ -0,0 +1,70 @@
+"""
+Память FSM-сессий: полный словарь сценария в состоянии каждого пользователя (до)
+против компактной записи со ссылкой на общий реестр (после).
+
+Запуск: python -m benchmarks.bench_session_memory [--sessions 10000] [--scenario day_1]
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import tracemalloc
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from bot.config import SCENARIOS_DIR
+from bot.utils.scenario_registry import scenario_registry
+
+
+async def measure(sessions: int, make_data) -> tuple[int, int]:
+    """Возвращает (байт памяти на сессию, байт сериализованных данных на сессию)"""
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+
+    storage = MemoryStorage()
+    for user_id in range(sessions):
+        key = StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+        await storage.set_state(key, "UserState:in_scenario")
+        await storage.set_data(key, make_data())
+
+    gc.collect()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    sample = await storage.get_data(StorageKey(bot_id=1, chat_id=0, user_id=0))
+    serialized = len(json.dumps(sample, ensure_ascii=False, default=str).encode('utf-8'))
+    return (after - before) // sessions, serialized
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=10_000)
+    parser.add_argument("--scenario", default="day_1")
+    args = parser.parse_args()
+
+    scenario_file = os.path.join(SCENARIOS_DIR, f"{args.scenario}.json")
+    scenario = scenario_registry.get(args.scenario)
+
+    def legacy_data():
+        # Раньше load_scenario читал файл заново на каждый старт: у каждой сессии своя копия
+        with open(scenario_file, 'r', encoding='utf-8') as f:
+            return {'scenario': json.load(f), 'current_step': 0}
+
+    def compact_data():
+        return {'scenario_id': scenario.key, 'scenario_version': scenario.version, 'current_step': 0}
+
+    legacy_mem, legacy_size = await measure(args.sessions, legacy_data)
+    compact_mem, compact_size = await measure(args.sessions, compact_data)
+
+    print(f"Сессий: {args.sessions}, сценарий: {args.scenario}")
+    print(f"  до:    {legacy_mem:8d} Б/сессия в памяти, {legacy_size:6d} Б сериализованных данных, "
+          f"{legacy_mem * args.sessions / 2**20:8.1f} МБ всего")
+    print(f"  после: {compact_mem:8d} Б/сессия в памяти, {compact_size:6d} Б сериализованных данных, "
+          f"{compact_mem * args.sessions / 2**20:8.1f} МБ всего")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+"""
+Масштабирование пропускной способности по числу рабочих процессов.
+
+Для каждого значения WORKERS запускает бота (python main.py) отдельным процессом,
+направив его на локальную имитацию Telegram, кладет в getUpdates пачку
+обновлений (/menu от разных пользователей) и измеряет время до получения
+ответа на каждое из них.
+
+Запуск: python -m benchmarks.bench_sharding [--workers 1 2 4] [--updates 3000]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_telegram import FakeTelegramServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIRST_USER = 10_000
+update_ids = itertools.count(1)
+
+
+def menu_update(user_id: int) -> dict:
+    return {
+        "update_id": next(update_ids),
+        "message": {
+            "message_id": 1,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "bench"},
+            "text": "/menu",
+        },
+    }
+
+
+async def wait_for(condition, timeout: float):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError
+        await asyncio.sleep(0.01)
+
+
+async def run(workers: int, updates: int, users: int, api_latency: float, users_dir: str) -> float:
+    fake = FakeTelegramServer(latency=api_latency)
+    await fake.start()
+
+    env = {
+        **os.environ,
+        "BOT_TOKEN": "42:bench",
+        "TELEGRAM_API_URL": fake.url,
+        "WORKERS": str(workers),
+        "USERS_DIR": users_dir,
+        "FSM_STORAGE": "memory",
+        "DELIVERY_MODE": "polling",
+        "IMAGE_PIPELINE": "0",
+        "FILE_CACHE_CHAT_ID": "",
+    }
+    bot = subprocess.Popen([sys.executable, "main.py"], cwd=ROOT, env=env,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        # Бот готов, когда начал опрашивать getUpdates (в режиме процессов - после подключения всех рабочих)
+        await wait_for(lambda: fake.calls["getUpdates"] > 0, timeout=60)
+
+        started = time.perf_counter()
+        for i in range(updates):
+            fake.push_update(menu_update(FIRST_USER + i % users))
+        await wait_for(lambda: fake.calls["sendMessage"] >= updates, timeout=600)
+        return time.perf_counter() - started
+    finally:
+        bot.send_signal(signal.SIGINT)
+        try:
+            await asyncio.to_thread(bot.wait, 15)
+        except subprocess.TimeoutExpired:
+            bot.kill()
+        await fake.stop()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--updates", type=int, default=3000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--api-latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as users_dir:
+        with open(os.path.join(users_dir, "whitelist.json"), 'w', encoding='utf-8') as f:
+            json.dump({"whitelist": list(range(FIRST_USER, FIRST_USER + args.users)), "admin_ids": []}, f)
+
+        print(f"Обновлений: {args.updates}, пользователей: {args.users}, ядер: {os.cpu_count()}")
+        baseline = None
+        for workers in args.workers:
+            elapsed = await run(workers, args.updates, args.users, args.api_latency, users_dir)
+            rate = args.updates / elapsed
+            baseline = baseline or rate
+            print(f"  WORKERS={workers}: {elapsed:6.2f} с, {rate:8.0f} обн/с ({rate / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,46 @@
+"""
+Микробенчмарк отрисовки шага: сборка клавиатуры на каждую отправку (до)
+против готовой клавиатуры из кэша (после). В обоих случаях собирается
+и объект метода SendMessage, как это делает message.answer.
+
+Запуск: python -m benchmarks.bench_step_render [--rounds 200]
+"""
+import argparse
+import time
+
+from aiogram.methods import SendMessage
+
+from bot.keyboards.scenario_keyboards import build_step_keyboard, get_step_keyboard, warm_scenario_keyboards
+from bot.utils.scenario_registry import scenario_registry
+
+
+def run(rounds: int, get_keyboard) -> tuple[float, int]:
+    scenarios = scenario_registry.all()
+    steps = 0
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for scenario in scenarios:
+            for i, step in enumerate(scenario.steps):
+                SendMessage(chat_id=1, text=step.text, reply_markup=get_keyboard(scenario, i, step))
+                steps += 1
+    return (time.perf_counter() - started) / steps, steps
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    warm_scenario_keyboards(scenario_registry.all())
+
+    legacy, steps = run(args.rounds, lambda scenario, i, step: build_step_keyboard(step, i, scenario.version))
+    cached, _ = run(args.rounds, lambda scenario, i, step: get_step_keyboard(scenario, i))
+
+    print(f"Отрисовано шагов: {steps}")
+    print(f"  до (сборка клавиатуры):  {legacy * 1e6:8.2f} мкс/шаг")
+    print(f"  после (готовая):         {cached * 1e6:8.2f} мкс/шаг")
+    print(f"  ускорение:               {legacy / cached:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
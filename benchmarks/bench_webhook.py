@@ -0,0 +1,101 @@
+"""
+Пропускная способность webhook-режима на локальной имитации Telegram.
+
+Поднимает FakeTelegramServer и aiohttp-приложение бота, отправляет в webhook
+пачку обновлений (/menu от разных пользователей) и измеряет время ответа
+webhook и время до завершения всех обработчиков.
+
+Запуск: python -m benchmarks.bench_webhook [--updates 2000] [--concurrency 100]
+"""
+import argparse
+import asyncio
+import itertools
+import time
+
+from aiohttp import ClientSession, web
+
+from benchmarks.fake_telegram import FakeTelegramServer
+from bot.middlewares import exist_middleware
+from bot.middlewares.outbound_queue import outbound_queue
+from main import create_bot, create_dispatcher, create_webhook_app
+
+SECRET = "bench-secret"
+update_ids = itertools.count(1)
+
+
+def menu_update(user_id: int) -> dict:
+    return {
+        "update_id": next(update_ids),
+        "message": {
+            "message_id": 1,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "bench"},
+            "text": "/menu",
+        },
+    }
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--api-latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = FakeTelegramServer(latency=args.api_latency)
+    await fake.start()
+
+    # Пользователи бенчмарка получают доступ только в памяти процесса
+    users = range(10_000, 10_000 + args.updates)
+    exist_middleware.store.users.update(users)
+
+    # Имитация не ограничивает скорость, меряем сам бот, а не лимит Telegram
+    outbound_queue.set_rate(0)
+    bot = create_bot(token="42:bench", api_url=fake.url)
+    dp = create_dispatcher()
+    runner = web.AppRunner(create_webhook_app(bot, dp, secret=SECRET), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}/webhook"
+
+    acks = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+    async with ClientSession() as client:
+        async with client.post(url, json=menu_update(users[0]), headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"}) as response:
+            print(f"Запрос с неверным секретом: HTTP {response.status}")
+
+        async def send(user_id: int):
+            async with semaphore:
+                started = time.perf_counter()
+                async with client.post(url, json=menu_update(user_id),
+                                       headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}) as response:
+                    await response.read()
+                acks.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send(user_id) for user_id in users))
+        acked = time.perf_counter() - started
+        while fake.calls["sendMessage"] < args.updates:
+            await asyncio.sleep(0.01)
+        done = time.perf_counter() - started
+
+    print(f"Обновлений: {args.updates}, параллельно: {args.concurrency}")
+    print(f"  ответ webhook: p50 {percentile(acks, 0.5) * 1000:.2f} мс, p99 {percentile(acks, 0.99) * 1000:.2f} мс")
+    print(f"  все приняты за {acked:.2f} с, все обработаны за {done:.2f} с ({args.updates / done:.0f} обновлений/с)")
+    print(f"  вызовы Bot API: {dict(fake.calls)}")
+
+    await runner.cleanup()
+    await bot.session.close()
+    await fake.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+"""
+Бенчмарк проверки доступа в ExistMiddleware: стоимость одного апдейта
+до (чтение и разбор whitelist.json на каждый апдейт) и после (кэш в памяти).
+
+Запуск: python -m benchmarks.bench_whitelist [--users 10000] [--updates 20000]
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from aiogram.types import Update, Message, User, Chat
+
+from bot.middlewares.exist_middleware import ExistMiddleware
+
+
+class LegacyExistMiddleware(ExistMiddleware):
+    """Старое поведение: два чтения и разбора файла на каждый апдейт"""
+
+    def _load_whitelist(self) -> dict:
+        with open(self.whitelist_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def get_whitelist(self) -> set[int]:
+        return set(self._load_whitelist().get("whitelist", []))
+
+    def get_admin_ids(self) -> set[int]:
+        return set(self._load_whitelist().get("admin_ids", []))
+
+    async def __call__(self, handler, event, data):
+        user_id = await self._extract_user_id(event)
+        if user_id is None:
+            return await handler(event, data)
+        whitelist = self.get_whitelist()
+        admin_ids = self.get_admin_ids()
+        if user_id in whitelist or user_id in admin_ids:
+            return await handler(event, data)
+        await self._notify_no_access(event)
+
+
+def make_update(user_id: int) -> Update:
+    return Update(
+        update_id=1,
+        message=Message(
+            message_id=1,
+            date=datetime.now(),
+            chat=Chat(id=user_id, type="private"),
+            from_user=User(id=user_id, is_bot=False, first_name="bench"),
+            text="/menu",
+        ),
+    )
+
+
+async def measure(middleware: ExistMiddleware, event: Update, updates: int) -> float:
+    async def handler(_event, _data):
+        return None
+
+    started = time.perf_counter()
+    for _ in range(updates):
+        await middleware(handler, event, {})
+    return (time.perf_counter() - started) / updates
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--updates", type=int, default=20_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "whitelist.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"whitelist": list(range(1, args.users + 1)), "admin_ids": [0]}, f, indent=2)
+
+        event = make_update(args.users)
+
+        legacy = await measure(LegacyExistMiddleware(path), event, args.updates)
+        cached = await measure(ExistMiddleware(path), event, args.updates)
+
+    print(f"Пользователей в белом списке: {args.users}, апдейтов: {args.updates}")
+    print(f"  до (чтение файла):  {legacy * 1e6:10.2f} мкс/апдейт")
+    print(f"  после (кэш):        {cached * 1e6:10.2f} мкс/апдейт")
+    print(f"  ускорение:          {legacy / cached:10.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,139 @@
+"""
+Проверка расписания разделов (bot/utils/drip_scheduler.py) на подменных часах.
+
+Расписание: понедельник, среда, пятница в 10:00 (UTC+3), одно напоминание.
+Проверяются выдача в слот и напоминание в следующий слот, отмена напоминаний
+после начала раздела и продвижение по курсу только с назначенного раздела:
+раздел, пройденный раньше срока, повторно или после конца курса, расписание
+не меняет. Пользователь, заблокировавший бота, сохраняет место в курсе.
+
+Запуск: python -m benchmarks.check_drip (код 1 - проверка не прошла)
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from aiogram.exceptions import TelegramForbiddenError
+from aiogram.methods import SendMessage
+
+from bot.utils.drip_scheduler import DripScheduler
+
+TZ = timezone(timedelta(hours=3))
+COURSE = ["day_1", "day_2", "day_6"]
+# Понедельник, 9:00
+START = datetime(2026, 10, 19, 9, 0, tzinfo=TZ).timestamp()
+DAY = 24 * 3600
+HOUR = 3600
+
+
+class Clock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class RecordingBot:
+    """Вместо отправки запоминает сообщения: (пользователь, текст)"""
+
+    def __init__(self):
+        self.sent: list[tuple[int, str]] = []
+        self.blocked: set[int] = set()
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        if chat_id in self.blocked:
+            raise TelegramForbiddenError(SendMessage(chat_id=chat_id, text=text),
+                                         "Forbidden: bot was blocked by the user")
+        self.sent.append((chat_id, text))
+
+
+async def tick(scheduler: DripScheduler, bot: RecordingBot, clock: Clock, at: float) -> list[tuple[int, str]]:
+    """Переводит часы и выдает наступившие записи; возвращает отправленное"""
+    clock.now = at
+    before = len(bot.sent)
+    await scheduler.run_due(bot)
+    return bot.sent[before:]
+
+
+async def main() -> int:
+    clock = Clock(START)
+    scheduler = DripScheduler(os.path.join(tempfile.mkdtemp(prefix="check_drip_"), "drip.sqlite3"),
+                              course=lambda: COURSE, weekdays=(0, 2, 4), hour=10, utc_offset=3,
+                              max_reminders=1, clock=clock)
+    bot = RecordingBot()
+    problems = []
+
+    def expect(what: str, actual, expected):
+        if actual != expected:
+            problems.append(f"{what}: {actual!r}, ожидалось {expected!r}")
+
+    async def row(user_id: int):
+        return await scheduler._run(scheduler._get, user_id)
+
+    monday_10 = START + HOUR
+    wednesday_10 = monday_10 + 2 * DAY
+    friday_10 = monday_10 + 4 * DAY
+    next_monday_10 = monday_10 + 7 * DAY
+
+    # Слот и напоминание
+    await scheduler.enroll(1)
+    expect("до слота", await tick(scheduler, bot, clock, monday_10 - 60), [])
+    sent = await tick(scheduler, bot, clock, monday_10)
+    expect("в слот", [(user, text.startswith("📬")) for user, text in sent], [(1, True)])
+    sent = await tick(scheduler, bot, clock, wednesday_10)
+    expect("напоминание", [(user, text.startswith("⏰")) for user, text in sent], [(1, True)])
+    expect("после последнего напоминания", await tick(scheduler, bot, clock, friday_10), [])
+
+    # Начатый раздел не напоминается
+    clock.now = next_monday_10 - 3 * HOUR
+    await scheduler.enroll(2)
+    sent = await tick(scheduler, bot, clock, next_monday_10)
+    expect("слот второго пользователя", [user for user, _ in sent], [2])
+    await scheduler.scenario_started(2, "day_1")
+    expect("напоминание после начала раздела", await tick(scheduler, bot, clock, next_monday_10 + 2 * DAY), [])
+    expect("раздел после начала", (await row(2))[:2], ("day_1", None))
+
+    # Продвижение только с назначенного раздела
+    await scheduler.scenario_finished(2, "day_6")
+    expect("раздел пройден раньше срока", (await row(2))[0], "day_1")
+    await scheduler.scenario_finished(2, "day_1")
+    expect("назначенный раздел пройден", (await row(2))[0], "day_2")
+    await scheduler.scenario_finished(2, "day_1")
+    expect("раздел пройден повторно", (await row(2))[0], "day_2")
+    await scheduler.scenario_finished(2, "day_2")
+    await scheduler.scenario_finished(2, "day_6")
+    expect("курс пройден", await row(2), (None, None, 0))
+    await scheduler.scenario_finished(2, "day_1")
+    expect("раздел пройден после конца курса", await row(2), (None, None, 0))
+
+    # Незаписанный пользователь попадает на курс только с первого раздела
+    await scheduler.scenario_finished(3, "day_2")
+    expect("незаписанный пользователь, не первый раздел", await row(3), None)
+    await scheduler.scenario_finished(3, "day_1")
+    expect("незаписанный пользователь, первый раздел", (await row(3))[0], "day_2")
+
+    # Заблокировавший бота пользователь остается на своем разделе
+    clock.now = next_monday_10 + 5 * DAY
+    await scheduler.scenario_finished(4, "day_1")
+    bot.blocked.add(4)
+    sent = await tick(scheduler, bot, clock, next_monday_10 + 7 * DAY)
+    expect("слот заблокировавшего бота", [text for user, text in sent if user == 4], [])
+    expect("запись заблокировавшего бота", await row(4), ("day_2", None, 0))
+    bot.blocked.discard(4)
+    await scheduler.enroll(4)
+    expect("повторный /start после разблокировки", (await row(4))[0], "day_2")
+    await scheduler.scenario_finished(4, "day_2")
+    expect("прохождение после разблокировки", (await row(4))[0], "day_6")
+
+    await scheduler.close()
+    print("OK" if not problems else "ОШИБКА")
+    for problem in problems:
+        print(f"  {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
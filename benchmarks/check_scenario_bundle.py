@@ -0,0 +1,74 @@
+"""
+Проверка ленивой загрузки сборки сценариев (SCENARIO_BUNDLE_MMAP=1).
+
+Собирает сценарии из каталога (python -m bot.utils.scenario_compiler) во
+временный файл и запускает реестр в режиме mmap. При подготовке к запуску
+(create_dispatcher с подписчиками на перезагрузку, список картинок для
+сжатия и манифеста) ни один сценарий не должен разбираться; картинки должны
+совпадать с картинками сценариев из каталога. Первое обращение к сценарию
+разбирает только его.
+
+Запуск: python -m benchmarks.check_scenario_bundle (код 1 - проверка не прошла)
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+# До импорта бота: сценарии - из сборки в режиме mmap
+BUNDLE_PATH = os.path.join(tempfile.mkdtemp(prefix="check_scenario_bundle_"), "scenarios.bundle")
+os.environ["SCENARIO_BUNDLE"] = BUNDLE_PATH
+os.environ["SCENARIO_BUNDLE_MMAP"] = "1"
+os.environ["METRICS_ENABLED"] = "0"
+# Сборщик сам сценарии из сборки не читает: SCENARIO_BUNDLE ему не передаем
+subprocess.run([sys.executable, "-m", "bot.utils.scenario_compiler", "--output", BUNDLE_PATH],
+               check=True, stdout=subprocess.DEVNULL, env={**os.environ, "SCENARIO_BUNDLE": ""})
+
+import bot.utils.scenario_registry as registry_module
+from bot.keyboards.scenario_keyboards import get_step_keyboard
+from bot.utils.scenario_registry import ScenarioRegistry, scenario_photos, scenario_registry
+from main import create_dispatcher, referenced_photos
+
+decoded: list[str] = []
+decode_scenario = registry_module.decode_scenario
+
+
+def counting_decode(key: str, version: str, payload: list):
+    decoded.append(key)
+    return decode_scenario(key, version, payload)
+
+
+def main() -> int:
+    problems = []
+    registry_module.decode_scenario = counting_decode
+    scenario_registry.load()
+
+    create_dispatcher()
+    photos = referenced_photos()
+    if decoded:
+        problems.append(f"при запуске разобраны сценарии: {sorted(set(decoded))}")
+
+    directory = ScenarioRegistry(bundle_path="")
+    expected = {photo for scenario in directory.all() for photo in scenario_photos(scenario)}
+    if set(scenario_registry.referenced_photos()) != expected:
+        problems.append(f"картинки из индекса сборки {sorted(scenario_registry.referenced_photos())} "
+                        f"отличаются от картинок сценариев {sorted(expected)}")
+    if not expected <= set(photos):
+        problems.append(f"в список картинок для запуска не попали: {sorted(expected - set(photos))}")
+
+    key = scenario_registry.names()[0]
+    scenario = scenario_registry.get(key)
+    get_step_keyboard(scenario, 0)
+    if decoded != [key]:
+        problems.append(f"после обращения к '{key}' разобраны {decoded}, ожидался только он")
+    if scenario != directory.get(key):
+        problems.append(f"сценарий '{key}' из сборки отличается от сценария из каталога")
+
+    print("OK" if not problems else "ОШИБКА")
+    for problem in problems:
+        print(f"  {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
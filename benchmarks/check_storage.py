@@ -0,0 +1,146 @@
+"""
+Проверка FSM-хранилищ: RespStorage (bot/storage/redis_storage.py) на локальном
+RESP-сервере (bot/storage/resp_server.py) и SQLiteStorage (bot/storage/sqlite_storage.py).
+
+RespStorage:
+  * состояние и данные сохраняются и читаются обратно (в том числе кириллица
+    и вложенные значения), у записей выставлен ttl;
+  * сброс состояния и пустые данные удаляют ключи, а не хранят пустые записи;
+  * после перезапуска сервера клиент переподключается сам, а пока сервер
+    недоступен, команда завершается ошибкой соединения, а не зависает;
+  * команда, отмененная после отправки, но до ответа, не оставляет свой ответ
+    в соединении: следующий вызов читает данные своего пользователя.
+SQLiteStorage:
+  * состояние и данные читаются из буфера и после сброса в базу;
+  * истекшая, но еще не удаленная сессия не оживает, когда пользователю
+    записывают только состояние (или только данные).
+
+Запуск: python -m benchmarks.check_storage (код 1 - проверка не прошла)
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+from aiogram.fsm.storage.base import StorageKey
+
+from bot.states.user_state import UserState
+from bot.storage.redis_storage import RespStorage
+from bot.storage.resp_server import RespServer
+from bot.storage.sqlite_storage import SQLiteStorage
+
+TTL = 3600
+DATA = {"scenario_key": "day_2", "current_step": 4, "answers": {"1": "первый ответ"}}
+
+
+def key(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=42, chat_id=user_id, user_id=user_id)
+
+
+class Expectations:
+    def __init__(self):
+        self.problems: list[str] = []
+
+    def __call__(self, what: str, actual, expected):
+        if actual != expected:
+            self.problems.append(f"{what}: {actual!r}, ожидалось {expected!r}")
+
+
+async def check_resp_storage() -> list[str]:
+    server = RespServer()
+    await server.start()
+    storage = RespStorage.from_url(server.url, ttl=TTL)
+    expect = Expectations()
+    try:
+        # Запись и чтение
+        await storage.set_state(key(1), UserState.waiting_text_input)
+        await storage.set_data(key(1), DATA)
+        expect("состояние", await storage.get_state(key(1)), UserState.waiting_text_input.state)
+        expect("данные", await storage.get_data(key(1)), DATA)
+        expect("ttl записей", sorted(0 < server.execute(b"TTL", [k]) <= TTL for k in server.data), [True, True])
+        expect("сессия без записей", (await storage.get_state(key(2)), await storage.get_data(key(2))), (None, {}))
+
+        # Пустая сессия не хранится
+        await storage.set_state(key(1), None)
+        await storage.set_data(key(1), {})
+        expect("ключей после очистки сессии", server.execute(b"DBSIZE", []), 0)
+        expect("состояние после очистки", await storage.get_state(key(1)), None)
+        expect("данные после очистки", await storage.get_data(key(1)), {})
+
+        # Перезапуск сервера: данные в памяти сервера сохраняются, соединение клиента рвется
+        await storage.set_data(key(1), DATA)
+        await server.stop()
+        try:
+            await asyncio.wait_for(storage.get_data(key(1)), 5)
+            expect.problems.append("сервер остановлен, а команда выполнилась")
+        except (ConnectionError, OSError):
+            pass
+        except asyncio.TimeoutError:
+            expect.problems.append("команда при остановленном сервере зависла")
+        await server.start()
+        expect("данные после перезапуска сервера", await storage.get_data(key(1)), DATA)
+        await storage.set_state(key(1), UserState.waiting_survey)
+        expect("состояние после перезапуска сервера", await storage.get_state(key(1)), UserState.waiting_survey.state)
+
+        # Отмена посреди обмена: команда отправлена, ответ еще не прочитан
+        other = {"scenario_key": "day_6", "current_step": 1}
+        await storage.set_data(key(2), other)
+        pending = asyncio.create_task(storage.get_data(key(1)))
+        await asyncio.sleep(0)
+        pending.cancel()
+        try:
+            await pending
+        except asyncio.CancelledError:
+            pass
+        expect("чтение отменено до ответа", pending.cancelled(), True)
+        expect("данные после отмененного чтения чужой сессии", await storage.get_data(key(2)), other)
+        expect("данные отмененной сессии", await storage.get_data(key(1)), DATA)
+    finally:
+        await storage.close()
+        await server.stop()
+    return expect.problems
+
+
+async def check_sqlite_storage() -> list[str]:
+    ttl = 0.2
+    # Очистка истекших записей не наступает за время проверки: они остаются в базе
+    storage = SQLiteStorage(os.path.join(tempfile.mkdtemp(prefix="check_storage_"), "fsm.sqlite3"),
+                            ttl=ttl, purge_interval=3600)
+    expect = Expectations()
+    try:
+        # Из буфера и из базы
+        await storage.set_state(key(1), UserState.waiting_text_input)
+        await storage.set_data(key(1), DATA)
+        expect("данные из буфера", await storage.get_data(key(1)), DATA)
+        await storage.flush()
+        expect("состояние из базы", await storage.get_state(key(1)), UserState.waiting_text_input.state)
+        expect("данные из базы", await storage.get_data(key(1)), DATA)
+
+        # Истекшая сессия: записывается только одно поле, второе не должно вернуться
+        await storage.set_state(key(2), UserState.waiting_survey)
+        await storage.flush()
+        await asyncio.sleep(ttl * 1.5)
+        await storage.set_state(key(1), UserState.in_scenario)
+        await storage.set_data(key(2), {"scenario_key": "day_6"})
+        await storage.flush()
+        expect("данные истекшей сессии после записи состояния", await storage.get_data(key(1)), {})
+        expect("состояние после записи в истекшую сессию", await storage.get_state(key(1)), UserState.in_scenario.state)
+        expect("состояние истекшей сессии после записи данных", await storage.get_state(key(2)), None)
+    finally:
+        await storage.close()
+    return expect.problems
+
+
+async def main() -> int:
+    problems = []
+    for check in (check_resp_storage, check_sqlite_storage):
+        found = await check()
+        print(f"{check.__name__}: {'OK' if not found else 'ОШИБКА'}")
+        for problem in found:
+            print(f"  {problem}")
+        problems.extend(found)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,185 @@
+"""
+Проверка очередности обновлений пользователя на хранилище, чтение которого
+уступает управление (FSM_STORAGE=redis поверх bot/storage/resp_server.py).
+
+Пользователь на шаге с текстовым ответом (day_2, шаг 4) быстро отправляет два
+сообщения. Второе должно обрабатываться уже в состоянии следующего шага
+(опрос): ответом на текстовый шаг записывается только первое, шаг 5
+отправляется один раз, шаг 6 не отправляется. Так же проверяется двойное
+нажатие "Дальше" на теории.
+
+Запуск: python -m benchmarks.check_user_order (код 1 - проверка не прошла)
+"""
+import asyncio
+import itertools
+import os
+import socket
+import sys
+import tempfile
+from datetime import datetime
+
+# До импорта бота: хранилище FSM - локальный RESP-сервер, данные - во временном каталоге
+DATA_DIR = tempfile.mkdtemp(prefix="check_user_order_")
+with socket.socket() as probe:
+    probe.bind(("127.0.0.1", 0))
+    REDIS_PORT = probe.getsockname()[1]
+os.environ["FSM_STORAGE"] = "redis"
+os.environ["FSM_REDIS_URL"] = f"redis://127.0.0.1:{REDIS_PORT}/0"
+os.environ["METRICS_ENABLED"] = "0"
+for name, file_name in (("ANSWERS_PATH", "answers.sqlite3"), ("ANALYTICS_PATH", "analytics.sqlite3"),
+                        ("DRIP_PATH", "drip.sqlite3"), ("BROADCAST_STATE_FILE", "broadcast.json"),
+                        ("USERS_DIR", "users")):
+    os.environ.setdefault(name, os.path.join(DATA_DIR, file_name))
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Update, Message, CallbackQuery, User, Chat
+
+from bot.handlers.scenario_handler import start_scenario
+from bot.keyboards.scenario_keyboards import get_step_keyboard
+from bot.middlewares import exist_middleware
+from bot.states.user_state import UserState
+from bot.storage.resp_server import RespServer
+from bot.utils.answer_recorder import answer_recorder
+from bot.utils.scenario_registry import scenario_registry
+from main import create_dispatcher
+
+USER_ID = 4242
+_ids = itertools.count(1000)
+
+
+class RecordingSession(BaseSession):
+    """Сессия бота без сети: запоминает запросы и отвечает на них с задержкой"""
+
+    def __init__(self, latency: float = 0.02):
+        super().__init__()
+        self.latency = latency
+        self.requests = []
+
+    async def make_request(self, bot, method, timeout=None):
+        await asyncio.sleep(self.latency)
+        self.requests.append(method)
+        if method.__api_method__ in ("sendMessage", "sendPhoto"):
+            return Message(message_id=next(_ids), date=datetime.now(),
+                           chat=Chat(id=method.chat_id, type="private"),
+                           text=getattr(method, "text", None), caption=getattr(method, "caption", None))
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self):
+        pass
+
+    def sent_texts(self) -> list[str]:
+        return [getattr(method, "text", None) or getattr(method, "caption", None) or ""
+                for method in self.requests if method.__api_method__ in ("sendMessage", "sendPhoto")]
+
+
+def user() -> User:
+    return User(id=USER_ID, is_bot=False, first_name="check")
+
+
+def chat() -> Chat:
+    return Chat(id=USER_ID, type="private")
+
+
+def text_update(text: str) -> Update:
+    return Update(update_id=next(_ids), message=Message(
+        message_id=next(_ids), date=datetime.now(), chat=chat(), from_user=user(), text=text))
+
+
+def callback_update(data: str, message: Message) -> Update:
+    return Update(update_id=next(_ids), callback_query=CallbackQuery(
+        id=str(next(_ids)), from_user=user(), chat_instance="check", data=data, message=message))
+
+
+async def enter_step(dp, bot, scenario_key: str, step: int, state):
+    context = dp.fsm.get_context(bot, chat_id=USER_ID, user_id=USER_ID)
+    await start_scenario(context, scenario_registry.get(scenario_key))
+    await context.update_data(current_step=step)
+    await context.set_state(state)
+    return context
+
+
+async def check_text_input(dp, bot, session) -> list[str]:
+    scenario = scenario_registry.get("day_2")
+    context = await enter_step(dp, bot, "day_2", 4, UserState.waiting_text_input)
+    session.requests.clear()
+
+    # Ответы запоминаются по пути в очередь записи
+    recorded = []
+    record = answer_recorder.record
+
+    async def remember(user_id: int, scenario_key: str, step: int, kind: str, answer: str):
+        recorded.append((step, answer))
+        await record(user_id, scenario_key, step, kind, answer)
+
+    answer_recorder.record = remember
+    try:
+        await asyncio.gather(dp.feed_update(bot, text_update("первый ответ")),
+                             dp.feed_update(bot, text_update("второй ответ")))
+    finally:
+        answer_recorder.record = record
+
+    problems = []
+    sent = session.sent_texts()
+    if sent.count(scenario.steps[5].text) != 1:
+        problems.append(f"шаг 5 отправлен {sent.count(scenario.steps[5].text)} раз вместо 1")
+    if scenario.steps[6].prompt in sent:
+        problems.append("шаг 6 отправлен, хотя на шаг 5 еще не ответили")
+    data = await context.get_data()
+    if data.get("current_step") != 5:
+        problems.append(f"курсор на шаге {data.get('current_step')}, ожидался 5")
+    if await context.get_state() != UserState.waiting_survey.state:
+        problems.append(f"состояние {await context.get_state()}, ожидалось {UserState.waiting_survey.state}")
+    if recorded != [(4, "первый ответ")]:
+        problems.append(f"записаны ответы {recorded}, ожидался только (4, 'первый ответ')")
+    return problems
+
+
+async def check_double_next(dp, bot, session) -> list[str]:
+    scenario = scenario_registry.get("day_2")
+    await enter_step(dp, bot, "day_2", 0, UserState.in_scenario)
+    keyboard = get_step_keyboard(scenario, 0)
+    message = Message(message_id=next(_ids), date=datetime.now(), chat=chat(), text=scenario.steps[0].text,
+                      reply_markup=keyboard)
+    data = keyboard.inline_keyboard[0][0].callback_data
+    session.requests.clear()
+
+    # Второе нажатие приходит, когда первое уже обработано
+    await asyncio.gather(dp.feed_update(bot, callback_update(data, message)),
+                         dp.feed_update(bot, callback_update(data, message)))
+    await dp.feed_update(bot, callback_update(data, message))
+
+    sent = session.sent_texts()
+    if sent.count(scenario.steps[1].text) != 1:
+        return [f"после трех нажатий 'Дальше' шаг 1 отправлен {sent.count(scenario.steps[1].text)} раз вместо 1"]
+    return []
+
+
+async def main() -> int:
+    server = RespServer(port=REDIS_PORT)
+    await server.start()
+    exist_middleware.store.users.add(USER_ID)
+    session = RecordingSession()
+    bot = Bot(token="42:check", session=session)
+    dp = create_dispatcher()
+
+    problems = []
+    try:
+        for check in (check_text_input, check_double_next):
+            found = await check(dp, bot, session)
+            print(f"{check.__name__}: {'OK' if not found else 'ОШИБКА'}")
+            for problem in found:
+                print(f"  {problem}")
+            problems.extend(found)
+    finally:
+        await dp.fsm.close()
+        await answer_recorder.close()
+        await server.stop()
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
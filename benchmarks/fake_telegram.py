@@ -0,0 +1,168 @@
+"""
+Локальная имитация Telegram Bot API для нагрузочных тестов без выхода в сеть.
+
+Сервер принимает запросы вида /bot<token>/<method>, отвечает правдоподобными
+объектами (Message с reply_markup, file_id для фото и т.д.), считает вызовы и
+умеет отдавать обновления через getUpdates. Можно включить выдачу 429
+(Too Many Requests) с заданной вероятностью, чтобы проверять обработку flood-контроля.
+
+Бот подключается к нему через TELEGRAM_API_URL или напрямую:
+    Bot(token, session=AiohttpSession(api=TelegramAPIServer.from_base(server.url)))
+"""
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter, defaultdict
+from typing import Callable
+
+from aiohttp import web
+
+BOT_USER = {"id": 1000000001, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+
+
+class FakeTelegramServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 retry_after_rate: float = 0.0, retry_after: int = 1,
+                 blocked_chats: set[int] | None = None):
+        self.host = host
+        self.port = port
+        # Искусственная задержка ответа, как у настоящего API
+        self.latency = latency
+        # Доля запросов, на которые отвечаем 429, и значение retry_after в ответе
+        self.retry_after_rate = retry_after_rate
+        self.retry_after = retry_after
+        # Чаты, где пользователь заблокировал бота (ответ 403)
+        self.blocked_chats = blocked_chats or set()
+
+        self.calls: Counter = Counter()
+        self.rejected: Counter = Counter()
+        self.messages: dict[int, list[dict]] = defaultdict(list)
+        self.listeners: list[Callable[[str, dict, dict], None]] = []
+
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        self._updates: asyncio.Queue = asyncio.Queue()
+        self._runner: web.AppRunner | None = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def push_update(self, update: dict):
+        """Кладет обновление в очередь, которую бот заберет через getUpdates"""
+        self._updates.put_nowait(update)
+
+    @staticmethod
+    async def _read_params(request: web.Request) -> dict:
+        if request.content_type == "application/json":
+            return await request.json()
+        form = await request.post()
+        params = {}
+        for key, value in form.items():
+            if isinstance(value, str):
+                try:
+                    params[key] = json.loads(value) if value[:1] in "{[" else value
+                except json.JSONDecodeError:
+                    params[key] = value
+            else:
+                params[key] = "<file>"
+        return params
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await self._read_params(request)
+        self.calls[method] += 1
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if self.retry_after_rate and method != "getUpdates" and random.random() < self.retry_after_rate:
+            self.rejected[method] += 1
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+
+        chat_id = params.get("chat_id")
+        if chat_id is not None and int(chat_id) in self.blocked_chats:
+            return web.json_response({
+                "ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user",
+            }, status=403)
+
+        result = await self._result(method, params)
+        for listener in self.listeners:
+            listener(method, params, result)
+        return web.json_response({"ok": True, "result": result})
+
+    def _message(self, params: dict, **extra) -> dict:
+        chat_id = int(params["chat_id"])
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            **extra,
+        }
+        if isinstance(params.get("reply_markup"), dict) and "inline_keyboard" in params["reply_markup"]:
+            message["reply_markup"] = params["reply_markup"]
+        self.messages[chat_id].append(message)
+        return message
+
+    async def _result(self, method: str, params: dict):
+        if method == "getMe":
+            return BOT_USER
+        if method == "getUpdates":
+            updates = []
+            try:
+                timeout = float(params.get("timeout", 0) or 0)
+                updates.append(await asyncio.wait_for(self._updates.get(), timeout=max(timeout, 0.01)))
+            except asyncio.TimeoutError:
+                return []
+            limit = int(params.get("limit", 100) or 100)
+            while len(updates) < limit and not self._updates.empty():
+                updates.append(self._updates.get_nowait())
+            return updates
+        if method == "sendMessage":
+            return self._message(params, text=params.get("text", ""))
+        if method == "sendPhoto":
+            file_id = params["photo"] if params.get("photo") != "<file>" else f"photo{next(self._file_ids)}"
+            return self._message(params, caption=params.get("caption"), photo=[{
+                "file_id": file_id, "file_unique_id": file_id, "width": 1280, "height": 720,
+            }])
+        if method == "copyMessage":
+            return {"message_id": self._message(params)["message_id"]}
+        if method in ("editMessageReplyMarkup", "editMessageText", "editMessageMedia"):
+            message = {
+                "message_id": int(params.get("message_id", 0)),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "from": BOT_USER,
+            }
+            media = params.get("media")
+            if isinstance(media, dict):
+                message["caption"] = media.get("caption")
+                message["photo"] = [{"file_id": media.get("media"), "file_unique_id": media.get("media"),
+                                     "width": 1280, "height": 720}]
+            else:
+                message["text"] = params.get("text", "")
+            if isinstance(params.get("reply_markup"), dict) and "inline_keyboard" in params["reply_markup"]:
+                message["reply_markup"] = params["reply_markup"]
+            return message
+        # answerCallbackQuery, deleteMessage, setWebhook, deleteWebhook и прочие
+        return True
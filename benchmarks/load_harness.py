@@ -0,0 +1,307 @@
+"""
+Нагрузочный стенд: бот в режиме long polling против локальной имитации
+Telegram и тысячи синтетических пользователей.
+
+Каждый пользователь открывает /menu, выбирает раздел и проходит его как
+человек: нажимает кнопки шагов из reply_markup присланных сообщений,
+на неверный ответ выбирает другой вариант, на шаги с текстовым ответом пишет текст. Обновления кладутся в
+getUpdates имитации, ответы бота приходят пользователю через слушателя
+имитации.
+
+Шаг - это одно действие пользователя. Шаг завершен, когда бот прислал
+следующее сообщение, на которое можно ответить (с кнопками или с просьбой
+написать текст), или всплывающее "неправильно", и ответил на нажатие кнопки.
+Вызовы API между двумя действиями пользователя относятся к шагу.
+"""
+import asyncio
+import itertools
+import random
+import resource
+import time
+import tracemalloc
+from collections import Counter
+from dataclasses import dataclass, field
+
+from aiogram import Bot, Dispatcher
+
+from benchmarks.fake_telegram import FakeTelegramServer
+
+# Ответ бота на действие - новое сообщение или, при STEP_TRANSITION=edit, измененное с новыми кнопками
+MESSAGE_METHODS = frozenset({"sendMessage", "sendPhoto", "editMessageText", "editMessageMedia"})
+# Файлы, память которых относится к боту при замере через tracemalloc
+TRACED_PACKAGES = ("/bot/", "/aiogram/")
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+@dataclass
+class LoadReport:
+    users: int
+    finished: int = 0
+    stuck: int = 0
+    updates: int = 0
+    elapsed: float = 0.0
+    step_latencies: list[float] = field(default_factory=list)
+    step_calls: list[int] = field(default_factory=list)
+    calls: Counter = field(default_factory=Counter)
+    rss_growth: int = 0
+    traced_per_user: float | None = None
+
+    @property
+    def updates_per_second(self) -> float:
+        return self.updates / self.elapsed if self.elapsed else 0.0
+
+    def format(self) -> str:
+        steps = len(self.step_latencies)
+        lines = [
+            f"Пользователей: {self.users}, прошли раздел: {self.finished}, застряли: {self.stuck}",
+            f"Обновлений: {self.updates} за {self.elapsed:.1f} с ({self.updates_per_second:.0f} обновлений/с)",
+            f"Шагов: {steps}, задержка шага: p50 {percentile(self.step_latencies, 0.5) * 1000:.1f} мс, "
+            f"p95 {percentile(self.step_latencies, 0.95) * 1000:.1f} мс, "
+            f"p99 {percentile(self.step_latencies, 0.99) * 1000:.1f} мс",
+            f"Вызовов API на шаг: {sum(self.step_calls) / steps if steps else 0:.2f} "
+            f"({', '.join(f'{method} {count / steps:.2f}' for method, count in self.calls.most_common()) if steps else '-'})",
+            f"Память: рост RSS {self.rss_growth / self.users / 1024:.1f} КБ на пользователя",
+        ]
+        if self.traced_per_user is not None:
+            lines[-1] += f", данные бота и aiogram {self.traced_per_user / 1024:.1f} КБ на активного пользователя"
+        return "\n".join(lines)
+
+
+class SyntheticUser:
+    """
+    Пользователь, проходящий один раздел
+
+    Args:
+        user_id: id пользователя (он же id чата)
+        scenario: Ключ раздела
+        push_update: Функция, отправляющая обновление боту
+        rng: Генератор случайных чисел для выбора вариантов
+        step_timeout: Сколько ждать ответа бота на действие
+    """
+
+    def __init__(self, user_id: int, scenario: str, push_update, rng: random.Random, step_timeout: float = 30.0):
+        self.user_id = user_id
+        self.scenario = scenario
+        self.push_update = push_update
+        self.rng = rng
+        self.step_timeout = step_timeout
+
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.latencies: list[float] = []
+        self.step_calls: list[int] = []
+        self.calls: Counter = Counter()
+        self.finished = False
+        self._callback_ids = itertools.count(1)
+        self._message_ids = itertools.count(1_000_000)
+        self._step_calls = Counter()
+
+    @property
+    def _from(self) -> dict:
+        return {"id": self.user_id, "is_bot": False, "first_name": "load"}
+
+    def _send_text(self, text: str) -> None:
+        self.push_update({"message": {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": self.user_id, "type": "private"},
+            "from": self._from,
+            "text": text,
+        }})
+
+    def _press(self, message: dict, data: str) -> str:
+        callback_id = f"{self.user_id}:{next(self._callback_ids)}"
+        self.push_update({"callback_query": {
+            "id": callback_id,
+            "from": self._from,
+            "chat_instance": str(self.user_id),
+            "message": message,
+            "data": data,
+        }})
+        return callback_id
+
+    async def _wait_reply(self, callback_id: str | None) -> tuple[str, dict] | None:
+        """
+        Ждет ответа бота на действие
+
+        Returns:
+            tuple | None: ("buttons", сообщение), ("text", сообщение) или ("alert", {}); None - бот не ответил
+        """
+        reply = None
+        answered = callback_id is None
+        deadline = time.monotonic() + self.step_timeout
+        while reply is None or not answered:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                return None
+            try:
+                method, params, result = await asyncio.wait_for(self.inbox.get(), timeout)
+            except asyncio.TimeoutError:
+                return None
+            self._step_calls[method] += 1
+
+            if method == "answerCallbackQuery":
+                if params.get("callback_query_id") == callback_id:
+                    answered = True
+                    if str(params.get("show_alert")).lower() == "true" and reply is None:
+                        reply = ("alert", {})
+                continue
+            if method not in MESSAGE_METHODS:
+                continue
+            markup = params.get("reply_markup")
+            if isinstance(markup, dict) and markup.get("inline_keyboard"):
+                reply = ("buttons", result)
+            elif isinstance(markup, dict) and markup.get("remove_keyboard"):
+                reply = ("text", result)
+        return reply
+
+    async def _act(self, action) -> tuple[str, dict] | None:
+        """Выполняет действие и замеряет время до ответа бота"""
+        self._finish_step()
+        started = time.perf_counter()
+        reply = await self._wait_reply(action())
+        if reply is not None:
+            self.latencies.append(time.perf_counter() - started)
+        return reply
+
+    def _finish_step(self):
+        # Вызовы, пришедшие после ответа (например, запоздалый answerCallbackQuery), - тоже часть шага
+        while not self.inbox.empty():
+            method, _, _ = self.inbox.get_nowait()
+            self._step_calls[method] += 1
+        if self._step_calls:
+            self.step_calls.append(sum(self._step_calls.values()))
+            self.calls.update(self._step_calls)
+            self._step_calls = Counter()
+
+    async def run(self, think_time: float = 0.0):
+        reply = await self._act(lambda: self._send_text("/menu"))
+        while reply is not None:
+            kind, message = reply
+            if kind == "text":
+                reply = await self._act(lambda: self._send_text("Мой ответ"))
+                continue
+
+            buttons = [button["callback_data"] for row in message["reply_markup"]["inline_keyboard"] for button in row]
+            if buttons == ["go_to_menu"] and message.get("text") != "Меню:":
+                # Раздел пройден
+                self.finished = True
+                break
+            if message.get("text") == "Меню:":
+                candidates = [f"start_scenario_{self.scenario}"]
+            else:
+                candidates = [data for data in buttons if data != "go_to_menu"]
+
+            while candidates:
+                if think_time:
+                    await asyncio.sleep(self.rng.expovariate(1 / think_time))
+                data = candidates.pop(self.rng.randrange(len(candidates)))
+                reply = await self._act(lambda: self._press(message, data))
+                if reply is None or reply[0] != "alert":
+                    break
+                # Неверный ответ: выбираем другой вариант на том же сообщении
+            else:
+                reply = None
+        await asyncio.sleep(0.05)
+        self._finish_step()
+
+
+async def run_load(bot: Bot, dp: Dispatcher, fake: FakeTelegramServer, scenarios: list[str], users: int,
+                   first_user: int = 10_000, ramp: float = 0.0, think_time: float = 0.0,
+                   step_timeout: float = 30.0, trace_memory: bool = False, seed: int = 1) -> LoadReport:
+    """
+    Запускает бота на polling и прогоняет через него синтетических пользователей
+
+    Args:
+        bot: Бот, направленный на fake
+        dp: Диспетчер бота
+        fake: Запущенная имитация Telegram
+        scenarios: Ключи разделов; пользователи распределяются по ним по кругу
+        users: Сколько пользователей
+        first_user: id первого пользователя (доступ в белый список выдает вызывающий)
+        ramp: За сколько секунд подключаются все пользователи
+        think_time: Средняя пауза пользователя перед нажатием кнопки
+        step_timeout: Сколько пользователь ждет ответа, прежде чем считается застрявшим
+        trace_memory: Замерять память данных бота через tracemalloc (заметно замедляет работу)
+        seed: Зерно выбора вариантов
+    """
+    update_ids = itertools.count(1)
+    report = LoadReport(users=users)
+
+    def push_update(update: dict):
+        update["update_id"] = next(update_ids)
+        report.updates += 1
+        fake.push_update(update)
+
+    rng = random.Random(seed)
+    population = {
+        user_id: SyntheticUser(user_id, scenarios[i % len(scenarios)], push_update,
+                               random.Random(rng.random()), step_timeout)
+        for i, user_id in enumerate(range(first_user, first_user + users))
+    }
+
+    def route(method: str, params: dict, result):
+        if method == "answerCallbackQuery":
+            user_id = int(str(params.get("callback_query_id", "0")).split(":")[0])
+        else:
+            user_id = int(params.get("chat_id", 0) or 0)
+        user = population.get(user_id)
+        if user is not None:
+            user.inbox.put_nowait((method, params, result))
+
+    fake.listeners.append(route)
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, close_bot_session=False,
+                                                   allowed_updates=dp.resolve_used_update_types()))
+
+    active = 0
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    if trace_memory:
+        tracemalloc.start()
+    traced_peak = 0.0
+    sampling = True
+
+    async def sample_memory():
+        nonlocal traced_peak
+        while sampling:
+            await asyncio.sleep(1.0)
+            if trace_memory and active:
+                snapshot = tracemalloc.take_snapshot().filter_traces(
+                    [tracemalloc.Filter(True, f"*{package}*") for package in TRACED_PACKAGES])
+                traced_peak = max(traced_peak, sum(stat.size for stat in snapshot.statistics("filename")) / active)
+
+    async def run_user(index: int, user: SyntheticUser):
+        nonlocal active
+        if ramp:
+            await asyncio.sleep(ramp * index / users)
+        active += 1
+        try:
+            await user.run(think_time)
+        finally:
+            active -= 1
+
+    sampler = asyncio.create_task(sample_memory())
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(run_user(i, user) for i, user in enumerate(population.values())))
+        report.elapsed = time.perf_counter() - started
+    finally:
+        sampling = False
+        await sampler
+        if trace_memory:
+            tracemalloc.stop()
+        fake.listeners.remove(route)
+        await dp.stop_polling()
+        await polling
+
+    report.rss_growth = max(0, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 - rss_before)
+    report.traced_per_user = traced_peak if trace_memory else None
+    for user in population.values():
+        report.finished += user.finished
+        report.stuck += not user.finished
+        report.step_latencies.extend(user.latencies)
+        report.step_calls.extend(user.step_calls)
+        report.calls.update(user.calls)
+    return report
@@ -0,0 +1,404 @@
+"""
+Микробенчмарки кода, который выполняется на каждый апдейт.
+
+Покрывает ExistMiddleware.__call__ (белый список до 1 млн id),
+UserOrderMiddleware.__call__ (очередь обновлений пользователя),
+load_scenario, validate_scenario_structure и загрузку из сборки
+сценариев (сценарии до 1000 шагов),
+все сборщики клавиатур из bot/keyboards, меню разделов,
+natural_sort_key, выбор обработчика по callback_data (поиск в таблице
+нажатий и полный путь через роутеры aiogram) и разбор callback_data.
+
+Каждый замер повторяется --repeat раз по --min-time секунд; в результат
+идут медиана и минимум времени одной операции. Результаты сохраняются в
+JSON, а с --compare сравниваются с прошлым прогоном: замедление больше
+--threshold считается регрессией, и скрипт завершается с кодом 1.
+
+Запуск: python -m benchmarks.microbench [--output microbench.json] [--compare old.json]
+        [--threshold 0.15] [--filter keyboards] [--quick]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable
+
+import aiogram
+from aiogram.types import Update, Message, CallbackQuery, User, Chat
+
+from bot.config import ROOT_DIR, SCENARIOS_DIR
+from bot.handlers.admin_handler import router as admin_router
+from bot.handlers.callback_handler import router as callback_router, callback_table
+from bot.handlers.scenario_handler import router as scenario_router
+from bot.handlers.start_handler import router as start_router
+from bot.keyboards import admin_keyboards, menu_keyboards, scenario_keyboards
+from bot.middlewares.exist_middleware import ExistMiddleware
+from bot.middlewares.user_order import UserOrderMiddleware
+from bot.utils import scenario_loader
+from bot.utils.callback_codec import decode
+from bot.utils.scenario_bundle import ScenarioBundle, write_bundle
+from bot.utils.scenario_registry import (
+    scenario_registry, bundle_entry, compile_scenario, decode_scenario, Theory, Practice, Branch, Survey
+)
+from bot.utils.sorter import natural_sort_key
+
+SCENARIO_SIZES = (10, 100, 1000)
+WHITELIST_SIZES = (1_000, 100_000, 1_000_000)
+QUICK_SCENARIO_SIZES = (10, 100)
+QUICK_WHITELIST_SIZES = (1_000, 100_000)
+
+# Порядок роутеров как в create_dispatcher
+ROUTERS = (callback_router, start_router, scenario_router, admin_router)
+
+
+@dataclass
+class Case:
+    group: str
+    name: str
+    func: Callable[[], Any]
+    params: dict = field(default_factory=dict)
+    is_async: bool = False
+
+    @property
+    def id(self) -> str:
+        suffix = ",".join(f"{key}={value}" for key, value in self.params.items())
+        return f"{self.group}.{self.name}" + (f"[{suffix}]" if suffix else "")
+
+
+# --- данные ---
+
+def real_steps() -> list[dict]:
+    """Шаги всех сценариев из bot/scenarios подряд"""
+    steps = []
+    for file_name in sorted(os.listdir(SCENARIOS_DIR)):
+        if file_name.endswith(".json"):
+            with open(os.path.join(SCENARIOS_DIR, file_name), "r", encoding="utf-8") as f:
+                steps.extend(json.load(f)["steps"])
+    return steps
+
+
+def synthetic_scenario(size: int) -> dict:
+    """Сценарий из size шагов: настоящие шаги по кругу"""
+    steps = real_steps()
+    return {"name": f"Бенчмарк {size}", "description": "", "steps": list(itertools.islice(itertools.cycle(steps), size))}
+
+
+def sample_practice(steps: list[tuple], survey: tuple) -> tuple:
+    """Практика с наибольшим числом кнопок; если в сценариях ее нет - из вариантов опроса"""
+    practices = [item for item in steps if isinstance(item[0], Practice)]
+    if practices:
+        return max(practices, key=lambda item: len(item[0].buttons))
+    step, index, scenario = survey
+    return Practice(text=step.text, photo=None, buttons=step.buttons, correct_answer=step.buttons[0]), index, scenario
+
+
+def user_of(user_id: int) -> User:
+    return User(id=user_id, is_bot=False, first_name="bench")
+
+
+def message_update(user_id: int) -> Update:
+    return Update(update_id=1, message=Message(
+        message_id=1, date=datetime.now(), chat=Chat(id=user_id, type="private"),
+        from_user=user_of(user_id), text="/menu"))
+
+
+def callback_update(user_id: int, data: str) -> Update:
+    return Update(update_id=1, callback_query=CallbackQuery(
+        id="1", from_user=user_of(user_id), chat_instance="bench", data=data))
+
+
+def real_callback_data() -> dict[str, str]:
+    """Пример настоящей callback_data для каждого обработчика нажатий (самый длинный)"""
+    samples = ["start_scenario_day_14", "admin_users_next_1000500", "go_to_menu", "broadcast_confirm"]
+    for scenario in scenario_registry.all():
+        for i in range(len(scenario.steps)):
+            keyboard = scenario_keyboards.get_step_keyboard(scenario, i)
+            for row in getattr(keyboard, "inline_keyboard", ()):
+                samples.extend(button.callback_data for button in row)
+        samples.extend(button.callback_data for row in
+                       scenario_keyboards.get_continue_keyboard(scenario.version, 5).inline_keyboard for button in row)
+    # Кнопка, отправленная до перехода на компактный формат
+    samples.append("survey_3_Очень длинная подпись варианта ответа в опросе")
+
+    examples: dict[str, str] = {}
+    for data in samples:
+        route, _ = callback_table.resolve(data)
+        if len(data) > len(examples.get(route.name, "")):
+            examples[route.name] = data
+    return examples
+
+
+# Разбор callback_data в обработчиках, которые не используют компактный формат шагов
+CALLBACK_PARSERS: dict[str, Callable[[str], Any]] = {
+    "handle_scenario_selection": lambda data: data.replace("start_scenario_", ""),
+    "admin_users_page_callback": lambda data: (lambda parts: (parts[2], int(parts[3])))(data.split("_")),
+}
+
+
+async def route_callback(callback: CallbackQuery) -> Any:
+    """
+    Ищет обработчик так же, как aiogram: роутеры по порядку, фильтры обработчиков по очереди.
+    Нажатия на кнопки находит первый же фильтр - таблица из bot/handlers/callback_handler.py
+    """
+    for router in ROUTERS:
+        for handler in router.callback_query.handlers:
+            matched, _ = await handler.check(callback, raw_state=None)
+            if matched:
+                return handler
+    return None
+
+
+# --- наборы замеров ---
+
+def middleware_cases(sizes: tuple[int, ...], tmp: str) -> list[Case]:
+    cases = []
+
+    async def handler(event, data):
+        return None
+
+    for size in sizes:
+        path = os.path.join(tmp, f"whitelist_{size}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"whitelist": list(range(1, size + 1)), "admin_ids": [0]}, f)
+        middleware = ExistMiddleware(path)
+        message = message_update(size)
+        callback = callback_update(size // 2, "next_1")
+        cases.append(Case("middleware", "exist_message", lambda m=middleware, e=message: m(handler, e, {}),
+                          {"users": size}, is_async=True))
+        cases.append(Case("middleware", "exist_callback", lambda m=middleware, e=callback: m(handler, e, {}),
+                          {"users": size}, is_async=True))
+
+    # Очередь пользователя без конкуренции: замок создается и удаляется на каждом обновлении
+    order = UserOrderMiddleware()
+    message = message_update(1)
+    click = Update(update_id=1, callback_query=CallbackQuery(
+        id="1", from_user=user_of(1), chat_instance="bench", data="n1abcdef000", message=message.message))
+    data = {"event_from_user": user_of(1)}
+    cases.append(Case("middleware", "user_order_message", lambda e=message: order(handler, e, data), is_async=True))
+    cases.append(Case("middleware", "user_order_callback", lambda e=click: order(handler, e, data), is_async=True))
+    return cases
+
+
+def load_from_bundle(path: str, use_mmap: bool):
+    """Открытие сборки и разбор ее сценариев в объекты реестра"""
+    bundle = ScenarioBundle(path, use_mmap=use_mmap)
+    try:
+        return [decode_scenario(key, *bundle.payload(key)) for key in bundle.keys()]
+    finally:
+        bundle.close()
+
+
+def scenario_cases(sizes: tuple[int, ...], tmp: str) -> list[Case]:
+    cases = []
+    scenario_loader.SCENARIOS_DIR = tmp
+    for size in sizes:
+        data = synthetic_scenario(size)
+        with open(os.path.join(tmp, f"bench_{size}.json"), "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        cases.append(Case("scenario", "load_scenario", lambda name=f"bench_{size}": scenario_loader.load_scenario(name),
+                          {"steps": size}))
+        cases.append(Case("scenario", "validate_scenario_structure",
+                          lambda d=data: scenario_loader.validate_scenario_structure(d), {"steps": size}))
+        scenario = compile_scenario(f"bench_{size}", data, "bench0000000")
+        bundle_path = os.path.join(tmp, f"bench_{size}.bundle")
+        write_bundle(bundle_path, [bundle_entry(scenario)])
+        for use_mmap in (False, True):
+            cases.append(Case("scenario", "load_bundle_mmap" if use_mmap else "load_bundle",
+                              lambda path=bundle_path, m=use_mmap: load_from_bundle(path, m), {"steps": size}))
+        cases.append(Case("keyboards", "build_scenario_keyboards",
+                          lambda s=scenario: scenario_keyboards.build_scenario_keyboards(s), {"steps": size}))
+    return cases
+
+
+def keyboard_cases() -> list[Case]:
+    scenarios = scenario_registry.all()
+    steps = [(step, i, scenario) for scenario in scenarios for i, step in enumerate(scenario.steps)]
+    theory = next(item for item in steps if isinstance(item[0], Theory) and not item[0].is_final)
+    branch = max((item for item in steps if isinstance(item[0], Branch)), key=lambda item: len(item[0].options))
+    survey = max((item for item in steps if isinstance(item[0], Survey)), key=lambda item: len(item[0].buttons))
+    practice = sample_practice(steps, survey)
+    scenario_keyboards.warm_scenario_keyboards(scenarios)
+
+    cases = [
+        Case("keyboards", "create_theory_keyboard",
+             lambda: scenario_keyboards.create_theory_keyboard(theory[2].version, theory[1], theory[0].button_text)),
+        Case("keyboards", "create_practice_keyboard",
+             lambda: scenario_keyboards.create_practice_keyboard(practice[2].version, practice[0].buttons, practice[1]),
+             {"buttons": len(practice[0].buttons)}),
+        Case("keyboards", "create_branch_keyboard",
+             lambda: scenario_keyboards.create_branch_keyboard(branch[2].version, branch[0].options, branch[1]),
+             {"options": len(branch[0].options)}),
+        Case("keyboards", "create_survey_keyboard",
+             lambda: scenario_keyboards.create_survey_keyboard(survey[2].version, survey[0].buttons, survey[1]),
+             {"buttons": len(survey[0].buttons)}),
+        Case("keyboards", "create_continue_keyboard",
+             lambda: scenario_keyboards.create_continue_keyboard(branch[2].version, 5)),
+        Case("keyboards", "get_continue_keyboard", lambda: scenario_keyboards.get_continue_keyboard(branch[2].version, 5)),
+        Case("keyboards", "get_step_keyboard", lambda: scenario_keyboards.get_step_keyboard(survey[2], survey[1])),
+        Case("keyboards", "go_to_menu_keyboard", menu_keyboards.go_to_menu_keyboard),
+        Case("keyboards", "admin_action_keyboard", admin_keyboards.admin_action_keyboard),
+        Case("keyboards", "admin_users_keyboard",
+             lambda: admin_keyboards.admin_users_keyboard(1000, 1050, True, True)),
+        Case("keyboards", "broadcast_confirm_keyboard", admin_keyboards.broadcast_confirm_keyboard),
+        Case("keyboards", "broadcast_stop_keyboard", admin_keyboards.broadcast_stop_keyboard),
+        Case("menu", "create_menu_scenarios_list_keyboard", menu_keyboards.create_menu_scenarios_list_keyboard),
+        Case("menu", "build_menu_scenarios_list_keyboard",
+             lambda: menu_keyboards.build_menu_scenarios_list_keyboard(scenarios), {"scenarios": len(scenarios)}),
+    ]
+    for item, kind in ((theory, "theory"), (practice, "practice"), (branch, "branch"), (survey, "survey")):
+        cases.append(Case("keyboards", "build_step_keyboard",
+                          lambda step=item[0], i=item[1], v=item[2].version:
+                          scenario_keyboards.build_step_keyboard(step, i, v),
+                          {"type": kind}))
+    return cases
+
+
+def sort_cases() -> list[Case]:
+    names = [f"День {i}" for i in range(1, 1001)]
+    return [
+        Case("sort", "natural_sort_key", lambda: natural_sort_key("День 14: обратная связь")),
+        Case("sort", "sorted_by_natural_sort_key", lambda: sorted(names, key=natural_sort_key), {"items": len(names)}),
+    ]
+
+
+def callback_cases() -> list[Case]:
+    cases = []
+    user = user_of(1)
+    for handler_name, data in real_callback_data().items():
+        parse = CALLBACK_PARSERS.get(handler_name, decode)
+        callback = CallbackQuery(id="1", from_user=user, chat_instance="bench", data=data)
+        cases.append(Case("callbacks", f"parse.{handler_name}", lambda p=parse, d=data: p(d), {"bytes": len(data.encode())}))
+        cases.append(Case("callbacks", f"lookup.{handler_name}", lambda d=data: callback_table.resolve(d)))
+        cases.append(Case("callbacks", f"route.{handler_name}", lambda c=callback: route_callback(c), is_async=True))
+    return cases
+
+
+# --- замер ---
+
+async def run_loop(case: Case, number: int) -> float:
+    func = case.func
+    started = time.perf_counter()
+    if case.is_async:
+        for _ in range(number):
+            await func()
+    else:
+        for _ in range(number):
+            func()
+    return time.perf_counter() - started
+
+
+async def measure(case: Case, repeat: int, min_time: float) -> dict:
+    # Подбираем число повторов так, чтобы один замер шел около min_time
+    number = 1
+    while True:
+        elapsed = await run_loop(case, number)
+        if elapsed >= min_time / 10 or number >= 10_000_000:
+            break
+        number *= 10
+    number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+
+    timings = [await run_loop(case, number) / number for _ in range(repeat)]
+    return {
+        "id": case.id,
+        "group": case.group,
+        "name": case.name,
+        "params": case.params,
+        "median_ns": statistics.median(timings) * 1e9,
+        "min_ns": min(timings) * 1e9,
+        "ops": number * repeat,
+    }
+
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True,
+                                timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "aiogram": aiogram.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(results: list[dict], baseline: dict, threshold: float) -> list[str]:
+    """Печатает сравнение с прошлым прогоном и возвращает id замеров с регрессией"""
+    old = {item["id"]: item for item in baseline["results"]}
+    regressions = []
+    print(f"\nСравнение с {baseline['meta'].get('created_at')} ({baseline['meta'].get('commit') or '?'}):")
+    for item in results:
+        previous = old.get(item["id"])
+        if previous is None:
+            continue
+        ratio = item["median_ns"] / previous["median_ns"] if previous["median_ns"] else 1.0
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "  << регрессия"
+            regressions.append(item["id"])
+        elif ratio < 1 - threshold:
+            mark = "  ускорение"
+        print(f"  {item['id']:<70} {previous['median_ns']:>12.0f} -> {item['median_ns']:>12.0f} нс ({ratio:5.2f}x){mark}")
+    return regressions
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", default="microbench.json")
+    parser.add_argument("--compare", default=None)
+    parser.add_argument("--threshold", type=float, default=0.15)
+    parser.add_argument("--filter", default=None)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.1)
+    parser.add_argument("--quick", action="store_true")
+    args = parser.parse_args()
+
+    # Логи загрузчика на каждый вызов не печатаем, но их стоимость остается в замере
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cases = [
+            *middleware_cases(QUICK_WHITELIST_SIZES if args.quick else WHITELIST_SIZES, tmp),
+            *scenario_cases(QUICK_SCENARIO_SIZES if args.quick else SCENARIO_SIZES, tmp),
+            *keyboard_cases(),
+            *sort_cases(),
+            *callback_cases(),
+        ]
+        if args.filter:
+            cases = [case for case in cases if args.filter in case.id]
+
+        results = []
+        for case in cases:
+            result = await measure(case, args.repeat, args.min_time)
+            results.append(result)
+            print(f"{case.id:<70} {result['median_ns']:>12.0f} нс (min {result['min_ns']:.0f})")
+
+    report = {"meta": metadata(), "results": results}
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты сохранены в {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"Регрессий: {len(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
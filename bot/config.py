@@ -7,4 +7,74 @@ ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 SCENARIOS_DIR = (f"{ROOT_DIR}/scenarios")
 IMAGE_DIR = (f"{ROOT_DIR}/images")
-USERS_DIR = (f"{ROOT_DIR}/middlewares")
\ No newline at end of file
+USERS_DIR = os.getenv("USERS_DIR", f"{ROOT_DIR}/middlewares")
+CACHE_DIR = (f"{ROOT_DIR}/cache")
+# Собранные сценарии (python -m bot.utils.scenario_compiler); пусто - читать каталог scenarios.
+# SCENARIO_BUNDLE_MMAP=1 - отображать сборку в память и разбирать сценарии при первом обращении
+SCENARIO_BUNDLE = os.getenv("SCENARIO_BUNDLE", "")
+SCENARIO_BUNDLE_MMAP = os.getenv("SCENARIO_BUNDLE_MMAP", "0") == "1"
+# Переход между шагами по кнопке: sequential - запросы по очереди (убрать кнопки, отправить шаг,
+# ответить на нажатие); fast - ответ на нажатие сразу и одновременно с запросами в чат;
+# edit - как fast, но шаг, если позволяет содержимое, заменяет сообщение с кнопкой, а не приходит новым
+STEP_TRANSITION = os.getenv("STEP_TRANSITION", "fast")
+# Чат (например, закрытый канал), куда при старте заранее загружаются картинки сценариев
+FILE_CACHE_CHAT_ID = os.getenv("FILE_CACHE_CHAT_ID")
+# Сжимать картинки сценариев при старте (нужен Pillow)
+IMAGE_PIPELINE = os.getenv("IMAGE_PIPELINE", "1") == "1"
+
+# Хранилище FSM: memory (по умолчанию), sqlite или redis
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory")
+FSM_SQLITE_PATH = os.getenv("FSM_SQLITE_PATH", f"{ROOT_DIR}/data/fsm.sqlite3")
+FSM_REDIS_URL = os.getenv("FSM_REDIS_URL", "redis://localhost:6379/0")
+# Сколько секунд хранить неактивную сессию (по умолчанию 30 дней)
+FSM_TTL = int(os.getenv("FSM_TTL", 30 * 24 * 3600))
+
+# Способ получения обновлений: polling (по умолчанию) или webhook
+DELIVERY_MODE = os.getenv("DELIVERY_MODE", "polling")
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", 8080))
+# Адрес Bot API (например, локальный Bot API сервер или имитация для тестов)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+
+# Число рабочих процессов; больше 1 - обновления раздаются процессам по id пользователя
+WORKERS = int(os.getenv("WORKERS", 1))
+
+# Запись ответов пользователей: sqlite (по умолчанию) или jsonl
+ANSWERS_FORMAT = os.getenv("ANSWERS_FORMAT", "sqlite")
+ANSWERS_PATH = os.getenv("ANSWERS_PATH", f"{ROOT_DIR}/data/answers.{'jsonl' if ANSWERS_FORMAT == 'jsonl' else 'sqlite3'}")
+
+# Агрегаты воронки сценариев и период их сохранения, в секундах
+ANALYTICS_PATH = os.getenv("ANALYTICS_PATH", f"{ROOT_DIR}/data/analytics.sqlite3")
+ANALYTICS_CHECKPOINT_INTERVAL = float(os.getenv("ANALYTICS_CHECKPOINT_INTERVAL", 30))
+
+# Выдача разделов по расписанию: дни недели (0 - понедельник), час и часовой пояс слотов
+DRIP_ENABLED = os.getenv("DRIP_ENABLED", "1") == "1"
+DRIP_PATH = os.getenv("DRIP_PATH", f"{ROOT_DIR}/data/drip.sqlite3")
+DRIP_WEEKDAYS = tuple(int(day) for day in os.getenv("DRIP_WEEKDAYS", "0,2,4").split(","))
+DRIP_HOUR = int(os.getenv("DRIP_HOUR", 10))
+DRIP_UTC_OFFSET = int(os.getenv("DRIP_UTC_OFFSET", 3))
+# Сколько раз напомнить о разделе, который пользователь так и не начал
+DRIP_MAX_REMINDERS = int(os.getenv("DRIP_MAX_REMINDERS", 1))
+
+# Рассылка: общий лимит сообщений в секунду и число одновременных отправок
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", 25))
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", 8))
+BROADCAST_STATE_FILE = os.getenv("BROADCAST_STATE_FILE", f"{ROOT_DIR}/data/broadcast.json")
+
+# Общая очередь исходящих запросов: лимит запросов в секунду на бота (0 - без ограничения)
+# и сколько запросов выполняется одновременно
+OUTBOUND_RATE = float(os.getenv("OUTBOUND_RATE", 30))
+OUTBOUND_CONCURRENCY = int(os.getenv("OUTBOUND_CONCURRENCY", 32))
+
+# Обновления одного пользователя обрабатываются по очереди; сколько их может ждать,
+# лишние отбрасываются (см. bot/middlewares/user_order.py)
+USER_MAX_PENDING = int(os.getenv("USER_MAX_PENDING", 8))
+
+# Метрики обработки обновлений и запросов к API; /metrics в формате Prometheus
+# (в режиме нескольких процессов рабочий N слушает METRICS_PORT + N, 0 - не поднимать)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9100))
@@ -1,44 +1,185 @@
+import re
+
 from aiogram import Router, F, Bot
 from aiogram.types import Message, CallbackQuery, FSInputFile
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.enums import ParseMode
 from aiogram.utils import keyboard
 
-from bot.keyboards.admin_keyboards import admin_action_keyboard
+from bot.keyboards.admin_keyboards import (
+    admin_action_keyboard, admin_users_keyboard, broadcast_confirm_keyboard, broadcast_stop_keyboard
+)
 from bot.utils.scenario_loader import get_available_scenarios
 from bot.utils.scenario_loader import load_scenario
 from bot.handlers.scenario_handler import send_scenario_step
+from bot.handlers.callback_handler import callback_table
 from bot.states.admin_state import AdminState
 from bot.config import IMAGE_DIR
 from bot.middlewares import exist_middleware
+from bot.utils.analytics import analytics
+from bot.utils.broadcast import broadcast_engine, BroadcastJob, format_progress
+from bot.utils.scenario_registry import scenario_registry, Scenario
+
+
+router = Router(name="admin")
+
+
+
+
+
+USERS_PAGE_SIZE = 50
+MAX_IDS_FILE_SIZE = 1024 * 1024
+
+
+def render_users_page(after: int | None = None, before: int | None = None):
+    """Текст и клавиатура одной страницы белого списка"""
+    start, page, has_prev, has_next = exist_middleware.get_whitelist_page(
+        after=after, before=before, limit=USERS_PAGE_SIZE)
+
+    if page:
+        total = len(exist_middleware.store.users)
+        lines = [f"👥 Список пользователей с доступом ({start + 1}–{start + len(page)} из {total}):", ""]
+        lines.extend(f"{i}. {user}" for i, user in enumerate(page, start + 1))
+        users_text = "\n".join(lines)
+        keyboard = admin_users_keyboard(page[0], page[-1], has_prev, has_next)
+    else:
+        users_text = "📝 Список пользователей пуст"
+        keyboard = admin_action_keyboard()
+    return users_text, keyboard
+
+
+def parse_user_ids(raw: str) -> tuple[list[int], list[str]]:
+    """
+    Разбирает id пользователей из текста или содержимого CSV/TXT файла
+
+    Returns:
+        tuple: (список id, список нераспознанных значений)
+    """
+    user_ids = []
+    invalid = []
+    for token in re.split(r"[\s,;]+", raw):
+        if not token:
+            continue
+        try:
+            user_ids.append(int(token))
+        except ValueError:
+            invalid.append(token)
+    return user_ids, invalid
+
+
+async def read_user_ids(message: Message, bot: Bot) -> tuple[list[int], list[str]] | None:
+    """Достает id из текста сообщения или приложенного CSV/TXT документа"""
+    if message.document:
+        if message.document.file_size and message.document.file_size > MAX_IDS_FILE_SIZE:
+            await message.answer(text="⚠️ Файл слишком большой (максимум 1 МБ)")
+            return None
+        content = await bot.download(message.document)
+        raw = content.read().decode("utf-8-sig", errors="replace")
+    elif message.text:
+        raw = message.text
+    else:
+        await message.answer(text="⚠️ Отправьте id текстом или файлом CSV/TXT")
+        return None
+    return parse_user_ids(raw)
 
 
-router = Router()
+def format_bulk_report(done: int, done_label: str, skipped: int, skipped_label: str, invalid: list[str]) -> str:
+    """Сводка по пакетной операции над белым списком"""
+    report = f"✅ {done_label}: {done}"
+    if skipped:
+        report += f"\n⚠️ {skipped_label}: {skipped}"
+    if invalid:
+        shown = ", ".join(invalid[:10])
+        more = "…" if len(invalid) > 10 else ""
+        report += f"\n❌ Не распознано: {len(invalid)} ({shown}{more})"
+    return report
 
 
+async def render_stats(scenario: Scenario) -> str:
+    """Воронка одного сценария по готовым агрегатам"""
+    funnel, finished = await analytics.funnel(scenario.key, len(scenario.steps))
+    started = funnel[0].entered if funnel else 0
 
+    lines = [f"📊 {scenario.name} ({scenario.key})",
+             f"Начали: {started}, прошли до конца: {finished}", ""]
+    for i, (step, stats) in enumerate(zip(scenario.steps, funnel)):
+        reached = f"{stats.entered / started:.0%}" if started else "—"
+        line = f"{i + 1}. {step.kind}: вошли {stats.entered} ({reached}), прошли {stats.completed}, ушли {stats.dropped}"
+        if stats.wrong:
+            line += f", ошибок {stats.wrong}"
+        median = stats.median_time()
+        if median:
+            line += f", медиана {median}"
+        lines.append(line)
+        options = getattr(step, 'options', ())
+        if stats.options and options:
+            chosen = ", ".join(f"{options[index].text}: {count}"
+                               for index, count in sorted(stats.options.items()) if index < len(options))
+            lines.append(f"    выбор: {chosen}")
+    return "\n".join(lines)
+
+
+@router.message(Command("stats"))
+async def admin_stats(message: Message, command: CommandObject):
+    """Воронка прохождения: /stats - сводка по сценариям, /stats <сценарий> - по шагам"""
+    if not exist_middleware.is_admin(message.chat.id):
+        return
+
+    if command.args:
+        scenario = scenario_registry.get(command.args.strip())
+        if scenario is None:
+            await message.answer(text=f"❌ Сценарий не найден: {command.args.strip()}")
+            return
+        await message.answer(text=await render_stats(scenario))
+        return
+
+    lines = ["📊 Прохождение сценариев (подробнее: /stats <сценарий>)", ""]
+    for scenario in scenario_registry.all():
+        funnel, finished = await analytics.funnel(scenario.key, len(scenario.steps))
+        started = funnel[0].entered if funnel else 0
+        lines.append(f"{scenario.name} ({scenario.key}): начали {started}, прошли {finished}")
+    await message.answer(text="\n".join(lines))
 
 
 @router.message(Command("admin"))
 async def admin_panel(message: Message, bot: Bot):
     """Команда начала админской работы с ботом"""
 
-    if message.chat.id not in exist_middleware.get_admin_ids():
+    if not exist_middleware.is_admin(message.chat.id):
         return
 
-    all_users: list = exist_middleware.get_whitelist()
-    if all_users:
-        users_text = "👥 Список пользователей с доступом:\n\n"
-        for i, user in enumerate(all_users, 1):
-            users_text += f"{i}. {user}\n"
+    users_text, keyboard = render_users_page()
+    await message.answer(text=users_text, reply_markup=keyboard)
+
+
+@callback_table.prefix("admin_users_", router="admin")
+async def admin_users_page_callback(callback: CallbackQuery):
+    """Листание списка пользователей по курсору"""
+    if not exist_middleware.is_admin(callback.from_user.id):
+        await callback.answer()
+        return
+
+    try:
+        _, _, direction, cursor = callback.data.split("_")
+        cursor = int(cursor)
+    except ValueError:
+        await callback.answer("Ошибка перехода")
+        return
+
+    if direction == "next":
+        users_text, keyboard = render_users_page(after=cursor)
     else:
-        users_text = "📝 Список пользователей пуст"
+        users_text, keyboard = render_users_page(before=cursor)
 
-    await message.answer(text=users_text, reply_markup=admin_action_keyboard())
+    try:
+        await callback.message.edit_text(text=users_text, reply_markup=keyboard)
+    except:
+        pass
+    await callback.answer()
 
 
-@router.callback_query(F.data == "admin_user_delete")
+@callback_table.exact("admin_user_delete", router="admin")
 async def admin_user_delete_callback(callback: CallbackQuery, bot: Bot, state: FSMContext):
     try:
         await bot.edit_message_reply_markup(
@@ -49,33 +190,38 @@ async def admin_user_delete_callback(callback: CallbackQuery, bot: Bot, state: F
         pass
     await state.set_state(AdminState.delete_user_id)
     await bot.send_message(chat_id=callback.message.chat.id,
-                           text=f"Введите id пользователя, чтобы удалить его из списка")
+                           text=f"Введите id пользователей (через пробел, запятую или с новой строки) "
+                                f"или пришлите CSV/TXT файл, чтобы удалить их из списка")
 
 
     await callback.answer()
 
 @router.message(AdminState.delete_user_id)
 async def admin_user_delete_process(message: Message, bot: Bot, state: FSMContext):
+    parsed = await read_user_ids(message, bot)
+    if parsed is None:
+        return
+    user_ids, invalid = parsed
 
-
-    user_id = message.text.strip()
-    whitelist = [str(user_id) for user_id in exist_middleware.get_whitelist()]
-    if user_id not in whitelist:
-        await message.answer(text="⚠️ Такого id нет в белом списке")
+    if not user_ids:
+        await message.answer(text="⚠️ Не найдено ни одного id")
         await state.clear()
         await admin_panel(message, bot)
         return
 
     try:
-        exist_middleware.remove_from_whitelist(int(message.text.strip()))
-        await message.answer(text="✅ Пользователь удалён из белого списка")
+        removed = exist_middleware.remove_many_from_whitelist(user_ids)
+        await message.answer(text=format_bulk_report(
+            removed, "Удалено из белого списка",
+            len(set(user_ids)) - removed, "Не было в белом списке",
+            invalid))
         await state.clear()
     except:
-        await message.answer(text="❌ Ошибка удаления пользователя")
+        await message.answer(text="❌ Ошибка удаления пользователей")
 
 
 
-@router.callback_query(F.data == "admin_user_add")
+@callback_table.exact("admin_user_add", router="admin")
 async def admin_user_add(callback: CallbackQuery, bot: Bot, state: FSMContext):
     try:
         await bot.edit_message_reply_markup(
@@ -86,25 +232,111 @@ async def admin_user_add(callback: CallbackQuery, bot: Bot, state: FSMContext):
         pass
     await state.set_state(AdminState.add_user_id)
     await bot.send_message(chat_id=callback.message.chat.id,
-                           text=f"Введите id пользователя, чтобы добавить его в белый список")
+                           text=f"Введите id пользователей (через пробел, запятую или с новой строки) "
+                                f"или пришлите CSV/TXT файл, чтобы добавить их в белый список")
 
 
     await callback.answer()
 
 @router.message(AdminState.add_user_id)
 async def admin_user_add_process(message: Message, bot: Bot, state: FSMContext):
-    user_id = message.text.strip()
-    whitelist = [str(user_id) for user_id in exist_middleware.get_whitelist()]
+    parsed = await read_user_ids(message, bot)
+    if parsed is None:
+        return
+    user_ids, invalid = parsed
 
-    if user_id in whitelist:
-        await message.answer(text="⚠️ Пользователь с таким id уже в белом списке")
+    if not user_ids:
+        await message.answer(text="⚠️ Не найдено ни одного id")
         await state.clear()
         await admin_panel(message, bot)
         return
 
     try:
-        exist_middleware.add_to_whitelist(int(message.text.strip()))
-        await message.answer(text="✅ Пользователь добавлен в белый список")
+        added = exist_middleware.add_many_to_whitelist(user_ids)
+        await message.answer(text=format_bulk_report(
+            added, "Добавлено в белый список",
+            len(set(user_ids)) - added, "Уже были в белом списке",
+            invalid))
         await state.clear()
     except:
-        await message.answer(text="❌ Ошибка добавления пользователя")
\ No newline at end of file
+        await message.answer(text="❌ Ошибка добавления пользователей")
+
+
+def broadcast_progress_reporter(bot: Bot, chat_id: int, message_id: int):
+    """Отчет о ходе рассылки: правит одно и то же сообщение администратора"""
+    async def report(job: BroadcastJob, rate: float):
+        keyboard = broadcast_stop_keyboard() if job.status == "running" else None
+        await bot.edit_message_text(text=format_progress(job, rate), chat_id=chat_id,
+                                    message_id=message_id, reply_markup=keyboard)
+    return report
+
+
+async def resume_broadcast(bot: Bot):
+    """Продолжает рассылку, прерванную перезапуском бота"""
+    job = broadcast_engine.load()
+    if job is None or job.status != "running":
+        return
+    message = await bot.send_message(chat_id=job.admin_chat_id, text="📤 Продолжаем прерванную рассылку…")
+    broadcast_engine.start(bot, job, list(exist_middleware.get_whitelist()),
+                           broadcast_progress_reporter(bot, job.admin_chat_id, message.message_id))
+
+
+@router.message(Command("broadcast"))
+async def admin_broadcast(message: Message, state: FSMContext):
+    """Рассылка сообщения всем пользователям из белого списка"""
+    if not exist_middleware.is_admin(message.chat.id):
+        return
+
+    if broadcast_engine.running:
+        await message.answer(text=format_progress(broadcast_engine.job, 0.0), reply_markup=broadcast_stop_keyboard())
+        return
+
+    await state.set_state(AdminState.broadcast_message)
+    await message.answer(text="Пришлите сообщение для рассылки (текст, фото или документ)")
+
+
+@router.message(AdminState.broadcast_message)
+async def admin_broadcast_message(message: Message, state: FSMContext):
+    await state.update_data(broadcast_chat_id=message.chat.id, broadcast_message_id=message.message_id)
+    await message.reply(text=f"Отправить это сообщение пользователям ({len(exist_middleware.store.users)})?",
+                        reply_markup=broadcast_confirm_keyboard())
+
+
+@callback_table.exact("broadcast_confirm", router="admin")
+async def admin_broadcast_confirm(callback: CallbackQuery, bot: Bot, state: FSMContext):
+    if not exist_middleware.is_admin(callback.from_user.id):
+        await callback.answer()
+        return
+
+    data = await state.get_data()
+    await state.clear()
+    if 'broadcast_message_id' not in data:
+        await callback.answer("Сообщение для рассылки не найдено", show_alert=True)
+        return
+    if broadcast_engine.running:
+        await callback.answer("Рассылка уже идет", show_alert=True)
+        return
+
+    recipients = list(exist_middleware.get_whitelist())
+    job = BroadcastJob(source_chat_id=data['broadcast_chat_id'], source_message_id=data['broadcast_message_id'],
+                       admin_chat_id=callback.message.chat.id, total=len(recipients))
+    await callback.message.edit_text(text=format_progress(job, 0.0), reply_markup=broadcast_stop_keyboard())
+    broadcast_engine.start(bot, job, recipients,
+                           broadcast_progress_reporter(bot, callback.message.chat.id, callback.message.message_id))
+    await callback.answer()
+
+
+@callback_table.exact("broadcast_cancel", router="admin")
+async def admin_broadcast_cancel(callback: CallbackQuery, state: FSMContext):
+    await state.clear()
+    await callback.message.edit_text(text="Рассылка отменена")
+    await callback.answer()
+
+
+@callback_table.exact("broadcast_stop", router="admin")
+async def admin_broadcast_stop(callback: CallbackQuery):
+    if not exist_middleware.is_admin(callback.from_user.id):
+        await callback.answer()
+        return
+    broadcast_engine.cancel()
+    await callback.answer("Рассылка остановлена")
@@ -0,0 +1,113 @@
+"""
+Единая таблица обработчиков нажатий на inline-кнопки.
+
+Вместо цепочки фильтров F.data.startswith(...) по всем роутерам обработчик
+находится одним поиском: сначала точное совпадение callback_data, затем
+операция компактной callback_data шага (bot/utils/callback_codec.py), затем
+префикс до одного из "_". Роутер этого модуля подключается первым и
+содержит один обработчик, который вызывает найденный.
+
+Обработчики регистрируются в своих модулях:
+
+    @callback_table.exact("go_to_menu", router="start")
+    @callback_table.op(OP_NEXT, router="scenario")        # получает payload: StepCallback
+    @callback_table.prefix("start_scenario_", router="start")
+"""
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from aiogram import Router
+from aiogram.dispatcher.event.handler import CallableObject
+from aiogram.types import CallbackQuery
+
+from bot.utils.callback_codec import decode
+
+router = Router(name="callbacks")
+
+
+@dataclass(frozen=True, slots=True)
+class CallbackRoute:
+    """Найденный обработчик: имя роутера для метрик и объект вызова aiogram"""
+    router: str
+    handler: CallableObject
+
+    @property
+    def name(self) -> str:
+        return self.handler.callback.__name__
+
+
+class CallbackTable:
+    def __init__(self):
+        self._exact: dict[str, CallbackRoute] = {}
+        self._ops: dict[str, CallbackRoute] = {}
+        self._prefixes: dict[str, CallbackRoute] = {}
+
+    def _register(self, table: dict, key: str, router: str):
+        def decorator(func: Callable) -> Callable:
+            if key in table:
+                raise ValueError(f"Обработчик для '{key}' уже зарегистрирован")
+            table[key] = CallbackRoute(router, CallableObject(callback=func))
+            return func
+        return decorator
+
+    def exact(self, *values: str, router: str):
+        """Обработчик для callback_data, совпадающей с одним из значений"""
+        def decorator(func: Callable) -> Callable:
+            for value in values:
+                self._register(self._exact, value, router)(func)
+            return func
+        return decorator
+
+    def op(self, op: str, router: str):
+        """Обработчик компактной callback_data шага с операцией op"""
+        return self._register(self._ops, op, router)
+
+    def prefix(self, prefix: str, router: str):
+        """Обработчик callback_data, которая начинается с prefix (prefix оканчивается на "_")"""
+        if not prefix.endswith("_"):
+            raise ValueError(f"Префикс callback_data должен оканчиваться на '_': '{prefix}'")
+        return self._register(self._prefixes, prefix, router)
+
+    def resolve(self, data: str) -> tuple[CallbackRoute, Any] | None:
+        """
+        Находит обработчик для callback_data
+
+        Returns:
+            tuple: (обработчик, разобранная StepCallback или None) или None, если обработчика нет
+        """
+        route = self._exact.get(data)
+        if route is not None:
+            return route, None
+
+        payload = decode(data)
+        if payload is not None:
+            route = self._ops.get(payload.op)
+            if route is not None:
+                return route, payload
+
+        # Префиксов немного, а "_" в строке не больше 64: проверяем только границы слов
+        index = data.find("_")
+        while index != -1:
+            route = self._prefixes.get(data[:index + 1])
+            if route is not None:
+                return route, None
+            index = data.find("_", index + 1)
+        return None
+
+    async def match(self, callback: CallbackQuery) -> bool | dict[str, Any]:
+        """Фильтр aiogram: пропускает нажатие, если для него есть обработчик"""
+        if callback.data is None:
+            return False
+        found = self.resolve(callback.data)
+        if found is None:
+            return False
+        route, payload = found
+        return {"callback_route": route, "payload": payload}
+
+
+callback_table = CallbackTable()
+
+
+@router.callback_query(callback_table.match)
+async def dispatch_callback(callback: CallbackQuery, callback_route: CallbackRoute, **data) -> Any:
+    return await callback_route.handler.call(callback, **data)
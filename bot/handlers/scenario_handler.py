@@ -1,44 +1,194 @@
-from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, ReplyKeyboardRemove, FSInputFile
+import asyncio
+import logging
+from typing import Awaitable
+
+from aiogram import Router
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InputMediaPhoto
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
-import os
 from aiogram.enums import ParseMode
 
 from bot.states.user_state import UserState
-from bot.utils.scenario_loader import load_scenario
-from bot.keyboards.scenario_keyboards import create_theory_keyboard, create_practice_keyboard, create_branch_keyboard, create_survey_keyboard, create_continue_keyboard
+from bot.utils.scenario_registry import (
+    scenario_registry, Scenario, Theory, Practice, Branch, BranchWithInput, Survey, TextAnswer
+)
+from bot.keyboards.scenario_keyboards import get_step_keyboard, get_continue_keyboard, REPLY_KEYBOARD_REMOVE
 from bot.keyboards.menu_keyboards import go_to_menu_keyboard
-from bot.config import IMAGE_DIR
-router = Router()
-
-
-async def send_scenario_step(message: Message, state: FSMContext):
-    """Отправка текущего шага сценария"""
+from bot.handlers.callback_handler import callback_table
+from bot.utils.callback_codec import StepCallback, OP_NEXT, OP_ANSWER, OP_BRANCH, OP_SURVEY, OP_CONTINUE
+from bot.utils.file_id_cache import file_id_cache
+from bot.utils.asset_manifest import asset_manifest, Asset
+from bot.utils.answer_recorder import answer_recorder
+from bot.utils.analytics import analytics
+from bot.utils.drip_scheduler import drip_scheduler
+from bot.config import STEP_TRANSITION
+
+logger = logging.getLogger(__name__)
+router = Router(name="scenario")
+
+
+async def start_scenario(state: FSMContext, scenario: Scenario):
+    """
+    Начинает сценарий. В состоянии пользователя хранится только компактная запись:
+    id и версия сценария плюс курсоры шагов, сам сценарий берется из общего реестра
+    """
+    await state.set_state(UserState.in_scenario)
+    await state.set_data({
+        'scenario_id': scenario.key,
+        'scenario_version': scenario.version,
+        'current_step': 0,
+    })
+    # Начатый раздел курса больше не нужно напоминать
+    await drip_scheduler.scenario_started(state.key.user_id, scenario.key)
+
+
+async def resolve_scenario(message: Message, state: FSMContext, user_data: dict) -> Scenario | None:
+    """
+    Находит сценарий сессии в реестре. Если сценарий удален или его содержимое
+    изменилось (версия не совпадает), сессия сбрасывается
+    """
+    scenario = scenario_registry.get(user_data.get('scenario_id'))
+    if scenario is not None and scenario.version == user_data.get('scenario_version'):
+        return scenario
+
+    await message.answer("🔄 Раздел был обновлен, начните его заново из меню",
+                         reply_markup=go_to_menu_keyboard())
+    await state.clear()
+    return None
+
+
+# Какой тип шага ждет каждая операция кнопки, сколько у него вариантов (None - кнопка без варианта)
+# и в каком состоянии пользователь стоит на таком шаге
+STEP_OPS = {
+    OP_NEXT: (Theory, None, UserState.in_scenario),
+    OP_ANSWER: (Practice, lambda step: len(step.buttons), UserState.waiting_answer),
+    OP_BRANCH: ((Branch, BranchWithInput), lambda step: len(step.options), UserState.waiting_branch),
+    OP_SURVEY: (Survey, lambda step: len(step.buttons), UserState.waiting_survey),
+}
+
+
+async def resolve_callback_step(callback: CallbackQuery, state: FSMContext, payload: StepCallback,
+                                raw_state: str | None):
+    """
+    Сценарий сессии и шаг, к которому относится нажатая кнопка. Кнопки другой
+    версии сценария и кнопки, которые не подходят к шагу, считаются устаревшими:
+    на нажатие сразу отвечаем, и обработчик ничего не делает. Кнопки шага,
+    на котором пользователя уже нет (повторное нажатие, пришедшее после
+    обработки первого), не обрабатываются повторно: на них отвечаем без сообщения
+
+    Args:
+        raw_state: Текущее состояние пользователя (aiogram передает его обработчику)
+
+    Returns:
+        tuple: (сценарий, шаг или None для кнопки продолжения) или None
+    """
     user_data = await state.get_data()
-    scenario = user_data['scenario']
-    current_step = user_data['current_step']
-
-    if current_step >= len(scenario['steps']):
-        await message.answer("🎉 Раздел завершен! Можете вернуться к списку разделов командой /menu",
-                             reply_markup=go_to_menu_keyboard())
-        await state.clear()
+    scenario = await resolve_scenario(callback.message, state, user_data)
+    if scenario is None:
+        await callback.answer()
+        return None
+
+    if payload.matches(scenario.version):
+        if payload.op == OP_CONTINUE:
+            if payload.step <= len(scenario.steps):
+                if (raw_state == UserState.waiting_branch_continue.state
+                        and payload.step == user_data.get('next_step_after_branch')):
+                    return scenario, None
+                await callback.answer()
+                return None
+        elif payload.step < len(scenario.steps):
+            step = scenario.steps[payload.step]
+            step_type, options, step_state = STEP_OPS[payload.op]
+            if options is None:
+                fits = payload.option is None
+            else:
+                fits = payload.option is not None and payload.option < options(step)
+            if isinstance(step, step_type) and fits:
+                if payload.step == user_data['current_step'] and raw_state == step_state.state:
+                    return scenario, step
+                await callback.answer()
+                return None
+
+    await callback.answer("Эта кнопка устарела", show_alert=True)
+    return None
+
+
+async def _awaited(request: Awaitable):
+    # Методы-сокращения aiogram (callback.answer(), message.edit_reply_markup()) возвращают
+    # объекты запросов, а не корутины: asyncio.gather их не принимает
+    return await request
+
+
+async def concurrently(*requests: Awaitable):
+    """Выполняет запросы одновременно"""
+    return await asyncio.gather(*(_awaited(request) for request in requests))
+
+
+async def reply_to_press(callback: CallbackQuery, *requests: Awaitable, answer_text: str | None = None):
+    """
+    Отвечает на нажатие и выполняет запросы в чат. В режиме sequential - по очереди,
+    ответ последним; иначе ответ уходит сразу, а запросы в чат передаются в очередь
+    исходящих одновременно (она выполняет их по порядку, но без ожидания между ними в обработчике)
+    """
+    if STEP_TRANSITION == "sequential":
+        for request in requests:
+            await request
+        await callback.answer(answer_text)
         return
+    await concurrently(callback.answer(answer_text), *requests)
+
 
-    step = scenario['steps'][current_step]
-    has_photo = 'photo' in step and step['photo']
+async def edit_in_place(pressed: Message, text: str, keyboard, asset: Asset | None) -> bool:
+    """
+    Заменяет сообщение с нажатой кнопкой на шаг, если Telegram это позволяет: текст на текст,
+    картинку на картинку, уже загруженную в Telegram. Reply-клавиатуру к измененному сообщению
+    не прикрепить, такие шаги отправляются новым сообщением
 
-    async def send_content(text: str, keyboard=None):
-        if has_photo:
-            photo_path = os.path.join(IMAGE_DIR, step['photo'])
-            if not os.path.exists(photo_path):
-                await message.answer(f"❌ Фото не найдено: {step['photo']}", parse_mode=ParseMode.HTML)
-                await message.answer(text, reply_markup=keyboard, parse_mode=ParseMode.HTML)
-                return
+    Returns:
+        bool: Сообщение изменено; False - шаг нужно отправить новым сообщением
+    """
+    if keyboard is not None and not isinstance(keyboard, InlineKeyboardMarkup):
+        return False
+    try:
+        if asset is None:
+            if not getattr(pressed, "text", None):
+                return False
+            await pressed.edit_text(text, reply_markup=keyboard, parse_mode=ParseMode.HTML)
+            return True
+
+        file_id = file_id_cache.get(asset.sha256)
+        if file_id is None or not getattr(pressed, "photo", None):
+            return False
+        await pressed.edit_media(InputMediaPhoto(media=file_id, caption=text, parse_mode=ParseMode.HTML),
+                                 reply_markup=keyboard)
+        return True
+    except TelegramBadRequest as e:
+        logger.warning(f"Не удалось изменить сообщение {pressed.message_id}, шаг уйдет новым: {e}")
+        return False
+
+
+async def deliver(message: Message, text: str, keyboard=None, asset: Asset | None = None,
+                  pressed: Message | None = None, in_place: bool = False):
+    """
+    Отправляет сообщение шага
+
+    Args:
+        message: Сообщение, в чат которого отправляется шаг
+        text: Текст или подпись к картинке
+        keyboard: Клавиатура шага
+        asset: Картинка из манифеста
+        pressed: Сообщение с нажатой кнопкой: его кнопки убираются вместе с отправкой шага
+        in_place: Заменить сообщение pressed на шаг, если это возможно
+    """
+    if pressed is not None and in_place and await edit_in_place(pressed, text, keyboard, asset):
+        return
 
-            photo = FSInputFile(photo_path)
-            await message.answer_photo(
-                photo=photo,
+    async def send():
+        if asset is not None:
+            # Картинка загружается один раз, дальше отправляется по file_id
+            await file_id_cache.send_photo(
+                message.answer_photo, asset.path, asset.sha256,
                 caption=text,
                 reply_markup=keyboard,
                 parse_mode=ParseMode.HTML
@@ -46,140 +196,160 @@ async def send_scenario_step(message: Message, state: FSMContext):
         else:
             await message.answer(text, reply_markup=keyboard, parse_mode=ParseMode.HTML)
 
-    if step['type'] == "theory":
-        # Проверяем, является ли сообщение конечным
-        is_final = step.get('is_final', False)
+    if pressed is None:
+        await send()
+    elif STEP_TRANSITION == "sequential":
+        await pressed.edit_reply_markup(reply_markup=None)
+        await send()
+    else:
+        await concurrently(pressed.edit_reply_markup(reply_markup=None), send())
 
-        if is_final:
-            # Для конечного сообщения используем специальную клавиатуру
-            keyboard = go_to_menu_keyboard()
-        else:
-            # Для обычного сообщения
-            button_text = step.get('button_text', 'Дальше')
-            keyboard = create_theory_keyboard(current_step, button_text)
 
-        await send_content(step['text'], keyboard)
-        await state.set_state(UserState.in_scenario)
+async def send_scenario_step(message: Message, state: FSMContext, pressed: Message | None = None,
+                             in_place: bool = False):
+    """
+    Отправка текущего шага сценария
 
-    elif step['type'] == "practice":
-        keyboard = create_practice_keyboard(step['buttons'], current_step)
-        await send_content(step['text'], keyboard)
-        await state.set_state(UserState.waiting_answer)
+    Args:
+        message: Сообщение, в чат которого отправляется шаг
+        state: Состояние пользователя
+        pressed: Сообщение с нажатой кнопкой, у которого нужно убрать кнопки
+        in_place: Заменить сообщение pressed на шаг, если это возможно (STEP_TRANSITION=edit)
+    """
+    user_data = await state.get_data()
+    scenario = await resolve_scenario(message, state, user_data)
+    if scenario is None:
+        return
+    current_step = user_data['current_step']
 
-    elif step['type'] == "text_answer":
-        text = step['text']
-        if 'placeholder' in step:
-            text += f"\n\n💡 Подсказка: {step['placeholder']}"
+    if current_step >= len(scenario.steps):
+        analytics.scenario_finished(message.chat.id, scenario.key)
+        await drip_scheduler.scenario_finished(message.chat.id, scenario.key)
+        await state.clear()
+        await deliver(message, "🎉 Раздел завершен! Можете вернуться к списку разделов командой /menu",
+                      go_to_menu_keyboard(), pressed=pressed, in_place=in_place)
+        return
 
-        if has_photo:
-            photo_path = os.path.join(IMAGE_DIR, step['photo'])
-            if not os.path.exists(photo_path):
-                await message.answer(f"❌ Фото не найдено: {step['photo']}", parse_mode=ParseMode.HTML)
-                await message.answer(text, reply_markup=ReplyKeyboardRemove(), parse_mode=ParseMode.HTML)
-            else:
-                photo = FSInputFile(photo_path)
-                await message.answer_photo(
-                    photo=photo,
-                    caption=text,
-                    reply_markup=ReplyKeyboardRemove(),
-                    parse_mode=ParseMode.HTML
-                )
-        else:
-            await message.answer(text, reply_markup=ReplyKeyboardRemove(), parse_mode=ParseMode.HTML)
-        await state.set_state(UserState.waiting_text_input)
+    step = scenario.steps[current_step]
+    # Путь и хэш картинки берутся из манифеста, собранного при загрузке; на диск отправка не ходит.
+    # Отсутствующие картинки уже отмечены в логе при сборке манифеста, шаг уходит без фото
+    asset = asset_manifest.get(step.photo) if step.photo else None
 
-    elif step['type'] == "branch":
-        keyboard = create_branch_keyboard(step['options'], current_step)
-        await send_content(step['text'], keyboard)
-        await state.set_state(UserState.waiting_branch)
+    # Клавиатура шага построена заранее и общая для всех пользователей
+    keyboard = get_step_keyboard(scenario, current_step)
+    analytics.step_entered(message.chat.id, scenario.key, current_step)
 
-    elif step['type'] == "branch_with_input":
-        keyboard = create_branch_keyboard(step['options'], current_step)
-        await send_content(step['text'], keyboard)
+    # Состояние меняется до отправки: следующее нажатие пользователя уже застанет новый шаг
+    if isinstance(step, Theory):
+        await state.set_state(UserState.in_scenario)
+        if step.is_final:
+            # С финального шага пользователь уходит в меню, до конца сценария он уже дошел
+            analytics.scenario_finished(message.chat.id, scenario.key)
+            await drip_scheduler.scenario_finished(message.chat.id, scenario.key)
+    elif isinstance(step, Practice):
+        await state.set_state(UserState.waiting_answer)
+    elif isinstance(step, TextAnswer):
+        await state.set_state(UserState.waiting_text_input)
+    elif isinstance(step, (Branch, BranchWithInput)):
         await state.set_state(UserState.waiting_branch)
-
-    elif step['type'] == "survey":
-        keyboard = create_survey_keyboard(step['buttons'], current_step)
-        await send_content(step['text'], keyboard)
+    elif isinstance(step, Survey):
         await state.set_state(UserState.waiting_survey)
 
+    text = step.prompt if isinstance(step, TextAnswer) else step.text
+    await deliver(message, text, keyboard, asset, pressed=pressed, in_place=in_place)
+
+
+async def advance(callback: CallbackQuery, state: FSMContext, notice: str | None = None,
+                  answer_text: str | None = None):
+    """
+    Переход к текущему шагу сессии после нажатия на кнопку шага
+
+    Args:
+        callback: Нажатие
+        state: Состояние пользователя, current_step уже указывает на нужный шаг
+        notice: Сообщение перед шагом (ответ развилки, "Правильно!")
+        answer_text: Всплывающий ответ на нажатие
+    """
+    message = callback.message
+    if notice is None:
+        await reply_to_press(callback, send_scenario_step(message, state, pressed=message,
+                                                          in_place=STEP_TRANSITION == "edit"),
+                             answer_text=answer_text)
+        return
+    # Сообщение перед шагом остается в чате, поэтому сообщение с кнопкой не заменяется
+    await reply_to_press(callback,
+                         message.edit_reply_markup(reply_markup=None),
+                         message.answer(notice),
+                         send_scenario_step(message, state),
+                         answer_text=answer_text)
+
 
-@router.callback_query(F.data.startswith("survey_"))
-async def handle_survey_callback(callback: CallbackQuery, state: FSMContext):
+@callback_table.op(OP_SURVEY, router="scenario")
+async def handle_survey_callback(callback: CallbackQuery, state: FSMContext, payload: StepCallback,
+                                 raw_state: str | None):
     """Обработка ответов в опросе (без проверки правильности)"""
-    data_parts = callback.data.split("_")
-    step_index = int(data_parts[1])
-    user_answer = "_".join(data_parts[2:])
+    resolved = await resolve_callback_step(callback, state, payload, raw_state)
+    if resolved is None:
+        return
+    scenario, step = resolved
+    step_index = payload.step
 
-    # Просто принимаем любой ответ и переходим дальше
-    await callback.answer("✅ Ответ принят!", parse_mode=ParseMode.HTML)
+    # Правильного ответа нет: записываем выбор и переходим дальше
+    await answer_recorder.record(callback.from_user.id, scenario.key, step_index,
+                                 "survey", step.buttons[payload.option])
 
     await state.update_data(current_step=step_index + 1)
-    await callback.message.edit_reply_markup(reply_markup=None)
-    await send_scenario_step(callback.message, state)
+    await advance(callback, state, answer_text="✅ Ответ принят!")
 
 
-@router.callback_query(F.data.startswith("branch_"))
-async def handle_branch_callback(callback: CallbackQuery, state: FSMContext):
+@callback_table.op(OP_BRANCH, router="scenario")
+async def handle_branch_callback(callback: CallbackQuery, state: FSMContext, payload: StepCallback,
+                                 raw_state: str | None):
     """Обработка выбора в развилке (общий для branch и branch_with_input)"""
-    data_parts = callback.data.split("_")
-
-    if len(data_parts) != 3:
+    resolved = await resolve_callback_step(callback, state, payload, raw_state)
+    if resolved is None:
         return
+    scenario, step = resolved
+    step_index = payload.step
+    option_index = payload.option
 
-    try:
-        step_index = int(data_parts[1])
-        option_index = int(data_parts[2]) - 1
-    except ValueError:
-        return
-
-    user_data = await state.get_data()
-    scenario = user_data['scenario']
-    step = scenario['steps'][step_index]
+    selected_option = step.options[option_index]
+    analytics.option_chosen(scenario.key, step_index, option_index)
 
-    selected_option = step['options'][option_index]
-    response = selected_option['response'] if 'response' in selected_option else selected_option.get('input_prompt', '')
-
-    # Определяем тип шага
-    step_type = step['type']
-
-    if step_type == "branch":
+    if isinstance(step, Branch):
         # Существующая логика для обычного branch
-        should_repeat = selected_option.get('repeat_step', False)
-        show_continue = selected_option.get('show_continue_button', True)
+        response = selected_option.response
+        should_repeat = selected_option.repeat_step
+        show_continue = selected_option.show_continue_button
 
         if should_repeat:
-            await callback.message.edit_reply_markup(reply_markup=None)
-            await callback.message.answer(response)
-            await send_scenario_step(callback.message, state)
+            await advance(callback, state, notice=response)
+        elif show_continue:
+            await state.update_data(next_step_after_branch=step_index + 1)
+            await state.set_state(UserState.waiting_branch_continue)
+            await reply_to_press(
+                callback,
+                callback.message.edit_reply_markup(reply_markup=None),
+                callback.message.answer(response, reply_markup=get_continue_keyboard(scenario.version, step_index + 1)),
+            )
         else:
-            await callback.message.edit_reply_markup(reply_markup=None)
+            await state.update_data(current_step=step_index + 1)
+            await advance(callback, state, notice=response)
 
-            if show_continue:
-                await callback.message.answer(response, reply_markup=create_continue_keyboard(step_index + 1))
-                await state.update_data(next_step_after_branch=step_index + 1)
-                await state.set_state(UserState.waiting_branch_continue)
-            else:
-                await callback.message.answer(response)
-                await state.update_data(current_step=step_index + 1)
-                await send_scenario_step(callback.message, state)
-
-    elif step_type == "branch_with_input":
-        # Новая логика для branch_with_input
-        await callback.message.edit_reply_markup(reply_markup=None)
-
-        # Сохраняем данные для текстового ввода
+    elif isinstance(step, BranchWithInput):
+        # Новая логика для branch_with_input: сохраняем данные для текстового ввода
         await state.update_data(
             current_step=step_index,
-            branch_input_prompt=selected_option['input_prompt'],
             next_step_after_input=step_index + 1
         )
 
         # Переходим к текстовому вводу
         await state.set_state(UserState.waiting_branch_input)
-        await callback.message.answer(selected_option['input_prompt'], reply_markup=ReplyKeyboardRemove())
-
-    await callback.answer()
+        await reply_to_press(
+            callback,
+            callback.message.edit_reply_markup(reply_markup=None),
+            callback.message.answer(selected_option.input_prompt, reply_markup=REPLY_KEYBOARD_REMOVE),
+        )
 
 
 @router.message(StateFilter(UserState.waiting_branch_input))
@@ -188,36 +358,36 @@ async def handle_branch_input(message: Message, state: FSMContext):
     user_data = await state.get_data()
     next_step = user_data['next_step_after_input']
 
-    # Сохраняем ответ пользователя (опционально)
-    # await state.update_data(user_input=message.text)
+    # Сохраняем ответ пользователя (запись идет в фоне)
+    await answer_recorder.record(message.from_user.id, user_data.get('scenario_id'), user_data['current_step'],
+                                 "branch_input", message.text or "")
 
     # Переходим к следующему шагу
     await state.update_data(current_step=next_step)
     await send_scenario_step(message, state)
 
 
-@router.callback_query(F.data.startswith("con_branch_"))
-async def handle_branch_continue(callback: CallbackQuery, state: FSMContext):
+@callback_table.op(OP_CONTINUE, router="scenario")
+async def handle_branch_continue(callback: CallbackQuery, state: FSMContext, payload: StepCallback,
+                                 raw_state: str | None):
     """Обработка кнопки 'дальше' после branch"""
-    try:
-        next_step = int(callback.data.split("_")[2])
-    except (ValueError, IndexError):
-        await callback.answer("Ошибка перехода")
+    if await resolve_callback_step(callback, state, payload, raw_state) is None:
         return
+    next_step = payload.step
 
     # Переходим к следующему шагу
     await state.update_data(current_step=next_step)
     await state.set_state(UserState.in_scenario)
-    await callback.message.edit_reply_markup(reply_markup=None)
-    await send_scenario_step(callback.message, state)
-    await callback.answer()
+    await advance(callback, state)
 
 @router.message(StateFilter(UserState.waiting_text_input))
 async def handle_text_input(message: Message, state: FSMContext):
     """Обработка текстового ответа пользователя"""
-    # Просто принимаем любой текст и переходим дальше
+    # Принимаем любой текст, записываем его и переходим дальше
     user_data = await state.get_data()
     current_step = user_data['current_step']
+    await answer_recorder.record(message.from_user.id, user_data.get('scenario_id'), current_step,
+                                 "text", message.text or "")
     await state.update_data(current_step=current_step + 1)
 
     await send_scenario_step(message, state)
@@ -226,52 +396,55 @@ async def handle_text_input(message: Message, state: FSMContext):
 @router.message(Command("start_scenario"))
 async def cmd_start_scenario(message: Message, state: FSMContext):
     """Начало сценария по умолчанию"""
-    scenario = load_scenario("day_1")
+    scenario = scenario_registry.get("day_1")
 
     if not scenario:
         await message.answer("❌ Сценарий не найден")
         return
 
-    await state.set_state(UserState.in_scenario)
-    await state.update_data(
-        scenario=scenario,
-        current_step=0
-    )
-
+    await start_scenario(state, scenario)
     await send_scenario_step(message, state)
 
 
-@router.callback_query(F.data.startswith("next_"))
-async def handle_next_callback(callback: CallbackQuery, state: FSMContext):
+@callback_table.op(OP_NEXT, router="scenario")
+async def handle_next_callback(callback: CallbackQuery, state: FSMContext, payload: StepCallback,
+                               raw_state: str | None):
     """Обработка кнопки 'дальше'"""
-    next_step = int(callback.data.split("_")[1])
+    if await resolve_callback_step(callback, state, payload, raw_state) is None:
+        return
+    next_step = payload.step + 1
 
     await state.update_data(current_step=next_step)
-    await callback.message.edit_reply_markup(reply_markup=None)
-    await send_scenario_step(callback.message, state)
-    await callback.answer()
+    await advance(callback, state)
 
 
-@router.callback_query(F.data.startswith("answer_"))
-async def handle_answer_callback(callback: CallbackQuery, state: FSMContext):
+@callback_table.op(OP_ANSWER, router="scenario")
+async def handle_answer_callback(callback: CallbackQuery, state: FSMContext, payload: StepCallback,
+                                 raw_state: str | None):
     """Обработка ответов на практические задания"""
-    data_parts = callback.data.split("_")
-    step_index = int(data_parts[1])
-    user_answer = "_".join(data_parts[2:])
-
-    user_data = await state.get_data()
-    scenario = user_data['scenario']
-    step = scenario['steps'][step_index]
+    resolved = await resolve_callback_step(callback, state, payload, raw_state)
+    if resolved is None:
+        return
+    scenario, step = resolved
+    step_index = payload.step
 
     # Проверка ответа
-    is_correct = user_answer == step.get('correct_answer', '')
+    is_correct = step.buttons[payload.option] == step.correct_answer
 
     if is_correct:
-        await callback.message.answer("✅ Правильно! Переходим а...", parse_mode=ParseMode.HTML)
         await state.update_data(current_step=step_index + 1)
-        await callback.message.edit_reply_markup(reply_markup=None)
-        await send_scenario_step(callback.message, state)
+        await advance(callback, state, notice="✅ Правильно! Переходим а...")
     else:
-        await callback.answer("❌ Неправильно, попробуйте еще раз", show_alert=True, parse_mode=ParseMode.HTML)
-
-    await callback.answer()
+        # На нажатие отвечаем один раз: повторный ответ Telegram отклоняет
+        analytics.wrong_answer(scenario.key, step_index)
+        await callback.answer("❌ Неправильно, попробуйте еще раз", show_alert=True)
+
+
+@callback_table.prefix("next_", router="scenario")
+@callback_table.prefix("answer_", router="scenario")
+@callback_table.prefix("branch_", router="scenario")
+@callback_table.prefix("survey_", router="scenario")
+@callback_table.prefix("con_branch_", router="scenario")
+async def handle_legacy_step_callback(callback: CallbackQuery):
+    """Кнопки шагов в старом формате (с текстом ответа в callback_data), отправленные до обновления бота"""
+    await callback.answer("Эта кнопка устарела, откройте раздел заново из меню", show_alert=True)
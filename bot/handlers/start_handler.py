@@ -7,12 +7,18 @@ from aiogram.utils import keyboard
 
 from bot.keyboards.menu_keyboards import create_menu_scenarios_list_keyboard, go_to_menu_keyboard
 from bot.utils.scenario_loader import get_available_scenarios
-from bot.utils.scenario_loader import load_scenario
-from bot.handlers.scenario_handler import send_scenario_step
+from bot.utils.scenario_registry import scenario_registry
+from bot.handlers.scenario_handler import send_scenario_step, start_scenario, reply_to_press
+from bot.handlers.callback_handler import callback_table
 from bot.states.user_state import UserState
+from bot.utils.file_id_cache import file_id_cache
+from bot.utils.asset_manifest import asset_manifest
+from bot.utils.drip_scheduler import drip_scheduler
 from bot.config import IMAGE_DIR
 
-router = Router()
+router = Router(name="start")
+
+WELCOME_PHOTO = "1_hello.PNG"
 
 
 @router.message(Command("start"))
@@ -28,13 +34,21 @@ async def cmd_start(message: Message, bot: Bot):
 
 
 
-    await bot.send_photo(chat_id=message.chat.id, photo=FSInputFile(f"{IMAGE_DIR}/1_hello.PNG"),
-                         caption=welcome_text,
-                         parse_mode=ParseMode.HTML,
-                         reply_markup=go_to_menu_keyboard())
+    asset = asset_manifest.get(WELCOME_PHOTO)
+    if asset is not None:
+        await file_id_cache.send_photo(bot.send_photo, asset.path, asset.sha256,
+                             chat_id=message.chat.id,
+                             caption=welcome_text,
+                             parse_mode=ParseMode.HTML,
+                             reply_markup=go_to_menu_keyboard())
+    else:
+        await message.answer(welcome_text, parse_mode=ParseMode.HTML, reply_markup=go_to_menu_keyboard())
+
+    # Новые разделы курса будут приходить по расписанию
+    await drip_scheduler.enroll(message.chat.id)
 
 
-@router.callback_query(F.data == "go_to_menu")
+@callback_table.exact("go_to_menu", router="start")
 async def go_to_menu_callback(callback: CallbackQuery, bot: Bot):
     try:
         await bot.edit_message_reply_markup(
@@ -60,38 +74,32 @@ async def cmd_start_scenario(message: Message, bot: Bot):
     await message.answer("Меню:", reply_markup=keyboard)
 
 
-@router.callback_query(F.data.startswith("start_scenario_"))
+@callback_table.prefix("start_scenario_", router="start")
 async def handle_scenario_selection(callback: CallbackQuery, state: FSMContext):
     """Обработка выбора сценария"""
     scenario_name = callback.data.replace("start_scenario_", "")
 
-    scenario = load_scenario(scenario_name)
+    scenario = scenario_registry.get(scenario_name)
 
     if not scenario:
         await callback.answer("❌ Сценарий не найден или поврежден", show_alert=True)
         return
 
     # Запускаем выбранный сценарий
-    await state.set_state(UserState.in_scenario)
-    await state.update_data(
-        scenario=scenario,
-        current_step=0
-    )
+    await start_scenario(state, scenario)
 
-    await callback.message.edit_reply_markup(reply_markup=None)
-
-    await send_scenario_step(callback.message, state)
-    await callback.answer()
+    # Меню остается в чате (без кнопок), первый шаг приходит новым сообщением
+    await reply_to_press(callback, send_scenario_step(callback.message, state, pressed=callback.message))
 
 
-@router.callback_query(F.data == "refresh_scenarios")
+@callback_table.exact("refresh_scenarios", router="start")
 async def handle_refresh_scenarios(callback: CallbackQuery):
     """Обновление списка сценариев"""
     keyboard = create_menu_scenarios_list_keyboard()
     await callback.message.edit_reply_markup(reply_markup=keyboard)
     await callback.answer("🔄 Список обновлен")
 
-@router.callback_query(F.data == "programm_list")
+@callback_table.exact("programm_list", router="start")
 async def handle_programm_list(callback: CallbackQuery, bot: Bot):
     """Отправляет программу в текстовом формате"""
     try:
@@ -120,7 +128,7 @@ async def handle_programm_list(callback: CallbackQuery, bot: Bot):
     await callback.answer()
 
 
-@router.callback_query(F.data.in_(["no_scenarios", "error_scenarios"]))
+@callback_table.exact("no_scenarios", "error_scenarios", router="start")
 async def handle_scenario_errors(callback: CallbackQuery):
     """Обработка ошибок сценариев"""
     await callback.answer("❌ Нет доступных сценариев или произошла ошибка", show_alert=True)
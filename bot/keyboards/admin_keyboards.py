@@ -6,13 +6,49 @@ from bot.utils.sorter import natural_sort_key
 
 
 
+ADMIN_ACTION_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="Удалить пользователей", callback_data="admin_user_delete")],
+    [InlineKeyboardButton(text="Добавить пользователей", callback_data="admin_user_add")],
+])
+
+
 def admin_action_keyboard() -> InlineKeyboardMarkup:
-    try:
-        rows = []
-        rows.append([InlineKeyboardButton(text="Удалить пользователя", callback_data=f"admin_user_delete")])
-        rows.append([InlineKeyboardButton(text="Добавить пользователя", callback_data=f"admin_user_add")])
-        return InlineKeyboardMarkup(inline_keyboard=rows)
-    except:
-        return InlineKeyboardMarkup(inline_keyboard=[[
-            InlineKeyboardButton(text="❌ Ошибка загрузки", callback_data="error_scenarios")
-        ]])
\ No newline at end of file
+    """Действия администратора; один неизменяемый объект на весь процесс"""
+    return ADMIN_ACTION_KEYBOARD
+
+def admin_users_keyboard(first_id: int | None, last_id: int | None,
+                         has_prev: bool, has_next: bool) -> InlineKeyboardMarkup:
+    """
+    Клавиатура списка пользователей: навигация по страницам и действия админа
+    Курсоры страниц передаются в callback_data как id первого/последнего пользователя
+    """
+    rows = []
+    nav = []
+    if has_prev:
+        nav.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"admin_users_prev_{first_id}"))
+    if has_next:
+        nav.append(InlineKeyboardButton(text="Вперед ➡️", callback_data=f"admin_users_next_{last_id}"))
+    if nav:
+        rows.append(nav)
+    rows.extend(admin_action_keyboard().inline_keyboard)
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+BROADCAST_CONFIRM_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="📤 Отправить", callback_data="broadcast_confirm")],
+    [InlineKeyboardButton(text="Отмена", callback_data="broadcast_cancel")],
+])
+
+BROADCAST_STOP_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="⏹ Остановить рассылку", callback_data="broadcast_stop")],
+])
+
+
+def broadcast_confirm_keyboard() -> InlineKeyboardMarkup:
+    """Подтверждение рассылки"""
+    return BROADCAST_CONFIRM_KEYBOARD
+
+
+def broadcast_stop_keyboard() -> InlineKeyboardMarkup:
+    """Остановка идущей рассылки"""
+    return BROADCAST_STOP_KEYBOARD
@@ -1,94 +1,86 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-import os
-import json
-from bot.config import SCENARIOS_DIR
+from bot.utils.scenario_registry import scenario_registry, Scenario
 from bot.utils.sorter import natural_sort_key
 
 
 
+GO_TO_MENU_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[[
+    InlineKeyboardButton(text="Меню", callback_data="go_to_menu")
+]])
+
+
 def go_to_menu_keyboard() -> InlineKeyboardMarkup:
-    try:
-        rows = []
-        rows.append([InlineKeyboardButton(text="Меню", callback_data=f"go_to_menu")])
-        return InlineKeyboardMarkup(inline_keyboard=rows)
-    except:
-        return InlineKeyboardMarkup(inline_keyboard=[[
-            InlineKeyboardButton(text="❌ Ошибка загрузки", callback_data="error_scenarios")
-        ]])
+    """Кнопка возврата в меню; один неизменяемый объект на весь процесс"""
+    return GO_TO_MENU_KEYBOARD
+
+# Готовое меню и отпечаток каталога сценариев, для которого оно собрано
+_menu_cache: tuple[tuple, InlineKeyboardMarkup] | None = None
+
+NO_SCENARIOS_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[[
+    InlineKeyboardButton(text="❌ Нет сценариев", callback_data="no_scenarios")
+]])
+
 
 def create_menu_scenarios_list_keyboard() -> InlineKeyboardMarkup:
     """
     Создает клавиатуру со списком всех доступных сценариев
-    Кнопки по одной в ряд, отсортированные по алфавиту
+    Кнопки по одной в ряд, отсортированные по алфавиту.
+    Собранное меню кэшируется до изменения файлов в каталоге сценариев
     """
+    global _menu_cache
     try:
-        if not os.path.exists(SCENARIOS_DIR):
-            os.makedirs(SCENARIOS_DIR)
-            return InlineKeyboardMarkup(inline_keyboard=[[
-                InlineKeyboardButton(text="❌ Нет сценариев", callback_data="no_scenarios")
-            ]])
-
-        files = os.listdir(SCENARIOS_DIR)
-        json_files = [f for f in files if f.endswith('.json')]
-
-        if not json_files:
-            return InlineKeyboardMarkup(inline_keyboard=[[
-                InlineKeyboardButton(text="❌ Нет сценариев", callback_data="no_scenarios")
-            ]])
+        scenario_registry.refresh_if_changed()
+        signature = scenario_registry.signature
+        if _menu_cache is not None and _menu_cache[0] == signature:
+            return _menu_cache[1]
 
-        scenarios_data = []
+        keyboard = build_menu_scenarios_list_keyboard(scenario_registry.all())
+        _menu_cache = (signature, keyboard)
+        return keyboard
 
-        for file in json_files:
-            scenario_name = file.replace('.json', '')
-            file_path = os.path.join(SCENARIOS_DIR, file)
-
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    scenario_data = json.load(f)
+    except Exception as e:
+        print(f"Ошибка при создании клавиатуры сценариев: {e}")
+        return InlineKeyboardMarkup(inline_keyboard=[[
+            InlineKeyboardButton(text="❌ Ошибка загрузки", callback_data="error_scenarios")
+        ]])
 
-                display_name = scenario_data.get('name', scenario_name)
 
-                if len(display_name) > 30:
-                    display_name = display_name[:27] + "..."
+def build_menu_scenarios_list_keyboard(scenarios: list[Scenario]) -> InlineKeyboardMarkup:
+    """Собирает меню из загруженных сценариев"""
+    if not scenarios:
+        return NO_SCENARIOS_KEYBOARD
 
-            except (json.JSONDecodeError, KeyError, Exception) as e:
-                # Если не удалось загрузить JSON, используем имя файла
-                print(f"Ошибка загрузки сценария {file}: {e}")
-                display_name = scenario_name
-                if len(display_name) > 30:
-                    display_name = display_name[:27] + "..."
+    scenarios_data = []
 
-            # Сохраняем данные для сортировки
-            scenarios_data.append({
-                'file_name': scenario_name,
-                'display_name': display_name
-            })
+    for scenario in scenarios:
+        display_name = scenario.name or scenario.key
 
-        scenarios_data.sort(key=lambda x: natural_sort_key(x['display_name']))
+        if len(display_name) > 30:
+            display_name = display_name[:27] + "..."
 
+        # Сохраняем данные для сортировки
+        scenarios_data.append({
+            'file_name': scenario.key,
+            'display_name': display_name
+        })
 
+    scenarios_data.sort(key=lambda x: natural_sort_key(x['display_name']))
 
-        rows = []
+    rows = []
 
+    rows.append([
+        InlineKeyboardButton(text="📝 Содержание программы", callback_data="programm_list")
+    ])
+    for scenario in scenarios_data:
         rows.append([
-            InlineKeyboardButton(text="📝 Содержание программы", callback_data="programm_list")
+            InlineKeyboardButton(
+                text=f"📄 {scenario['display_name']}",
+                callback_data=f"start_scenario_{scenario['file_name']}"
+            )
         ])
-        for scenario in scenarios_data:
-            rows.append([
-                InlineKeyboardButton(
-                    text=f"📄 {scenario['display_name']}",
-                    callback_data=f"start_scenario_{scenario['file_name']}"
-                )
-            ])
 
-        # rows.append([
-        #     InlineKeyboardButton(text="🔄 Обновить список", callback_data="refresh_scenarios")
-        # ])
+    # rows.append([
+    #     InlineKeyboardButton(text="🔄 Обновить список", callback_data="refresh_scenarios")
+    # ])
 
-        return InlineKeyboardMarkup(inline_keyboard=rows)
-
-    except Exception as e:
-        print(f"Ошибка при создании клавиатуры сценариев: {e}")
-        return InlineKeyboardMarkup(inline_keyboard=[[
-            InlineKeyboardButton(text="❌ Ошибка загрузки", callback_data="error_scenarios")
-        ]])
\ No newline at end of file
+    return InlineKeyboardMarkup(inline_keyboard=rows)
@@ -1,27 +1,43 @@
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from functools import lru_cache
 
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardRemove
 
-def create_theory_keyboard(step_index: int, button_text: str = "Дальше") -> InlineKeyboardMarkup:
+from bot.keyboards.menu_keyboards import go_to_menu_keyboard
+from bot.utils.callback_codec import encode, OP_NEXT, OP_ANSWER, OP_BRANCH, OP_SURVEY, OP_CONTINUE
+from bot.utils.scenario_registry import (
+    Scenario, Step, Theory, Practice, Branch, BranchWithInput, Survey, TextAnswer
+)
+
+# Разметка aiogram неизменяема, поэтому один объект можно отдавать всем пользователям
+REPLY_KEYBOARD_REMOVE = ReplyKeyboardRemove()
+
+# Клавиатуры шагов по (id сценария, версия) -> кортеж клавиатур по индексу шага
+_step_keyboards: dict[tuple[str, str], tuple] = {}
+
+
+def create_theory_keyboard(version: str, step_index: int, button_text: str = "Дальше") -> InlineKeyboardMarkup:
     """
     Создает клавиатуру для теоретического блока
+    :param version: версия сценария
     :param step_index: индекс текущего шага
     :param button_text: текст кнопки (по умолчанию "Дальше")
     """
     button = InlineKeyboardButton(
         text=button_text,
-        callback_data=f"next_{step_index + 1}"
+        callback_data=encode(OP_NEXT, version, step_index)
     )
     return InlineKeyboardMarkup(inline_keyboard=[[button]])
 
 
-def create_practice_keyboard(buttons: list, step_index: int) -> InlineKeyboardMarkup:
+def create_practice_keyboard(version: str, buttons: list, step_index: int) -> InlineKeyboardMarkup:
     keyboard_buttons = []
 
-    for btn in buttons:
+    # В callback_data только индекс кнопки: подпись может не уместиться в 64 байта
+    for i, btn in enumerate(buttons):
         keyboard_buttons.append(
             InlineKeyboardButton(
                 text=btn,
-                callback_data=f"answer_{step_index}_{btn}"
+                callback_data=encode(OP_ANSWER, version, step_index, i)
             )
         )
 
@@ -29,14 +45,14 @@ def create_practice_keyboard(buttons: list, step_index: int) -> InlineKeyboardMa
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
-def create_branch_keyboard(options: list, step_index: int) -> InlineKeyboardMarkup:
+def create_branch_keyboard(version: str, options: list, step_index: int) -> InlineKeyboardMarkup:
     keyboard_buttons = []
 
-    for i, option in enumerate(options, 1):
+    for i, option in enumerate(options):
         keyboard_buttons.append(
             InlineKeyboardButton(
-                text=option['text'],
-                callback_data=f"branch_{step_index}_{i}"
+                text=option.text,
+                callback_data=encode(OP_BRANCH, version, step_index, i)
             )
         )
 
@@ -44,15 +60,15 @@ def create_branch_keyboard(options: list, step_index: int) -> InlineKeyboardMark
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
-def create_survey_keyboard(buttons: list, step_index: int) -> InlineKeyboardMarkup:
+def create_survey_keyboard(version: str, buttons: list, step_index: int) -> InlineKeyboardMarkup:
     """Клавиатура для опросов без проверки правильности"""
     keyboard_buttons = []
 
-    for btn in buttons:
+    for i, btn in enumerate(buttons):
         keyboard_buttons.append(
             InlineKeyboardButton(
                 text=btn,
-                callback_data=f"survey_{step_index}_{btn}"
+                callback_data=encode(OP_SURVEY, version, step_index, i)
             )
         )
 
@@ -61,10 +77,59 @@ def create_survey_keyboard(buttons: list, step_index: int) -> InlineKeyboardMark
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
-def create_continue_keyboard(next_step_index: int) -> InlineKeyboardMarkup:
+def create_continue_keyboard(version: str, next_step_index: int) -> InlineKeyboardMarkup:
     """Клавиатура для продолжения после branch"""
     button = InlineKeyboardButton(
         text="Дальше",
-        callback_data=f"con_branch_{next_step_index}"
+        callback_data=encode(OP_CONTINUE, version, next_step_index)
     )
-    return InlineKeyboardMarkup(inline_keyboard=[[button]])
\ No newline at end of file
+    return InlineKeyboardMarkup(inline_keyboard=[[button]])
+
+
+@lru_cache(maxsize=1024)
+def get_continue_keyboard(version: str, next_step_index: int) -> InlineKeyboardMarkup:
+    """Общая для всех клавиатура продолжения после branch"""
+    return create_continue_keyboard(version, next_step_index)
+
+
+def build_step_keyboard(step: Step, step_index: int, version: str):
+    """Клавиатура для шага сценария; зависит только от содержимого шага, его индекса и версии сценария"""
+    if isinstance(step, Theory):
+        if step.is_final:
+            return go_to_menu_keyboard()
+        return create_theory_keyboard(version, step_index, step.button_text)
+    elif isinstance(step, Practice):
+        return create_practice_keyboard(version, step.buttons, step_index)
+    elif isinstance(step, (Branch, BranchWithInput)):
+        return create_branch_keyboard(version, step.options, step_index)
+    elif isinstance(step, Survey):
+        return create_survey_keyboard(version, step.buttons, step_index)
+    elif isinstance(step, TextAnswer):
+        return REPLY_KEYBOARD_REMOVE
+    return None
+
+
+def build_scenario_keyboards(scenario: Scenario) -> tuple:
+    """Строит и кэширует клавиатуры всех шагов сценария"""
+    keyboards = tuple(build_step_keyboard(step, i, scenario.version) for i, step in enumerate(scenario.steps))
+    _step_keyboards[(scenario.key, scenario.version)] = keyboards
+    return keyboards
+
+
+def warm_scenario_keyboards(scenarios: list[Scenario]):
+    """Заранее строит клавиатуры для загруженных сценариев и выбрасывает устаревшие"""
+    actual = {(scenario.key, scenario.version) for scenario in scenarios}
+    for cache_key in list(_step_keyboards):
+        if cache_key not in actual:
+            del _step_keyboards[cache_key]
+    for scenario in scenarios:
+        if (scenario.key, scenario.version) not in _step_keyboards:
+            build_scenario_keyboards(scenario)
+
+
+def get_step_keyboard(scenario: Scenario, step_index: int):
+    """Готовая клавиатура шага; строится один раз на версию сценария"""
+    keyboards = _step_keyboards.get((scenario.key, scenario.version))
+    if keyboards is None:
+        keyboards = build_scenario_keyboards(scenario)
+    return keyboards[step_index]
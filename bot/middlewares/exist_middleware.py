@@ -1,80 +1,87 @@
 from aiogram import BaseMiddleware
 from aiogram.types import Update
 from typing import Callable, Dict, Any, Awaitable
-import json
 import os
+import time
 from bot.config import USERS_DIR
+from bot.middlewares.whitelist_store import WhitelistStore, OP_ADD_USER, OP_REMOVE_USER, OP_ADD_ADMIN
 
 class ExistMiddleware(BaseMiddleware):
-    def __init__(self, whitelist_file: str = "whitelist.json"):
+    def __init__(self, whitelist_file: str = "whitelist.json", check_interval: float = 1.0):
         # Создаем директорию если не существует
         os.makedirs(USERS_DIR, exist_ok=True)
-        self.whitelist_file = f"{USERS_DIR}/{whitelist_file}"
-        self._ensure_whitelist_file()
+        self.whitelist_file = os.path.join(USERS_DIR, whitelist_file)
+
+        # Индекс белого списка в памяти; изменения пишутся в журнал хранилища
+        self.store = WhitelistStore(self.whitelist_file)
+
+        # Ручную правку файла и записи других процессов бота подхватываем по отпечаткам
+        # снапшота и журнала, не чаще раза в check_interval
+        self.check_interval = check_interval
+        self._next_check = time.monotonic() + check_interval
         print(f"Middleware инициализирован. Файл белого списка: {self.whitelist_file}")
 
-    def _ensure_whitelist_file(self):
-        """Создает файл с белым списком, если он не существует"""
-        if not os.path.exists(self.whitelist_file):
-            with open(self.whitelist_file, 'w', encoding='utf-8') as f:
-                json.dump({"whitelist": [], "admin_ids": []}, f, ensure_ascii=False, indent=2)
-            print(f"Создан файл белого списка: {self.whitelist_file}")
-
-    def _load_whitelist(self) -> dict:
-        """Загружает белый список из JSON файла"""
-        try:
-            with open(self.whitelist_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError) as e:
-            print(f"Ошибка загрузки белого списка: {e}")
-            return {"whitelist": [], "admin_ids": []}
-
-    def _save_whitelist(self, data: dict):
-        """Сохраняет белый список в JSON файл"""
-        with open(self.whitelist_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-
-    def get_whitelist(self) -> set[int]:
+    def _refresh_cache(self):
+        """Подхватывает изменения белого списка, сделанные вручную или другим процессом"""
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        self.store.refresh()
+
+    def get_whitelist(self) -> frozenset[int]:
         """Возвращает множество ID пользователей из белого списка"""
-        data = self._load_whitelist()
-        return set(data.get("whitelist", []))
+        self._refresh_cache()
+        return frozenset(self.store.users)
 
-    def get_admin_ids(self) -> set[int]:
+    def get_admin_ids(self) -> frozenset[int]:
         """Возвращает множество ID администраторов"""
-        data = self._load_whitelist()
-        return set(data.get("admin_ids", []))
+        self._refresh_cache()
+        return frozenset(self.store.admins)
+
+    def is_whitelisted(self, user_id: int) -> bool:
+        """Проверяет, есть ли пользователь в белом списке"""
+        self._refresh_cache()
+        return user_id in self.store.users
+
+    def is_admin(self, user_id: int) -> bool:
+        """Проверяет, является ли пользователь администратором"""
+        self._refresh_cache()
+        return user_id in self.store.admins
 
     def add_to_whitelist(self, user_id: int):
         """Добавляет пользователя в белый список"""
-        data = self._load_whitelist()
-        whitelist = data.get("whitelist", [])
-
-        if user_id not in whitelist:
-            whitelist.append(user_id)
-            data["whitelist"] = whitelist
-            self._save_whitelist(data)
+        if self.store.apply([(OP_ADD_USER, user_id)]):
             print(f"Пользователь {user_id} добавлен в белый список")
 
     def remove_from_whitelist(self, user_id: int):
         """Удаляет пользователя из белого списка"""
-        data = self._load_whitelist()
-        whitelist = data.get("whitelist", [])
-
-        if user_id in whitelist:
-            whitelist.remove(user_id)
-            data["whitelist"] = whitelist
-            self._save_whitelist(data)
+        if self.store.apply([(OP_REMOVE_USER, user_id)]):
             print(f"Пользователь {user_id} удален из белого списка")
 
+    def add_many_to_whitelist(self, user_ids: list[int]) -> int:
+        """Добавляет пачку пользователей одной записью в журнал; возвращает число добавленных"""
+        added = self.store.apply([(OP_ADD_USER, user_id) for user_id in user_ids])
+        if added:
+            print(f"В белый список добавлено пользователей: {added}")
+        return added
+
+    def remove_many_from_whitelist(self, user_ids: list[int]) -> int:
+        """Удаляет пачку пользователей одной записью в журнал; возвращает число удаленных"""
+        removed = self.store.apply([(OP_REMOVE_USER, user_id) for user_id in user_ids])
+        if removed:
+            print(f"Из белого списка удалено пользователей: {removed}")
+        return removed
+
+    def get_whitelist_page(self, after: int | None = None, before: int | None = None,
+                           limit: int = 50) -> tuple[int, list[int], bool, bool]:
+        """Страница белого списка по курсору (см. WhitelistStore.users_page)"""
+        self._refresh_cache()
+        return self.store.users_page(after=after, before=before, limit=limit)
+
     def add_admin(self, user_id: int):
         """Добавляет администратора"""
-        data = self._load_whitelist()
-        admin_ids = data.get("admin_ids", [])
-
-        if user_id not in admin_ids:
-            admin_ids.append(user_id)
-            data["admin_ids"] = admin_ids
-            self._save_whitelist(data)
+        if self.store.apply([(OP_ADD_ADMIN, user_id)]):
             print(f"Пользователь {user_id} добавлен как администратор")
 
     async def __call__(
@@ -89,9 +96,10 @@ class ExistMiddleware(BaseMiddleware):
         if user_id is None:
             return await handler(event, data)
 
-        # Получаем актуальный белый список
-        whitelist = self.get_whitelist()
-        admin_ids = self.get_admin_ids()
+        # Получаем актуальный белый список (индекс в памяти, без чтения файла)
+        self._refresh_cache()
+        whitelist = self.store.users
+        admin_ids = self.store.admins
 
 
         # Проверяем доступ (админы всегда имеют доступ)
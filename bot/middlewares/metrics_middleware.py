@@ -0,0 +1,155 @@
+"""
+Сбор метрик обработки обновлений (см. bot/utils/metrics.py).
+
+UpdateMetricsMiddleware - внешний middleware вместо ExistMiddleware: он
+оборачивает проверку доступа и меряет ее отдельно от остальной обработки,
+а также считает обновления в работе и полное время обработки.
+HandlerMetricsMiddleware - внутренний middleware диспетчера: время и ошибки
+каждого обработчика с именем его роутера (для нажатий на кнопки - обработчика
+из таблицы bot/handlers/callback_handler.py).
+ApiMetricsMiddleware - middleware сессии бота: время и ошибки запросов к
+Bot API. Подключается после общей очереди, поэтому меряет сам запрос, а
+ожидание в очереди видно в bot_outbound_wait_seconds.
+"""
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramAPIError
+from aiogram.methods import Response, TelegramMethod
+from aiogram.types import Update
+
+from bot.middlewares.outbound_queue import outbound_queue, WAIT_BUCKETS, PRIORITY_NAMES
+from bot.middlewares.user_order import user_order
+from bot.utils.metrics import (
+    metrics, updates_in_flight, update_duration, access_check_duration, handler_duration, handler_errors,
+    api_duration, api_errors,
+)
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """
+    Args:
+        access_check: Middleware проверки доступа, время которого меряется отдельно
+    """
+
+    def __init__(self, access_check: BaseMiddleware | None = None):
+        self.access_check = access_check
+
+    async def __call__(
+            self,
+            handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+            event: Update,
+            data: Dict[str, Any]
+    ) -> Any:
+        started = time.perf_counter()
+        updates_in_flight.inc()
+        try:
+            if self.access_check is None:
+                return await handler(event, data)
+
+            checked_at = None
+
+            async def after_check(event: Update, data: Dict[str, Any]) -> Any:
+                nonlocal checked_at
+                checked_at = time.perf_counter()
+                return await handler(event, data)
+
+            try:
+                return await self.access_check(after_check, event, data)
+            finally:
+                # Если доступа нет, проверка длится до конца (включая ответ "нет доступа")
+                access_check_duration.observe((checked_at or time.perf_counter()) - started)
+        finally:
+            updates_in_flight.dec()
+            update_duration.observe(time.perf_counter() - started, _update_type(event))
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    async def __call__(
+            self,
+            handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+            event: Any,
+            data: Dict[str, Any]
+    ) -> Any:
+        route = data.get("callback_route")
+        if route is not None:
+            # Нажатие на кнопку: меряем обработчик из таблицы, а не общий dispatch_callback
+            name, router_name = route.name, route.router
+        else:
+            handler_object = data.get("handler")
+            name = handler_object.callback.__name__ if handler_object is not None else "unknown"
+            router = data.get("event_router")
+            router_name = router.name if router is not None else "unknown"
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(1, router_name, name)
+            raise
+        finally:
+            handler_duration.observe(time.perf_counter() - started, router_name, name)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot,
+                       method: TelegramMethod) -> Response:
+        name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramAPIError as e:
+            api_errors.inc(1, name, type(e).__name__)
+            raise
+        finally:
+            api_duration.observe(time.perf_counter() - started, name)
+
+
+def _update_type(event: Update) -> str:
+    try:
+        return event.event_type
+    except Exception:
+        return "unknown"
+
+
+# --- общая очередь исходящих запросов ---
+
+outbound_depth = metrics.gauge("bot_outbound_queue_depth", "Запросы в очереди исходящих", ("priority",))
+outbound_in_flight = metrics.gauge("bot_outbound_in_flight", "Выполняющиеся исходящие запросы")
+outbound_sent = metrics.counter("bot_outbound_sent_total", "Выполненные исходящие запросы")
+outbound_retries = metrics.counter("bot_outbound_retries_total", "Повторы исходящих запросов после 429")
+outbound_failed = metrics.counter("bot_outbound_failed_total", "Исходящие запросы, завершившиеся ошибкой")
+outbound_wait = metrics.histogram("bot_outbound_wait_seconds", "Ожидание запроса в очереди исходящих",
+                                  buckets=WAIT_BUCKETS)
+
+
+@metrics.collector
+def collect_outbound_queue():
+    for priority, depth in enumerate(outbound_queue.depth):
+        outbound_depth.set(depth, PRIORITY_NAMES[priority])
+    outbound_in_flight.set(outbound_queue.in_flight)
+    outbound_sent.set(outbound_queue.sent)
+    outbound_retries.set(outbound_queue.retries)
+    outbound_failed.set(outbound_queue.failed)
+    outbound_wait.set_counts(outbound_queue.wait_histogram, outbound_queue.wait_sum)
+
+
+# --- очередность обновлений пользователя ---
+
+users_in_flight = metrics.gauge("bot_users_in_flight", "Пользователи, чьи обновления ждут или обрабатываются")
+updates_waited = metrics.counter("bot_updates_waited_total", "Обновления, ждавшие предыдущих обновлений пользователя")
+updates_suppressed = metrics.counter("bot_updates_suppressed_total", "Обновления, не переданные обработчикам",
+                                     ("reason",))
+
+
+@metrics.collector
+def collect_user_order():
+    users_in_flight.set(user_order.active_users)
+    updates_waited.set(user_order.waited)
+    updates_suppressed.set(user_order.duplicates, "duplicate")
+    updates_suppressed.set(user_order.dropped, "overflow")
+
+
+handler_metrics = HandlerMetricsMiddleware()
+api_metrics = ApiMetricsMiddleware()
@@ -0,0 +1,276 @@
+"""
+Общая очередь исходящих запросов к Bot API (middleware сессии бота).
+
+Все вызовы бота (message.answer, answer_photo, edit_reply_markup,
+bot.send_message, ...) проходят через одну очередь процесса:
+  * запросы в один чат выполняются строго по очереди (FIFO), по одному;
+  * общая скорость ограничена ведром токенов;
+  * на 429 вся очередь ждет retry_after, а запрос повторяется, и обработчик
+    получает ответ, а не исключение;
+  * среди готовых чатов первым идет запрос с более высоким приоритетом:
+    ответы на нажатия кнопок, затем обычные ответы, затем массовые рассылки;
+  * при остановке очередь дожидается отправки накопленного (не дольше
+    таймаута), оставшиеся запросы завершаются ошибкой OutboundQueueClosed.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Hashable
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+
+from bot.config import OUTBOUND_RATE, OUTBOUND_CONCURRENCY, WORKERS
+from bot.utils.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BULK = 2
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_NORMAL: "normal", PRIORITY_BULK: "bulk"}
+
+# Приоритет запросов текущей задачи; рассылки выставляют PRIORITY_BULK
+outbound_priority: ContextVar[int | None] = ContextVar("outbound_priority", default=None)
+
+# Методы, которые не относятся к чатам и не должны ждать в очереди (long polling и настройка бота)
+PASSTHROUGH_METHODS = frozenset({
+    "getUpdates", "getMe", "setWebhook", "deleteWebhook", "getWebhookInfo", "getFile", "close", "logOut",
+})
+
+# Верхние границы корзин гистограммы ожидания в очереди, в секундах
+WAIT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+@contextmanager
+def bulk_traffic():
+    """Запросы внутри блока (и в созданных в нем задачах) идут с низшим приоритетом"""
+    token = outbound_priority.set(PRIORITY_BULK)
+    try:
+        yield
+    finally:
+        outbound_priority.reset(token)
+
+
+class OutboundQueueClosed(RuntimeError):
+    """Запрос не отправлен: очередь остановлена вместе с ботом"""
+
+
+@dataclass(slots=True)
+class OutboundRequest:
+    make_request: NextRequestMiddlewareType
+    bot: Bot
+    method: TelegramMethod
+    priority: int
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+
+
+class OutboundQueue(BaseRequestMiddleware):
+    """
+    Args:
+        rate: Общий лимит запросов в секунду (0 - без ограничения)
+        max_in_flight: Сколько запросов выполняется одновременно
+        max_retries: Сколько раз повторять запрос после 429
+    """
+
+    def __init__(self, rate: float = 30.0, max_in_flight: int = 32, max_retries: int = 5):
+        self.bucket: TokenBucket | None = None
+        self.set_rate(rate)
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+
+        # Очереди запросов по чатам; в куче готовых лежат чаты, голова которых ждет отправки
+        self._chats: dict[Hashable, deque[OutboundRequest]] = {}
+        self._ready: list[tuple[int, int, Hashable]] = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._slots: asyncio.Semaphore | None = None
+        self._task: asyncio.Task | None = None
+        # Выполняющиеся запросы и признак пустой очереди (его ждет close)
+        self._executing: set[asyncio.Task] = set()
+        self._drained = asyncio.Event()
+        self._drained.set()
+
+        # Метрики
+        self.depth = [0] * len(PRIORITY_NAMES)
+        self.in_flight = 0
+        self.sent = 0
+        self.retries = 0
+        self.failed = 0
+        self.wait_count = 0
+        self.wait_sum = 0.0
+        self.wait_max = 0.0
+        self.wait_histogram = [0] * (len(WAIT_BUCKETS) + 1)
+
+    def set_rate(self, rate: float):
+        """Меняет общий лимит запросов в секунду (0 - без ограничения)"""
+        self.bucket = TokenBucket(rate) if rate > 0 else None
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot,
+                       method: TelegramMethod) -> Response:
+        if method.__api_method__ in PASSTHROUGH_METHODS:
+            return await make_request(bot, method)
+
+        if self._task is None or self._task.done():
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+            self._task = asyncio.create_task(self._dispatch_loop())
+
+        priority = outbound_priority.get()
+        if priority is None:
+            priority = PRIORITY_INTERACTIVE if method.__api_method__ == "answerCallbackQuery" else PRIORITY_NORMAL
+        request = OutboundRequest(make_request, bot, method, priority, asyncio.get_running_loop().create_future())
+
+        # Запросы без чата (например, ответ на callback) не ждут друг друга
+        chat_id = getattr(method, "chat_id", None)
+        key = (bot.id, chat_id) if chat_id is not None else object()
+        queue = self._chats.get(key)
+        if queue is None:
+            queue = self._chats[key] = deque()
+        queue.append(request)
+        self.depth[priority] += 1
+        self._drained.clear()
+        if len(queue) == 1:
+            self._push_ready(key, request)
+
+        return await request.future
+
+    def _push_ready(self, key: Hashable, request: OutboundRequest):
+        heapq.heappush(self._ready, (request.priority, next(self._seq), key))
+        self._wakeup.set()
+
+    async def _dispatch_loop(self):
+        while True:
+            while not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            await self._slots.acquire()
+            if self.bucket is not None:
+                await self.bucket.acquire()
+            if not self._ready:
+                self._slots.release()
+                continue
+            # Выбираем после получения токена: за время ожидания мог прийти более важный запрос
+            _, _, key = heapq.heappop(self._ready)
+            request = self._chats[key][0]
+            if request.future.cancelled():
+                # Обработчик уже не ждет ответа
+                self._slots.release()
+                self._finish(key, request)
+                continue
+            self._record_wait(time.monotonic() - request.enqueued_at)
+            self.in_flight += 1
+            task = asyncio.create_task(self._execute(key, request))
+            self._executing.add(task)
+            task.add_done_callback(self._executing.discard)
+
+    async def _execute(self, key: Hashable, request: OutboundRequest):
+        try:
+            while True:
+                try:
+                    response = await request.make_request(request.bot, request.method)
+                except TelegramRetryAfter as e:
+                    request.attempts += 1
+                    if request.attempts > self.max_retries:
+                        self.failed += 1
+                        _resolve(request.future, exception=e)
+                        return
+                    # Лимит общий для бота: придерживаем всю очередь, а не только этот чат
+                    self.retries += 1
+                    if self.bucket is not None:
+                        self.bucket.pause(e.retry_after)
+                        await self.bucket.acquire()
+                    else:
+                        await asyncio.sleep(e.retry_after)
+                    continue
+                except Exception as e:
+                    self.failed += 1
+                    _resolve(request.future, exception=e)
+                    return
+                self.sent += 1
+                _resolve(request.future, result=response)
+                return
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+            self._finish(key, request)
+
+    def _finish(self, key: Hashable, request: OutboundRequest):
+        """Убирает запрос из очереди чата и ставит в очередь следующий"""
+        queue = self._chats[key]
+        queue.popleft()
+        self.depth[request.priority] -= 1
+        if queue:
+            self._push_ready(key, queue[0])
+        else:
+            del self._chats[key]
+            if not self._chats:
+                self._drained.set()
+
+    def _record_wait(self, seconds: float):
+        self.wait_count += 1
+        self.wait_sum += seconds
+        self.wait_max = max(self.wait_max, seconds)
+        self.wait_histogram[bisect_left(WAIT_BUCKETS, seconds)] += 1
+
+    def metrics(self) -> dict[str, Any]:
+        """Глубина очереди, время ожидания и счетчики запросов"""
+        return {
+            "depth": sum(self.depth),
+            "depth_by_priority": {PRIORITY_NAMES[p]: count for p, count in enumerate(self.depth)},
+            "in_flight": self.in_flight,
+            "sent": self.sent,
+            "retries": self.retries,
+            "failed": self.failed,
+            "wait_avg": self.wait_sum / self.wait_count if self.wait_count else 0.0,
+            "wait_max": self.wait_max,
+        }
+
+    async def close(self, timeout: float = 5.0):
+        """
+        Останавливает очередь: ждет отправки накопленных запросов (не дольше timeout),
+        оставшиеся завершает ошибкой OutboundQueueClosed, чтобы их не ждали вечно
+        """
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._drained.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Очередь исходящих остановлена, не отправлено запросов: {sum(self.depth)}")
+
+        self._task.cancel()
+        self._task = None
+        for queue in self._chats.values():
+            for request in queue:
+                _resolve(request.future, exception=OutboundQueueClosed("Очередь исходящих запросов остановлена"))
+        executing = list(self._executing)
+        for task in executing:
+            task.cancel()
+        await asyncio.gather(*executing, return_exceptions=True)
+        self._chats.clear()
+        self._ready.clear()
+        self.depth = [0] * len(PRIORITY_NAMES)
+        self._drained.set()
+
+
+def _resolve(future: asyncio.Future, result: Any = None, exception: BaseException | None = None):
+    if future.done():
+        return
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+
+
+# В режиме нескольких процессов общий лимит делится между ними
+outbound_queue = OutboundQueue(rate=OUTBOUND_RATE / max(1, WORKERS), max_in_flight=OUTBOUND_CONCURRENCY)
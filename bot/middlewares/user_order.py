@@ -0,0 +1,116 @@
+"""
+Обработка обновлений одного пользователя по порядку (внешний middleware диспетчера).
+
+aiogram обрабатывает обновления параллельными задачами: двойное нажатие
+"Дальше" или нажатие во время загрузки картинки запускало обработчик шага
+дважды, вызовы state.update_data перемежались, и шаг уходил два раза.
+Здесь обновления одного пользователя выполняются строго по очереди (FIFO):
+  * замок есть только у пользователей, чьи обновления ждут или выполняются;
+    когда их не остается, запись удаляется, и память не растет с числом
+    пользователей;
+  * у пользователя ждет не больше max_pending обновлений, лишние
+    отбрасываются (на нажатие кнопки сразу отвечаем);
+  * повторное нажатие той же кнопки того же сообщения (message_id и
+    callback_data), пока первое ждет или выполняется, обработчику не
+    передается: на него сразу отвечаем, шаг второй раз не отправляется.
+Нажатия на кнопки уже пройденных шагов отсекает resolve_callback_step
+(bot/handlers/scenario_handler.py) по курсору шага в сессии.
+
+Middleware подключается до FSM-middleware aiogram (см. create_dispatcher
+в main.py): состояние пользователя читается только под замком, иначе
+ждавшее обновление получило бы raw_state, прочитанное до предыдущего.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import Update, CallbackQuery
+
+from bot.config import USER_MAX_PENDING
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class UserSlot:
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    pending: int = 0  # обновления пользователя, которые ждут или выполняются
+
+
+class UserOrderMiddleware(BaseMiddleware):
+    """
+    Args:
+        max_pending: Сколько обновлений одного пользователя может ждать и выполняться
+    """
+
+    def __init__(self, max_pending: int = 8):
+        self.max_pending = max_pending
+        self._slots: dict[int, UserSlot] = {}
+        # Нажатия в работе: (чат, сообщение, callback_data)
+        self._clicks: set[tuple[int, int, str]] = set()
+
+        # Метрики
+        self.waited = 0
+        self.duplicates = 0
+        self.dropped = 0
+
+    @property
+    def active_users(self) -> int:
+        return len(self._slots)
+
+    async def __call__(
+            self,
+            handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+            event: Update,
+            data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        callback = event.callback_query
+        click = None
+        if callback is not None and callback.message is not None and callback.data is not None:
+            click = (callback.message.chat.id, callback.message.message_id, callback.data)
+            if click in self._clicks:
+                self.duplicates += 1
+                await self._answer(callback)
+                return None
+
+        slot = self._slots.get(user.id)
+        if slot is None:
+            slot = self._slots[user.id] = UserSlot()
+        elif slot.pending >= self.max_pending:
+            self.dropped += 1
+            if callback is not None:
+                await self._answer(callback)
+            return None
+
+        slot.pending += 1
+        if click is not None:
+            self._clicks.add(click)
+        try:
+            if slot.lock.locked():
+                self.waited += 1
+            async with slot.lock:
+                return await handler(event, data)
+        finally:
+            slot.pending -= 1
+            if click is not None:
+                self._clicks.discard(click)
+            if not slot.pending:
+                del self._slots[user.id]
+
+    @staticmethod
+    async def _answer(callback: CallbackQuery):
+        """Отвечает на нажатие, которое не передается обработчику (убирает часы на кнопке)"""
+        try:
+            await callback.answer()
+        except TelegramAPIError as e:
+            logger.warning(f"Не удалось ответить на нажатие {callback.id}: {e}")
+
+
+user_order = UserOrderMiddleware(USER_MAX_PENDING)
@@ -0,0 +1,334 @@
+import bisect
+import json
+import os
+import struct
+import threading
+import zlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: межпроцессной блокировки нет, файлы использует один процесс
+    fcntl = None
+
+# Запись журнала фиксированного размера: операция, id пользователя, crc32
+RECORD = struct.Struct("<BqI")
+
+OP_ADD_USER = 1
+OP_REMOVE_USER = 2
+OP_ADD_ADMIN = 3
+OP_REMOVE_ADMIN = 4
+
+
+class WhitelistStore:
+    """
+    Хранилище белого списка: снапшот в JSON + журнал изменений только на дозапись.
+
+    Каждое изменение дописывает в журнал одну запись фиксированного размера,
+    индекс в памяти хранится во множествах, поэтому изменение стоит O(1).
+    Когда журнал разрастается, он в фоне сворачивается в новый снапшот,
+    который атомарно подменяет старый через os.replace.
+    При запуске состояние восстанавливается как снапшот + журнал.
+
+    Файлы могут делить несколько процессов бота: запись и сворачивание идут
+    под файловой блокировкой, а refresh() дочитывает чужие записи из хвоста журнала.
+    """
+
+    def __init__(self, snapshot_file: str, compact_threshold: int = 1000):
+        self.snapshot_file = snapshot_file
+        self.journal_file = f"{os.path.splitext(snapshot_file)[0]}.journal"
+        self.compacting_file = f"{self.journal_file}.compacting"
+        self.lock_file = f"{self.journal_file}.lock"
+        self.compact_threshold = compact_threshold
+
+        self.users: set[int] = set()
+        self.admins: set[int] = set()
+
+        self._lock = threading.Lock()
+        # Какой файл журнала (inode) и сколько его байт уже применено к индексу
+        self._journal_inode: int | None = None
+        self._journal_offset = 0
+        self._compaction: threading.Thread | None = None
+        self._snapshot_stamp: tuple | None = None
+        self._sorted_users: list[int] | None = None
+
+        with self._locked():
+            self._ensure_snapshot()
+            self._load(recover=True)
+
+    @contextmanager
+    def _locked(self):
+        """Блокировка внутри процесса и, где есть fcntl, между процессами"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.lock_file, 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _ensure_snapshot(self):
+        """Создает пустой снапшот, если файла еще нет"""
+        if not os.path.exists(self.snapshot_file):
+            self._write_snapshot(set(), set())
+            print(f"Создан файл белого списка: {self.snapshot_file}")
+
+    def stat_snapshot(self) -> tuple | None:
+        """Отпечаток файла снапшота: inode, mtime и размер"""
+        try:
+            st = os.stat(self.snapshot_file)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def stat_journal(self) -> tuple[int | None, int]:
+        """Inode и размер текущего журнала"""
+        try:
+            st = os.stat(self.journal_file)
+        except FileNotFoundError:
+            return None, 0
+        return st.st_ino, st.st_size
+
+    def refresh(self):
+        """
+        Подхватывает изменения, сделанные не этим процессом: ручную правку
+        снапшота, записи других процессов в журнал или сворачивание журнала
+        """
+        if self._compaction is not None and self._compaction.is_alive():
+            return
+        if (self.stat_snapshot() == self._snapshot_stamp
+                and self.stat_journal() == (self._journal_inode, self._journal_offset)):
+            return
+        with self._locked():
+            self._catch_up()
+
+    def load(self):
+        """Полностью перечитывает снапшот и журналы"""
+        with self._locked():
+            self._load()
+
+    def _catch_up(self):
+        """Догоняет состояние файлов на диске (вызывается под блокировкой)"""
+        inode, size = self.stat_journal()
+        if (self.stat_snapshot() != self._snapshot_stamp or inode != self._journal_inode
+                or size < self._journal_offset):
+            self._load()
+        elif size > self._journal_offset:
+            with open(self.journal_file, 'rb') as f:
+                f.seek(self._journal_offset)
+                tail = f.read(size - self._journal_offset)
+            self._journal_offset += _apply_records(tail, self.users, self.admins)
+            self._sorted_users = None
+
+    def _load(self, recover: bool = False):
+        """Восстанавливает состояние: снапшот, затем журналы в порядке записи"""
+        try:
+            with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, FileNotFoundError) as e:
+            print(f"Ошибка загрузки белого списка: {e}")
+            data = {}
+        self._snapshot_stamp = self.stat_snapshot()
+
+        users = set(data.get("whitelist", []))
+        admins = set(data.get("admin_ids", []))
+
+        # Журнал сворачивания проигрываем первым: операции идемпотентны,
+        # поэтому повтор поверх уже обновленного снапшота безопасен
+        interrupted = os.path.exists(self.compacting_file)
+        if interrupted:
+            with open(self.compacting_file, 'rb') as f:
+                _apply_records(f.read(), users, admins)
+        self._journal_offset = self._replay(self.journal_file, users, admins)
+        self._journal_inode = self.stat_journal()[0]
+
+        self.users = users
+        self.admins = admins
+        self._sorted_users = None
+
+        if interrupted and recover:
+            # Процесс упал посреди сворачивания: доводим его до конца синхронно
+            self._write_snapshot(users, admins)
+            open(self.journal_file, 'wb').close()
+            self._journal_inode, self._journal_offset = self.stat_journal()
+            os.remove(self.compacting_file)
+
+    def _replay(self, path: str, users: set[int], admins: set[int]) -> int:
+        """Применяет записи журнала; обрезает недописанный или поврежденный хвост, возвращает его длину"""
+        if not os.path.exists(path):
+            return 0
+
+        with open(path, 'rb') as f:
+            raw = f.read()
+
+        offset = _apply_records(raw, users, admins)
+        if offset != len(raw):
+            print(f"Журнал {path} обрезан до последней целой записи ({offset // RECORD.size})")
+            with open(path, 'r+b') as f:
+                f.truncate(offset)
+        return offset
+
+    def apply(self, ops: list[tuple[int, int]]) -> int:
+        """
+        Применяет пакет операций одной дозаписью в журнал
+
+        Args:
+            ops: Список пар (операция, id пользователя)
+
+        Returns:
+            int: Количество операций, реально изменивших состояние
+        """
+        with self._locked():
+            # Сначала догоняем записи других процессов, чтобы не записать лишнего
+            self._catch_up()
+
+            changed = []
+            for op, user_id in ops:
+                if _apply_op(op, user_id, self.users, self.admins):
+                    changed.append((op, user_id))
+
+            if not changed:
+                return 0
+            self._sorted_users = None
+
+            chunk = b"".join(_pack_record(op, user_id) for op, user_id in changed)
+            with open(self.journal_file, 'ab') as journal:
+                journal.write(chunk)
+                journal.flush()
+                os.fsync(journal.fileno())
+            self._journal_inode = os.stat(self.journal_file).st_ino
+            self._journal_offset += len(chunk)
+
+            if self._journal_offset >= self.compact_threshold * RECORD.size:
+                self._start_compaction()
+
+        return len(changed)
+
+    def sorted_users(self) -> list[int]:
+        """Отсортированный индекс пользователей; пересобирается лениво после изменений"""
+        if self._sorted_users is None:
+            self._sorted_users = sorted(self.users)
+        return self._sorted_users
+
+    def users_page(self, after: int | None = None, before: int | None = None,
+                   limit: int = 50) -> tuple[int, list[int], bool, bool]:
+        """
+        Страница пользователей по курсору
+
+        Args:
+            after: Вернуть пользователей с id больше этого (следующая страница)
+            before: Вернуть пользователей с id меньше этого (предыдущая страница)
+            limit: Размер страницы
+
+        Returns:
+            tuple: (позиция первого элемента, id на странице, есть ли предыдущая, есть ли следующая)
+        """
+        index = self.sorted_users()
+        if before is not None:
+            end = bisect.bisect_left(index, before)
+            start = max(0, end - limit)
+        else:
+            start = bisect.bisect_right(index, after) if after is not None else 0
+            end = min(len(index), start + limit)
+        return start, index[start:end], start > 0, end < len(index)
+
+    def _start_compaction(self):
+        """Запускает сворачивание журнала в фоновом потоке (вызывается под блокировкой)"""
+        if self._compaction is not None and self._compaction.is_alive():
+            return
+        self._compaction = threading.Thread(target=self.compact, name="whitelist-compaction", daemon=True)
+        self._compaction.start()
+
+    def compact(self):
+        """Сворачивает журнал в новый снапшот"""
+        with self._locked():
+            self._catch_up()
+            if self._journal_offset == 0 or os.path.exists(self.compacting_file):
+                return
+            users = set(self.users)
+            admins = set(self.admins)
+
+            # Отодвигаем текущий журнал в сторону; следующие записи пойдут в новый файл
+            os.replace(self.journal_file, self.compacting_file)
+            self._journal_inode, self._journal_offset = None, 0
+
+        # Новый снапшот пишется во временный файл без блокировки, изменения продолжают писаться в новый журнал
+        tmp_file = f"{self.compacting_file}.snapshot"
+        _dump_snapshot(tmp_file, users, admins)
+
+        # Подмена снапшота и удаление отодвинутого журнала - под блокировкой: _load другого
+        # процесса видит либо старый снапшот с журналом сворачивания, либо новый снапшот без него
+        with self._locked():
+            if not os.path.exists(self.compacting_file):
+                # Сворачивание уже довел до конца другой процесс (восстановление при запуске),
+                # его снапшот новее нашего
+                os.remove(tmp_file)
+                return
+            os.replace(tmp_file, self.snapshot_file)
+            self._snapshot_stamp = self.stat_snapshot()
+            os.remove(self.compacting_file)
+
+    def _write_snapshot(self, users: set[int], admins: set[int]):
+        """Атомарно записывает снапшот: временный файл, fsync и os.replace"""
+        tmp_file = f"{self.snapshot_file}.tmp"
+        _dump_snapshot(tmp_file, users, admins)
+        os.replace(tmp_file, self.snapshot_file)
+        self._snapshot_stamp = self.stat_snapshot()
+
+    def close(self):
+        """Дожидается фонового сворачивания"""
+        if self._compaction is not None:
+            self._compaction.join()
+
+
+def _dump_snapshot(path: str, users: set[int], admins: set[int]):
+    """Записывает снапшот в файл и сбрасывает его на диск"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"whitelist": sorted(users), "admin_ids": sorted(admins)}, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _pack_record(op: int, user_id: int) -> bytes:
+    """Упаковывает операцию в запись журнала с контрольной суммой"""
+    head = struct.pack("<Bq", op, user_id)
+    return RECORD.pack(op, user_id, zlib.crc32(head))
+
+
+def _apply_records(raw: bytes, users: set[int], admins: set[int]) -> int:
+    """Применяет целые записи с верной контрольной суммой; возвращает длину примененной части"""
+    offset = 0
+    while offset + RECORD.size <= len(raw):
+        op, user_id, crc = RECORD.unpack_from(raw, offset)
+        if zlib.crc32(raw[offset:offset + RECORD.size - 4]) != crc:
+            break
+        _apply_op(op, user_id, users, admins)
+        offset += RECORD.size
+    return offset
+
+
+def _apply_op(op: int, user_id: int, users: set[int], admins: set[int]) -> bool:
+    """Применяет одну операцию к индексу; возвращает True, если состояние изменилось"""
+    if op == OP_ADD_USER:
+        target, add = users, True
+    elif op == OP_REMOVE_USER:
+        target, add = users, False
+    elif op == OP_ADD_ADMIN:
+        target, add = admins, True
+    elif op == OP_REMOVE_ADMIN:
+        target, add = admins, False
+    else:
+        return False
+
+    if add:
+        if user_id in target:
+            return False
+        target.add(user_id)
+    else:
+        if user_id not in target:
+            return False
+        target.discard(user_id)
+    return True
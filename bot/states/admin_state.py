@@ -2,4 +2,5 @@ from aiogram.fsm.state import State, StatesGroup
 
 class AdminState(StatesGroup):
     delete_user_id = State()
-    add_user_id = State()
\ No newline at end of file
+    add_user_id = State()
+    broadcast_message = State()
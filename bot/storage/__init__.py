@@ -0,0 +1,17 @@
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from bot.config import FSM_STORAGE, FSM_SQLITE_PATH, FSM_REDIS_URL, FSM_TTL
+from bot.storage.sqlite_storage import SQLiteStorage
+from bot.storage.redis_storage import RespStorage
+
+
+def create_storage(kind: str = FSM_STORAGE) -> BaseStorage:
+    """Создает FSM-хранилище, выбранное в настройках"""
+    if kind == "sqlite":
+        return SQLiteStorage(FSM_SQLITE_PATH, ttl=FSM_TTL)
+    if kind == "redis":
+        return RespStorage.from_url(FSM_REDIS_URL, ttl=FSM_TTL)
+    if kind == "memory":
+        return MemoryStorage()
+    raise ValueError(f"Неизвестный тип хранилища FSM: '{kind}'")
@@ -0,0 +1,61 @@
+import time
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from bot.utils.metrics import storage_duration
+
+
+class InstrumentedStorage(BaseStorage):
+    """
+    Обертка FSM-хранилища, которая меряет время каждой операции
+    (метрика bot_fsm_storage_duration_seconds по операциям)
+    """
+
+    def __init__(self, storage: BaseStorage):
+        self.storage = storage
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        started = time.perf_counter()
+        try:
+            await self.storage.set_state(key, state)
+        finally:
+            storage_duration.observe(time.perf_counter() - started, "set_state")
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        started = time.perf_counter()
+        try:
+            return await self.storage.get_state(key)
+        finally:
+            storage_duration.observe(time.perf_counter() - started, "get_state")
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        started = time.perf_counter()
+        try:
+            await self.storage.set_data(key, data)
+        finally:
+            storage_duration.observe(time.perf_counter() - started, "set_data")
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            return await self.storage.get_data(key)
+        finally:
+            storage_duration.observe(time.perf_counter() - started, "get_data")
+
+    async def get_value(self, storage_key: StorageKey, dict_key: str, default: Any = None) -> Any:
+        started = time.perf_counter()
+        try:
+            return await self.storage.get_value(storage_key, dict_key, default)
+        finally:
+            storage_duration.observe(time.perf_counter() - started, "get_value")
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            return await self.storage.update_data(key, data)
+        finally:
+            storage_duration.observe(time.perf_counter() - started, "update_data")
+
+    async def close(self) -> None:
+        await self.storage.close()
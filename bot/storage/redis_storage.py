@@ -0,0 +1,51 @@
+import json
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from bot.storage.resp import RespClient
+from bot.storage.sqlite_storage import dumps
+
+
+class RespStorage(BaseStorage):
+    """
+    FSM-хранилище поверх Redis-протокола; позволяет нескольким процессам
+    работать с общими сессиями. Каждая запись живет ttl секунд с момента
+    последнего изменения (SET ... EX)
+    """
+
+    def __init__(self, client: RespClient, ttl: int | None = None, key_builder: KeyBuilder | None = None):
+        self.client = client
+        self.ttl = ttl
+        self.key_builder = key_builder or DefaultKeyBuilder(prefix="fsm", with_destiny=True)
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RespStorage":
+        return cls(RespClient(url), **kwargs)
+
+    async def _set(self, key: str, value: str | None):
+        if value is None:
+            await self.client.execute("DEL", key)
+        elif self.ttl:
+            await self.client.execute("SET", key, value, "EX", int(self.ttl))
+        else:
+            await self.client.execute("SET", key, value)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await self._set(self.key_builder.build(key, "state"), value)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        value = await self.client.execute("GET", self.key_builder.build(key, "state"))
+        return value.decode('utf-8') if value is not None else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await self._set(self.key_builder.build(key, "data"), dumps(dict(data)) if data else None)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        value = await self.client.execute("GET", self.key_builder.build(key, "data"))
+        return json.loads(value) if value else {}
+
+    async def close(self) -> None:
+        await self.client.close()
@@ -0,0 +1,124 @@
+import asyncio
+from urllib.parse import urlparse
+
+
+class RespError(Exception):
+    """Ошибка, которую вернул сервер (ответ '-ERR ...')"""
+
+
+def encode_command(*args) -> bytes:
+    """Кодирует команду в формате RESP: массив bulk-строк"""
+    out = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode('utf-8')
+        out.append(f"${len(arg)}\r\n".encode())
+        out.append(arg)
+        out.append(b"\r\n")
+    return b"".join(out)
+
+
+async def read_reply(reader: asyncio.StreamReader):
+    """Читает один ответ RESP"""
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Соединение закрыто сервером")
+    kind, payload = line[:1], line[1:-2]
+
+    if kind == b"+":
+        return payload.decode()
+    if kind == b"-":
+        raise RespError(payload.decode())
+    if kind == b":":
+        return int(payload)
+    if kind == b"$":
+        length = int(payload)
+        if length == -1:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        length = int(payload)
+        if length == -1:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise RespError(f"Неизвестный тип ответа: {line!r}")
+
+
+class RespClient:
+    """
+    Минимальный асинхронный клиент Redis-протокола.
+
+    Держит одно соединение; команды выполняются по очереди, а пачка команд
+    может быть отправлена одним пакетом через pipeline()
+    """
+
+    def __init__(self, url: str = "redis://localhost:6379/0"):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self._roundtrip([("AUTH", self.password)])
+        if self.db:
+            await self._roundtrip([("SELECT", self.db)])
+
+    async def _roundtrip(self, commands: list[tuple]) -> list:
+        self._writer.write(b"".join(encode_command(*command) for command in commands))
+        await self._writer.drain()
+        replies = []
+        error = None
+        for _ in commands:
+            try:
+                replies.append(await read_reply(self._reader))
+            except RespError as e:
+                error = error or e
+                replies.append(None)
+        if error is not None:
+            raise error
+        return replies
+
+    async def pipeline(self, commands: list[tuple]) -> list:
+        """Отправляет несколько команд за один сетевой обмен"""
+        async with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._writer is None:
+                        await self._connect()
+                    return await self._roundtrip(commands)
+                except RespError:
+                    # Ответы прочитаны полностью, соединение можно использовать дальше
+                    raise
+                except (ConnectionError, asyncio.IncompleteReadError, OSError):
+                    await self._close_connection()
+                    if attempt:
+                        raise
+                except BaseException:
+                    # Прерваны посреди обмена (отмена задачи, таймаут): непрочитанные ответы
+                    # остались в сокете и достались бы следующему вызову, поэтому соединение закрываем
+                    await self._close_connection()
+                    raise
+
+    async def execute(self, *args):
+        return (await self.pipeline([args]))[0]
+
+    async def _close_connection(self):
+        # Соединение забываем до ожидания: повторная отмена не оставит его в клиенте
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def close(self):
+        async with self._lock:
+            await self._close_connection()
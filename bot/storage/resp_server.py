@@ -0,0 +1,140 @@
+"""
+Локальная замена Redis для разработки и нагрузочных тестов: asyncio-сервер,
+понимающий подмножество команд Redis-протокола (GET, SET с EX/PX, DEL, EXPIRE,
+TTL, EXISTS, PING, SELECT, AUTH, FLUSHALL, DBSIZE). Данные живут в памяти процесса.
+
+Запуск: python -m bot.storage.resp_server [--host 127.0.0.1] [--port 6379]
+"""
+import argparse
+import asyncio
+import time
+
+from bot.storage.resp import read_reply
+
+
+def _encode(value) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, int):
+        return f":{value}\r\n".encode()
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    return f"+{value}\r\n".encode()
+
+
+class RespServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.data: dict[bytes, bytes] = {}
+        self.expires: dict[bytes, float] = {}
+        self._server: asyncio.base_events.Server | None = None
+        # Соединения клиентов и обслуживающие их задачи
+        self._clients: dict[asyncio.StreamWriter, asyncio.Task] = {}
+
+    @property
+    def url(self) -> str:
+        return f"redis://{self.host}:{self.port}/0"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """Останавливает сервер и, как Redis при остановке, разрывает соединения клиентов"""
+        if self._server is not None:
+            self._server.close()
+            handlers = list(self._clients.values())
+            for writer in list(self._clients):
+                writer.close()
+            await asyncio.gather(*handlers, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    def _alive(self, key: bytes) -> bool:
+        expires_at = self.expires.get(key)
+        if expires_at is not None and expires_at <= time.time():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._clients[writer] = asyncio.current_task()
+        try:
+            while True:
+                command = await read_reply(reader)
+                if not command:
+                    continue
+                try:
+                    reply = self.execute(command[0].upper(), command[1:])
+                except (ValueError, IndexError) as e:
+                    writer.write(f"-ERR {e}\r\n".encode())
+                else:
+                    writer.write(_encode(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._clients.pop(writer, None)
+            writer.close()
+
+    def execute(self, name: bytes, args: list[bytes]):
+        if name == b"PING":
+            return "PONG"
+        if name in (b"SELECT", b"AUTH"):
+            return "OK"
+        if name == b"GET":
+            return self.data[args[0]] if self._alive(args[0]) else None
+        if name == b"SET":
+            key, value = args[0], args[1]
+            self.data[key] = value
+            self.expires.pop(key, None)
+            options = [arg.upper() for arg in args[2:]]
+            if b"EX" in options:
+                self.expires[key] = time.time() + int(args[2 + options.index(b"EX") + 1])
+            elif b"PX" in options:
+                self.expires[key] = time.time() + int(args[2 + options.index(b"PX") + 1]) / 1000
+            return "OK"
+        if name == b"DEL":
+            removed = 0
+            for key in args:
+                if self._alive(key):
+                    removed += 1
+                self.data.pop(key, None)
+                self.expires.pop(key, None)
+            return removed
+        if name == b"EXISTS":
+            return sum(1 for key in args if self._alive(key))
+        if name == b"EXPIRE":
+            if not self._alive(args[0]):
+                return 0
+            self.expires[args[0]] = time.time() + int(args[1])
+            return 1
+        if name == b"TTL":
+            if not self._alive(args[0]):
+                return -2
+            expires_at = self.expires.get(args[0])
+            return -1 if expires_at is None else max(0, int(expires_at - time.time()))
+        if name == b"DBSIZE":
+            return sum(1 for key in list(self.data) if self._alive(key))
+        if name == b"FLUSHALL":
+            self.data.clear()
+            self.expires.clear()
+            return "OK"
+        raise ValueError(f"unknown command '{name.decode()}'")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+
+    server = RespServer(args.host, args.port)
+    await server.start()
+    print(f"Локальный Redis-совместимый сервер: {server.url}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,211 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+logger = logging.getLogger(__name__)
+
+def dumps(value: Any) -> str:
+    """Сериализация без пробелов: запись сессии занимает десятки байт"""
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM-хранилище в SQLite (режим WAL).
+
+    Чтение идет по первичному ключу в отдельном потоке чтения (в режиме WAL
+    оно не ждет записи), а записи копятся в буфере и сбрасываются одной
+    транзакцией в фоновом потоке записи (по размеру пачки или по таймеру).
+    Пока запись не сброшена, чтения видят ее из буфера, не обращаясь к базе.
+    Каждая запись живет ttl секунд с момента последнего изменения; истекшая
+    сессия, даже еще не удаленная из базы, не оживает при следующей записи.
+    """
+
+    def __init__(self, path: str, ttl: float | None = None, flush_interval: float = 0.5,
+                 batch_size: int = 500, purge_interval: float = 3600.0,
+                 key_builder: KeyBuilder | None = None):
+        self.path = path
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.purge_interval = purge_interval
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._reader = self._connect()
+        self._reader.executescript("""
+            CREATE TABLE IF NOT EXISTS fsm (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT,
+                expires_at REAL
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS fsm_expires_at ON fsm (expires_at);
+        """)
+
+        # Несброшенные изменения: ключ -> {'state': ..., 'data': ...}
+        self._pending: dict[str, dict[str, Any]] = {}
+        self._flushing: dict[str, dict[str, Any]] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-sqlite")
+        # Чтения не ждут в очереди за пачками записи и не блокируют цикл событий
+        self._read_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-sqlite-read")
+        self._writer: sqlite3.Connection | None = None
+        self._flush_task: asyncio.Task | None = None
+        self._wakeup = asyncio.Event()
+        self._next_purge = time.time() + purge_interval
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    # --- чтение ---
+
+    def _read_field(self, key: str, field: str) -> tuple[bool, Any]:
+        """Ищет несброшенное значение поля; возвращает (найдено, значение)"""
+        for buffer in (self._pending, self._flushing):
+            record = buffer.get(key)
+            if record is not None and field in record:
+                return True, record[field]
+        return False, None
+
+    async def _select(self, key: str, field: str) -> Optional[str]:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._read_executor, self._select_sync, key, field)
+
+    def _select_sync(self, key: str, field: str) -> Optional[str]:
+        """Выполняется в потоке чтения"""
+        row = self._reader.execute(
+            f"SELECT {field} FROM fsm WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return row[0] if row else None
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        db_key = self.key_builder.build(key)
+        found, value = self._read_field(db_key, 'state')
+        if found:
+            return value
+        return await self._select(db_key, 'state')
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        db_key = self.key_builder.build(key)
+        found, value = self._read_field(db_key, 'data')
+        if found:
+            return dict(value)
+        raw = await self._select(db_key, 'data')
+        return json.loads(raw) if raw else {}
+
+    # --- запись ---
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        self._write(self.key_builder.build(key), 'state', value)
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        self._write(self.key_builder.build(key), 'data', dict(data))
+
+    def _write(self, key: str, field: str, value: Any):
+        if self._closed:
+            raise RuntimeError("Хранилище FSM уже закрыто")
+        self._pending.setdefault(key, {})[field] = value
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _flush_loop(self):
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка записи FSM в SQLite: {e}")
+
+    async def flush(self):
+        """Сбрасывает накопленные изменения одной транзакцией"""
+        if not self._pending and time.time() < self._next_purge:
+            return
+        self._flushing, self._pending = self._pending, {}
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._write_batch, self._flushing)
+        except Exception:
+            # Возвращаем несброшенное в буфер, не затирая более свежие изменения
+            for key, record in self._flushing.items():
+                self._pending[key] = {**record, **self._pending.get(key, {})}
+            raise
+        finally:
+            self._flushing = {}
+
+    def _write_batch(self, batch: dict[str, dict[str, Any]]):
+        """Выполняется в потоке записи"""
+        if self._writer is None:
+            self._writer = self._connect()
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl else None
+
+        state_rows = []
+        data_rows = []
+        for key, record in batch.items():
+            if 'state' in record:
+                state_rows.append((key, record['state'], expires_at, now))
+            if 'data' in record:
+                data_rows.append((key, dumps(record['data']) if record['data'] else None, expires_at, now))
+
+        writer = self._writer
+        writer.execute("BEGIN")
+        try:
+            # Истекшая, но еще не удаленная запись не должна ожить: второе поле сбрасываем
+            writer.executemany(
+                "INSERT INTO fsm (key, state, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET state = excluded.state, expires_at = excluded.expires_at, "
+                "data = CASE WHEN fsm.expires_at <= ? THEN NULL ELSE fsm.data END",
+                state_rows)
+            writer.executemany(
+                "INSERT INTO fsm (key, data, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at, "
+                "state = CASE WHEN fsm.expires_at <= ? THEN NULL ELSE fsm.state END",
+                data_rows)
+            # Пустые сессии не храним
+            writer.executemany(
+                "DELETE FROM fsm WHERE key = ? AND state IS NULL AND data IS NULL",
+                [(key,) for key in batch])
+            if now >= self._next_purge:
+                writer.execute("DELETE FROM fsm WHERE expires_at <= ?", (now,))
+                self._next_purge = now + self.purge_interval
+            writer.execute("COMMIT")
+        except Exception:
+            writer.execute("ROLLBACK")
+            raise
+
+    async def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._flush_task is not None:
+            self._wakeup.set()
+            await self._flush_task
+        await self.flush()
+        self._executor.submit(self._close_writer).result()
+        self._executor.shutdown()
+        self._read_executor.shutdown()
+        self._reader.close()
+
+    def _close_writer(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
@@ -0,0 +1,255 @@
+"""
+Воронка прохождения сценариев: сколько пользователей дошло до каждого шага,
+сколько его прошло, сколько было неверных ответов, какие варианты выбирали
+в развилках и сколько времени провели на шаге.
+
+События только увеличивают счетчики в памяти. Раз в checkpoint_interval
+секунд накопленные приращения одной транзакцией прибавляются к агрегатам в
+SQLite (поэтому счетчики нескольких процессов бота складываются). Отчет
+читает готовые агрегаты сценария - O(шагов), без разбора сырых событий.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from bisect import bisect_left
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from bot.config import ANALYTICS_PATH, ANALYTICS_CHECKPOINT_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Верхние границы корзин гистограммы времени на шаге, в секундах; последняя корзина - все, что дольше
+TIME_BUCKETS = (5, 15, 30, 60, 120, 300, 900, 3600)
+
+# Номер "шага" для счетчиков всего сценария
+SCENARIO_TOTAL = -1
+
+ENTERED = "entered"
+COMPLETED = "completed"
+WRONG = "wrong"
+FINISHED = "finished"
+OPTION_PREFIX = "option_"
+TIME_PREFIX = "time_"
+
+# Сколько незавершенных шагов пользователей держим в памяти для замера времени
+MAX_ACTIVE_USERS = 100_000
+
+
+@dataclass(slots=True)
+class StepFunnel:
+    entered: int = 0
+    completed: int = 0
+    wrong: int = 0
+    options: dict[int, int] = field(default_factory=dict)
+    time_histogram: list[int] = field(default_factory=lambda: [0] * (len(TIME_BUCKETS) + 1))
+
+    @property
+    def dropped(self) -> int:
+        return max(0, self.entered - self.completed)
+
+    def median_time(self) -> str | None:
+        """Корзина, в которую попадает медиана времени на шаге"""
+        total = sum(self.time_histogram)
+        if not total:
+            return None
+        seen = 0
+        for i, count in enumerate(self.time_histogram):
+            seen += count
+            if seen * 2 >= total:
+                return f"≤{TIME_BUCKETS[i]}с" if i < len(TIME_BUCKETS) else f">{TIME_BUCKETS[-1]}с"
+
+
+class FunnelAnalytics:
+    """
+    Счетчики воронки в памяти с периодическим сохранением приращений
+
+    Args:
+        path: Файл SQLite с агрегатами
+        checkpoint_interval: Как часто сбрасывать приращения, в секундах
+    """
+
+    def __init__(self, path: str, checkpoint_interval: float = 30.0):
+        self.path = path
+        self.checkpoint_interval = checkpoint_interval
+        # (сценарий, шаг, метрика) -> приращение с последнего сохранения
+        self._pending: Counter = Counter()
+        # Пользователь -> (сценарий, шаг, время входа на шаг)
+        self._active: dict[int, tuple[str, int, float]] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="analytics")
+        self._connection: sqlite3.Connection | None = None
+        self._checkpoint_task: asyncio.Task | None = None
+        self._closed = False
+
+    # --- события ---
+
+    def step_entered(self, user_id: int, scenario: str, step: int):
+        """
+        Пользователю отправлен шаг; предыдущий шаг этого сценария считается
+        пройденным, только если пользователь продвинулся дальше него
+        """
+        now = time.monotonic()
+        previous = self._active.get(user_id)
+        if previous is not None and previous[0] == scenario:
+            if previous[1] == step:
+                # Повтор того же шага (например, развилка с repeat_step) - не новый вход
+                return
+            if step > previous[1]:
+                self._complete(scenario, previous[1], now - previous[2])
+            # Переход назад (сценарий начат заново) - только новый вход, таймер отсчитывается заново
+
+        self._pending[(scenario, step, ENTERED)] += 1
+        self._active.pop(user_id, None)
+        self._active[user_id] = (scenario, step, now)
+        if len(self._active) > MAX_ACTIVE_USERS:
+            # Самый давний незавершенный шаг считаем брошенным
+            del self._active[next(iter(self._active))]
+        self._ensure_checkpoints()
+
+    def scenario_finished(self, user_id: int, scenario: str):
+        """Пользователь дошел до конца сценария"""
+        previous = self._active.pop(user_id, None)
+        if previous is not None and previous[0] == scenario:
+            self._complete(scenario, previous[1], time.monotonic() - previous[2])
+        self._pending[(scenario, SCENARIO_TOTAL, FINISHED)] += 1
+        self._ensure_checkpoints()
+
+    def wrong_answer(self, scenario: str, step: int):
+        self._pending[(scenario, step, WRONG)] += 1
+        self._ensure_checkpoints()
+
+    def option_chosen(self, scenario: str, step: int, option_index: int):
+        self._pending[(scenario, step, f"{OPTION_PREFIX}{option_index}")] += 1
+        self._ensure_checkpoints()
+
+    def _complete(self, scenario: str, step: int, seconds: float):
+        self._pending[(scenario, step, COMPLETED)] += 1
+        self._pending[(scenario, step, f"{TIME_PREFIX}{bisect_left(TIME_BUCKETS, seconds)}")] += 1
+
+    # --- сохранение ---
+
+    def _ensure_checkpoints(self):
+        if self._checkpoint_task is None and not self._closed:
+            self._checkpoint_task = asyncio.create_task(self._checkpoint_loop())
+
+    async def _checkpoint_loop(self):
+        while not self._closed:
+            await asyncio.sleep(self.checkpoint_interval)
+            try:
+                await self.checkpoint()
+            except Exception as e:
+                logger.error(f"Ошибка сохранения аналитики: {e}")
+
+    async def checkpoint(self):
+        """Прибавляет накопленные приращения к агрегатам одной транзакцией"""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, Counter()
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._write_batch, batch)
+        except Exception:
+            # Возвращаем приращения, чтобы не потерять их до следующей попытки
+            self._pending.update(batch)
+            raise
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS funnel (
+                scenario TEXT NOT NULL,
+                step INTEGER NOT NULL,
+                metric TEXT NOT NULL,
+                value INTEGER NOT NULL,
+                PRIMARY KEY (scenario, step, metric)
+            ) WITHOUT ROWID
+        """)
+        return connection
+
+    def _write_batch(self, batch: Counter):
+        """Выполняется в потоке записи"""
+        if self._connection is None:
+            self._connection = self._connect()
+        connection = self._connection
+        connection.execute("BEGIN")
+        try:
+            connection.executemany(
+                "INSERT INTO funnel (scenario, step, metric, value) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(scenario, step, metric) DO UPDATE SET value = value + excluded.value",
+                [(scenario, step, metric, value) for (scenario, step, metric), value in batch.items()])
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _read_scenario(self, scenario: str) -> list[tuple[int, str, int]]:
+        """Выполняется в потоке записи"""
+        if self._connection is None:
+            self._connection = self._connect()
+        return self._connection.execute(
+            "SELECT step, metric, value FROM funnel WHERE scenario = ?", (scenario,)).fetchall()
+
+    # --- отчет ---
+
+    async def funnel(self, scenario: str, steps: int) -> tuple[list[StepFunnel], int]:
+        """
+        Воронка сценария: сохраненные агрегаты плюс еще не сохраненные приращения
+
+        Args:
+            scenario: Ключ сценария
+            steps: Число шагов в текущей версии сценария
+
+        Returns:
+            tuple: (счетчики по каждому шагу, сколько раз сценарий пройден до конца)
+        """
+        rows = await asyncio.get_running_loop().run_in_executor(self._executor, self._read_scenario, scenario)
+        totals = Counter({(step, metric): value for step, metric, value in rows})
+        for (key, step, metric), value in self._pending.items():
+            if key == scenario:
+                totals[(step, metric)] += value
+
+        funnel = [StepFunnel() for _ in range(steps)]
+        finished = 0
+        for (step, metric), value in totals.items():
+            if step == SCENARIO_TOTAL:
+                if metric == FINISHED:
+                    finished = value
+                continue
+            if not 0 <= step < steps:
+                # Шаги, которых больше нет в сценарии после его изменения
+                continue
+            item = funnel[step]
+            if metric == ENTERED:
+                item.entered = value
+            elif metric == COMPLETED:
+                item.completed = value
+            elif metric == WRONG:
+                item.wrong = value
+            elif metric.startswith(OPTION_PREFIX):
+                item.options[int(metric[len(OPTION_PREFIX):])] = value
+            elif metric.startswith(TIME_PREFIX):
+                item.time_histogram[int(metric[len(TIME_PREFIX):])] = value
+        return funnel, finished
+
+    async def close(self):
+        """Сохраняет оставшиеся приращения"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._checkpoint_task is not None:
+            self._checkpoint_task.cancel()
+        await self.checkpoint()
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._close_connection)
+        self._executor.shutdown()
+
+    def _close_connection(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+analytics = FunnelAnalytics(ANALYTICS_PATH, checkpoint_interval=ANALYTICS_CHECKPOINT_INTERVAL)
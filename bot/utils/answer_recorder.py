@@ -0,0 +1,196 @@
+"""
+Запись ответов пользователей (опросы, текстовые ответы, ввод после развилки).
+
+Обработчики только кладут компактную запись в очередь и сразу продолжают
+работу. Фоновая задача забирает записи пачками (по размеру или по таймеру) и
+пишет их одной транзакцией в SQLite или дозаписью в JSONL в отдельном потоке.
+Очередь ограничена: если запись не успевает, record() ждет свободного места,
+и обработчики замедляются вместо бесконечного роста памяти.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import astuple, dataclass
+
+from bot.config import ANSWERS_FORMAT, ANSWERS_PATH
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class AnswerRecord:
+    user_id: int
+    scenario: str
+    step: int
+    kind: str  # survey, text, branch_input
+    answer: str
+    ts: float
+
+
+class SQLiteAnswerSink:
+    """Таблица answers в SQLite (режим WAL); пачка пишется одной транзакцией"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection: sqlite3.Connection | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        connection = sqlite3.connect(self.path, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS answers (
+                user_id INTEGER NOT NULL,
+                scenario TEXT NOT NULL,
+                step INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                ts REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS answers_scenario_step ON answers (scenario, step);
+        """)
+        return connection
+
+    def write_batch(self, records: list[AnswerRecord]):
+        if self._connection is None:
+            self._connection = self._connect()
+        connection = self._connection
+        connection.execute("BEGIN")
+        try:
+            connection.executemany("INSERT INTO answers VALUES (?, ?, ?, ?, ?, ?)",
+                                   [astuple(record) for record in records])
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class JsonlAnswerSink:
+    """Файл JSON Lines: одна строка на ответ, пачка пишется одной дозаписью"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write_batch(self, records: list[AnswerRecord]):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        chunk = "".join(
+            json.dumps({"user_id": r.user_id, "scenario": r.scenario, "step": r.step, "kind": r.kind,
+                        "answer": r.answer, "ts": r.ts}, ensure_ascii=False, separators=(',', ':')) + "\n"
+            for r in records)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(chunk)
+
+    def close(self):
+        pass
+
+
+class AnswerRecorder:
+    """
+    Очередь ответов с фоновой пакетной записью
+
+    Args:
+        sink: Куда писать пачки (SQLiteAnswerSink или JsonlAnswerSink)
+        batch_size: Пачка сбрасывается, как только набралось столько записей
+        flush_interval: ...или через столько секунд после первой записи в пачке
+        max_queue: Размер очереди, после которого record() ждет писателя
+    """
+
+    def __init__(self, sink, batch_size: int = 500, flush_interval: float = 1.0, max_queue: int = 10_000):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue[AnswerRecord | None] = asyncio.Queue(maxsize=max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="answer-writer")
+        self._writer_task: asyncio.Task | None = None
+        self._closed = False
+        # Сколько раз record() пришлось ждать места в очереди
+        self.stalls = 0
+        self.written = 0
+
+    async def record(self, user_id: int, scenario: str, step: int, kind: str, answer: str):
+        """Ставит ответ в очередь на запись"""
+        if self._closed:
+            logger.error(f"Запись ответов остановлена, ответ пользователя {user_id} потерян")
+            return
+        if self._writer_task is None:
+            self._writer_task = asyncio.create_task(self._write_loop())
+
+        record = AnswerRecord(user_id, scenario, step, kind, answer, time.time())
+        if self._queue.full():
+            self.stalls += 1
+        # При полной очереди ждем писателя: обратное давление на обработчики
+        await self._queue.put(record)
+
+    async def _next_batch(self) -> tuple[list[AnswerRecord], bool]:
+        """Собирает пачку; возвращает (записи, пришел ли сигнал остановки)"""
+        first = await self._queue.get()
+        if first is None:
+            return [], True
+
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                record = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                await asyncio.sleep(min(remaining, 0.05))
+                continue
+            if record is None:
+                return batch, True
+            batch.append(record)
+        return batch, False
+
+    async def _write_loop(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            batch, stopping = await self._next_batch()
+            if not batch:
+                continue
+            for attempt in range(3):
+                try:
+                    await loop.run_in_executor(self._executor, self.sink.write_batch, batch)
+                    self.written += len(batch)
+                    break
+                except Exception as e:
+                    logger.error(f"Ошибка записи ответов (попытка {attempt + 1}): {e}")
+                    await asyncio.sleep(0.5 * (attempt + 1))
+            else:
+                logger.error(f"Потеряно ответов: {len(batch)}")
+
+    async def close(self):
+        """Дописывает все, что осталось в очереди, и закрывает хранилище"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._writer_task is not None:
+            await self._queue.put(None)
+            await self._writer_task
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.sink.close)
+        self._executor.shutdown()
+        logger.info(f"Запись ответов остановлена, записано: {self.written}")
+
+
+def create_answer_sink(kind: str = ANSWERS_FORMAT, path: str = ANSWERS_PATH):
+    """Создает хранилище ответов, выбранное в настройках"""
+    if kind == "sqlite":
+        return SQLiteAnswerSink(path)
+    if kind == "jsonl":
+        return JsonlAnswerSink(path)
+    raise ValueError(f"Неизвестный формат записи ответов: '{kind}'")
+
+
+answer_recorder = AnswerRecorder(create_answer_sink())
@@ -0,0 +1,72 @@
+"""
+Манифест картинок, которые отправляет бот.
+
+Строится при старте и при перезагрузке сценариев: каждое имя картинки из
+сценариев один раз превращается в путь к файлу для отправки (оптимизированная
+копия или исходник), для файла запоминаются размер и sha256 (ключ кэша
+file_id). Отсутствующие файлы попадают в список missing и в лог сразу, а не
+когда пользователь дойдет до шага. Отправка шага берет все из памяти и не
+обращается к диску; файл читается, только если картинку еще ни разу не
+загружали в Telegram.
+"""
+import logging
+import os
+from dataclasses import dataclass
+
+from bot.utils.file_id_cache import file_id_cache, FileIdCache
+from bot.utils.image_pipeline import image_pipeline, ImagePipeline
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class Asset:
+    photo: str  # имя картинки в сценарии
+    path: str  # файл для отправки
+    size: int
+    sha256: str
+
+
+class AssetManifest:
+    def __init__(self, pipeline: ImagePipeline = image_pipeline, cache: FileIdCache = file_id_cache):
+        self.pipeline = pipeline
+        self.cache = cache
+        self._assets: dict[str, Asset] = {}
+        self.missing: list[str] = []
+
+    def build(self, photos: list[str]) -> list[str]:
+        """
+        Находит файлы всех картинок и заменяет ими текущий манифест
+
+        Args:
+            photos: Имена картинок из сценариев
+
+        Returns:
+            list: Имена картинок, файлов которых нет
+        """
+        assets = {}
+        missing = []
+        for photo in dict.fromkeys(photos):
+            path = self.pipeline.photo_path(photo)
+            try:
+                assets[photo] = Asset(photo, path, os.path.getsize(path), self.cache.content_hash(path))
+            except OSError:
+                missing.append(photo)
+
+        self._assets = assets
+        self.missing = missing
+        total = sum(asset.size for asset in assets.values())
+        logger.info(f"Манифест картинок: {len(assets)} файлов, {total / 1024:.0f} КБ")
+        if missing:
+            logger.error(f"Картинки не найдены, шаги с ними уйдут без фото: {', '.join(missing)}")
+        return missing
+
+    def get(self, photo: str) -> Asset | None:
+        """Картинка для отправки или None, если файла нет"""
+        return self._assets.get(photo)
+
+    def assets(self) -> list[Asset]:
+        return list(self._assets.values())
+
+
+asset_manifest = AssetManifest()
@@ -0,0 +1,279 @@
+"""
+Рассылка сообщения администратора всем пользователям из белого списка.
+
+Скорость ограничена общим ведром токенов (лимит Telegram - около 30
+сообщений в секунду на бота) и паузой между сообщениями в один чат.
+Отправкой занимается ограниченный пул задач. Ответ 429 (RetryAfter)
+обрабатывает общая очередь исходящих (bot/middlewares/outbound_queue.py):
+она приостанавливает все запросы бота и повторяет сообщение сама.
+Пользователи, заблокировавшие бота, пропускаются, а по окончании рассылки
+удаляются из белого списка одной пачкой, чтобы следующие рассылки не тратили
+на них лимит.
+
+Ход рассылки (курсор - id, до которого все получатели обработаны)
+периодически сохраняется в файл, поэтому после перезапуска она продолжается
+с места остановки.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Awaitable, Callable
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramAPIError, TelegramForbiddenError, TelegramBadRequest, TelegramNetworkError,
+    TelegramServerError,
+)
+
+from bot.config import BROADCAST_STATE_FILE, BROADCAST_RATE, BROADCAST_WORKERS
+from bot.middlewares import exist_middleware
+from bot.middlewares.outbound_queue import outbound_priority, PRIORITY_BULK
+from bot.utils.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class BroadcastJob:
+    """Состояние рассылки; сохраняется в файл целиком"""
+    source_chat_id: int
+    source_message_id: int
+    admin_chat_id: int
+    total: int
+    cursor: int | None = None
+    sent: int = 0
+    blocked: int = 0
+    failed: int = 0
+    retried: int = 0
+    # Заблокировавшие бота (сохраняются, чтобы удалить их и после перезапуска) и сколько удалено
+    blocked_ids: list[int] = field(default_factory=list)
+    removed: int = 0
+    status: str = "running"  # running, done, cancelled
+    started_at: float = field(default_factory=time.time)
+
+    @property
+    def processed(self) -> int:
+        return self.sent + self.blocked + self.failed
+
+
+class BroadcastEngine:
+    """
+    Исполнитель рассылок (одна рассылка за раз)
+
+    Args:
+        state_file: Файл с состоянием текущей рассылки
+        rate: Общий лимит сообщений в секунду
+        workers: Сколько сообщений отправляется одновременно
+        per_chat_interval: Минимальная пауза между сообщениями в один чат
+        max_attempts: Попыток на сообщение при сетевых ошибках и ошибках сервера
+        progress_interval: Как часто сообщать о ходе рассылки, в секундах
+        remove_blocked: Удаляет заблокировавших бота из числа получателей, возвращает число удаленных
+    """
+
+    def __init__(self, state_file: str, rate: float = 25.0, workers: int = 8, per_chat_interval: float = 1.0,
+                 max_attempts: int = 5, progress_interval: float = 3.0,
+                 remove_blocked: Callable[[list[int]], int] | None = None):
+        self.state_file = state_file
+        self.remove_blocked = remove_blocked
+        self.rate = rate
+        self.workers = workers
+        self.per_chat_interval = per_chat_interval
+        self.max_attempts = max_attempts
+        self.progress_interval = progress_interval
+
+        self.job: BroadcastJob | None = None
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+        self._chat_next: dict[int, float] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    # --- состояние ---
+
+    def load(self) -> BroadcastJob | None:
+        """Читает сохраненную рассылку (например, прерванную перезапуском)"""
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return BroadcastJob(**json.load(f))
+        except (FileNotFoundError, json.JSONDecodeError, TypeError):
+            return None
+
+    def _save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_file)), exist_ok=True)
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(asdict(self.job), f)
+        os.replace(tmp_file, self.state_file)
+
+    # --- запуск ---
+
+    def start(self, bot: Bot, job: BroadcastJob, recipients: list[int],
+              on_progress: Callable[[BroadcastJob, float], Awaitable] | None = None) -> asyncio.Task:
+        """
+        Запускает рассылку в фоне
+
+        Args:
+            bot: Бот
+            job: Новая или восстановленная рассылка
+            recipients: Все получатели; уже обработанные (до job.cursor) пропускаются
+            on_progress: Корутина (рассылка, сообщений в секунду), вызывается периодически и в конце
+        """
+        if self.running:
+            raise RuntimeError("Рассылка уже идет")
+        recipients = sorted(recipients)
+        if job.cursor is not None:
+            recipients = [user_id for user_id in recipients if user_id > job.cursor]
+        self.job = job
+        self._stopping = False
+        self._save()
+        self._task = asyncio.create_task(self._run(bot, recipients, on_progress))
+        return self._task
+
+    def cancel(self):
+        """Отменяет текущую рассылку по команде администратора"""
+        if self.running:
+            self.job.status = "cancelled"
+            self._task.cancel()
+
+    async def _run(self, bot: Bot, recipients: list[int], on_progress):
+        job = self.job
+        bucket = TokenBucket(self.rate)
+        # Массовые сообщения уступают очередь ответам пользователям
+        outbound_priority.set(PRIORITY_BULK)
+        # Курсор двигается только по непрерывному префиксу обработанных получателей
+        done = bytearray(len(recipients))
+        low = 0
+        next_position = 0
+        started = time.monotonic()
+        processed_at_start = job.processed
+
+        async def worker():
+            nonlocal next_position, low
+            while not self._stopping and next_position < len(recipients):
+                position = next_position
+                next_position += 1
+                await self._send(bot, bucket, job, recipients[position])
+                done[position] = 1
+                while low < len(done) and done[low]:
+                    low += 1
+                if low:
+                    job.cursor = recipients[low - 1]
+
+        async def report():
+            while True:
+                await asyncio.sleep(self.progress_interval)
+                self._save()
+                if on_progress is not None:
+                    elapsed = time.monotonic() - started
+                    try:
+                        await on_progress(job, (job.processed - processed_at_start) / elapsed if elapsed else 0.0)
+                    except Exception as e:
+                        logger.error(f"Ошибка отчета о рассылке: {e}")
+
+        reporter = asyncio.create_task(report())
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.workers, len(recipients)) or 1)))
+            if not self._stopping:
+                job.status = "done"
+        except asyncio.CancelledError:
+            if job.status == "running":
+                # Остановка бота: сохраняем курсор, рассылка продолжится после перезапуска
+                self._save()
+                raise
+        finally:
+            reporter.cancel()
+            self._chat_next.clear()
+
+        if self._stopping:
+            # Остановка бота: рассылка продолжится после перезапуска
+            self._save()
+            return
+        if job.blocked_ids and self.remove_blocked is not None:
+            try:
+                job.removed = self.remove_blocked(job.blocked_ids)
+            except Exception as e:
+                logger.error(f"Не удалось удалить заблокировавших бота из белого списка: {e}")
+        self._save()
+        elapsed = time.monotonic() - started
+        rate = (job.processed - processed_at_start) / elapsed if elapsed else 0.0
+        logger.info(f"Рассылка {job.status}: отправлено {job.sent}, заблокировали бота {job.blocked} "
+                    f"(удалено из белого списка {job.removed}), ошибок {job.failed}, повторов {job.retried}, {rate:.1f} сообщ/с")
+        if on_progress is not None:
+            try:
+                await on_progress(job, rate)
+            except Exception as e:
+                logger.error(f"Ошибка отчета о рассылке: {e}")
+
+    async def close(self, timeout: float = 10.0):
+        """
+        Останавливает рассылку при остановке бота, не помечая ее отмененной:
+        новые отправки не начинаются, начатые дожидаются ответа (не дольше timeout)
+        """
+        if not self.running:
+            return
+        self._stopping = True
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _send(self, bot: Bot, bucket: TokenBucket, job: BroadcastJob, chat_id: int):
+        attempts = 0
+        while True:
+            # Пауза между сообщениями в один чат (важна при повторах)
+            wait = self._chat_next.get(chat_id, 0.0) - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await bucket.acquire()
+            self._chat_next[chat_id] = time.monotonic() + self.per_chat_interval
+            try:
+                await bot.copy_message(chat_id=chat_id, from_chat_id=job.source_chat_id,
+                                       message_id=job.source_message_id)
+                job.sent += 1
+                break
+            except TelegramForbiddenError:
+                job.blocked += 1
+                job.blocked_ids.append(chat_id)
+                break
+            except TelegramBadRequest as e:
+                logger.warning(f"Рассылка: пользователю {chat_id} не доставлено: {e.message}")
+                job.failed += 1
+                break
+            except (TelegramNetworkError, TelegramServerError) as e:
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    logger.warning(f"Рассылка: пользователю {chat_id} не доставлено после {attempts} попыток: {e}")
+                    job.failed += 1
+                    break
+                job.retried += 1
+                await asyncio.sleep(min(2 ** attempts, 30))
+            except TelegramAPIError as e:
+                logger.warning(f"Рассылка: пользователю {chat_id} не доставлено: {e.message}")
+                job.failed += 1
+                break
+        self._chat_next.pop(chat_id, None)
+
+
+def format_progress(job: BroadcastJob, rate: float) -> str:
+    """Текст о ходе рассылки для администратора"""
+    titles = {"running": "📤 Рассылка идет", "done": "✅ Рассылка завершена", "cancelled": "⏹ Рассылка остановлена"}
+    percent = f"{job.processed / job.total:.0%}" if job.total else "100%"
+    return (f"{titles.get(job.status, job.status)}: {job.processed} из {job.total} ({percent})\n"
+            f"Доставлено: {job.sent}\n"
+            f"Заблокировали бота: {job.blocked}"
+            f"{f' (удалены из белого списка: {job.removed})' if job.removed else ''}\n"
+            f"Ошибок: {job.failed}, повторов после сбоя сети: {job.retried}\n"
+            f"Скорость: {rate:.1f} сообщ/с")
+
+
+broadcast_engine = BroadcastEngine(BROADCAST_STATE_FILE, rate=BROADCAST_RATE, workers=BROADCAST_WORKERS,
+                                   remove_blocked=exist_middleware.remove_many_from_whitelist)
@@ -0,0 +1,102 @@
+"""
+Компактная callback_data кнопок шагов сценария.
+
+Вместо текста кнопки в callback_data кладутся только номера:
+
+    <операция><версия формата><версия сценария, 8 hex><шаг>[.<вариант>]
+
+шаг и вариант - числа в base36, вариант - индекс кнопки или опции шага
+(с нуля). Например, "s189568950c.3" - ответ в опросе: сценарий версии
+89568950..., шаг 12, вариант с индексом 3. Такая строка занимает 11-20 байт при любой
+длине подписей, разбирается без split по "_" и сразу говорит, к какой
+версии сценария относится кнопка, поэтому устаревшие кнопки можно
+отличить от действующих.
+"""
+from typing import NamedTuple
+
+# Telegram принимает callback_data не длиннее 64 байт
+CALLBACK_DATA_LIMIT = 64
+
+# Версия формата; при несовместимом изменении увеличивается, старые кнопки
+# перестают разбираться и попадают к обработчику устаревших кнопок
+FORMAT_VERSION = "1"
+VERSION_LENGTH = 8
+
+OP_NEXT = "n"  # "Дальше" на теории; шаг - текущий
+OP_ANSWER = "a"  # ответ на практику; вариант - индекс кнопки
+OP_BRANCH = "b"  # выбор в развилке; вариант - индекс опции
+OP_SURVEY = "s"  # ответ в опросе; вариант - индекс кнопки
+OP_CONTINUE = "c"  # "Дальше" после ответа развилки; шаг - следующий
+OPS = frozenset((OP_NEXT, OP_ANSWER, OP_BRANCH, OP_SURVEY, OP_CONTINUE))
+
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+_DIGIT_SET = frozenset(_DIGITS)
+_HEAD = 2 + VERSION_LENGTH
+
+
+class StepCallback(NamedTuple):
+    op: str
+    version: str  # первые VERSION_LENGTH символов версии сценария
+    step: int
+    option: int | None = None
+
+    def matches(self, scenario_version: str) -> bool:
+        """Относится ли кнопка к этой версии сценария"""
+        return scenario_version.startswith(self.version)
+
+
+def _base36(value: int) -> str:
+    if value < 0:
+        raise ValueError(f"Отрицательный номер в callback_data: {value}")
+    digits = ""
+    while True:
+        value, digit = divmod(value, 36)
+        digits = _DIGITS[digit] + digits
+        if not value:
+            return digits
+
+
+def _from_base36(field: str) -> int:
+    # int(x, 36) принимает знак, пробелы и "_": такие строки кнопки не порождают,
+    # а "-1" прошло бы проверку границ как индекс с конца
+    if not field or not _DIGIT_SET.issuperset(field):
+        raise ValueError(f"Не число base36: '{field}'")
+    return int(field, 36)
+
+
+def encode(op: str, scenario_version: str, step: int, option: int | None = None) -> str:
+    """
+    Собирает callback_data кнопки шага
+
+    Args:
+        op: Операция (OP_*)
+        scenario_version: Версия сценария (используются первые 8 символов)
+        step: Индекс шага
+        option: Индекс кнопки или опции, если нужен
+
+    Returns:
+        str: callback_data не длиннее CALLBACK_DATA_LIMIT байт
+    """
+    if op not in OPS:
+        raise ValueError(f"Неизвестная операция callback_data: '{op}'")
+    version = scenario_version[:VERSION_LENGTH]
+    if len(version) != VERSION_LENGTH:
+        raise ValueError(f"Версия сценария короче {VERSION_LENGTH} символов: '{scenario_version}'")
+
+    data = f"{op}{FORMAT_VERSION}{version}{_base36(step)}"
+    if option is not None:
+        data += f".{_base36(option)}"
+    if len(data.encode("utf-8")) > CALLBACK_DATA_LIMIT:
+        raise ValueError(f"callback_data длиннее {CALLBACK_DATA_LIMIT} байт: '{data}'")
+    return data
+
+
+def decode(data: str) -> StepCallback | None:
+    """Разбирает callback_data кнопки шага; None - строка не в этом формате"""
+    if len(data) <= _HEAD or data[0] not in OPS or data[1] != FORMAT_VERSION:
+        return None
+    step, dot, option = data[_HEAD:].partition(".")
+    try:
+        return StepCallback(data[0], data[2:_HEAD], _from_base36(step), _from_base36(option) if dot else None)
+    except ValueError:
+        return None
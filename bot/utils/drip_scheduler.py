@@ -0,0 +1,291 @@
+"""
+Выдача разделов курса по расписанию (по умолчанию три раза в неделю).
+
+Для каждого пользователя хранится следующий раздел и время, когда о нем
+нужно сообщить. Таблица в SQLite проиндексирована по этому времени, поэтому
+после перезапуска читаются только ближайшие записи, а не все пользователи.
+Записи, которые наступают в пределах horizon секунд, держатся в куче в
+памяти; планировщик спит до ближайшей из них и просыпается только ради нее.
+
+Когда пользователь проходит раздел, следующий назначается на ближайший слот
+расписания. В слот бот присылает кнопку запуска раздела, а если раздел так
+и не начат - до max_reminders напоминаний в следующие слоты.
+"""
+import asyncio
+import heapq
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from bot.config import DRIP_PATH, DRIP_WEEKDAYS, DRIP_HOUR, DRIP_UTC_OFFSET, DRIP_MAX_REMINDERS
+from bot.middlewares.outbound_queue import outbound_priority, PRIORITY_BULK
+from bot.utils.scenario_registry import scenario_registry
+from bot.utils.sorter import natural_sort_key
+
+logger = logging.getLogger(__name__)
+
+
+def course_order() -> list[str]:
+    """Ключи разделов в порядке курса: day_1, day_2, ..., day_14"""
+    return sorted(scenario_registry.names(), key=natural_sort_key)
+
+
+class DripScheduler:
+    """
+    Планировщик выдачи разделов
+
+    Args:
+        path: Файл SQLite с расписанием
+        course: Функция, возвращающая ключи разделов в порядке курса
+        weekdays: Дни недели для слотов (0 - понедельник)
+        hour: Час слота
+        utc_offset: Часовой пояс расписания, часов от UTC
+        max_reminders: Сколько раз напомнить о неначатом разделе
+        horizon: На сколько секунд вперед записи держатся в памяти
+        clock: Источник текущего времени (unix-время); подменяется в тестах
+    """
+
+    def __init__(self, path: str, course: Callable[[], list[str]] = course_order,
+                 weekdays: tuple[int, ...] = (0, 2, 4), hour: int = 10, utc_offset: int = 0,
+                 max_reminders: int = 1, horizon: float = 300.0, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.course = course
+        self.weekdays = tuple(sorted(set(weekdays)))
+        self.hour = hour
+        self.tz = timezone(timedelta(hours=utc_offset))
+        self.max_reminders = max_reminders
+        self.horizon = horizon
+        self.clock = clock
+
+        # Куча (время, пользователь) записей, наступающих до _loaded_until
+        self._heap: list[tuple[float, int]] = []
+        self._loaded_until = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="drip")
+        self._connection: sqlite3.Connection | None = None
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    # --- расписание ---
+
+    def next_slot(self, after: float) -> float:
+        """Ближайший слот расписания строго позже after"""
+        moment = datetime.fromtimestamp(after, self.tz)
+        day = moment.replace(hour=self.hour, minute=0, second=0, microsecond=0)
+        for _ in range(8):
+            if day.weekday() in self.weekdays and day.timestamp() > after:
+                return day.timestamp()
+            day += timedelta(days=1)
+        raise ValueError("В расписании нет ни одного дня недели")
+
+    # --- база ---
+
+    def _db(self) -> sqlite3.Connection:
+        """Соединение потока планировщика"""
+        if self._connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS drip (
+                    user_id INTEGER PRIMARY KEY,
+                    next_key TEXT,
+                    due_at REAL,
+                    reminders INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS drip_due_at ON drip (due_at) WHERE due_at IS NOT NULL;
+            """)
+            self._connection = connection
+        return self._connection
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _upsert(self, user_id: int, next_key: str | None, due_at: float | None, reminders: int = 0):
+        self._db().execute(
+            "INSERT INTO drip (user_id, next_key, due_at, reminders) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET next_key = excluded.next_key, due_at = excluded.due_at, "
+            "reminders = excluded.reminders",
+            (user_id, next_key, due_at, reminders))
+
+    def _get(self, user_id: int) -> tuple[str | None, float | None, int] | None:
+        return self._db().execute(
+            "SELECT next_key, due_at, reminders FROM drip WHERE user_id = ?", (user_id,)).fetchone()
+
+    def _due_until(self, until: float) -> list[tuple[float, int]]:
+        return self._db().execute(
+            "SELECT due_at, user_id FROM drip WHERE due_at IS NOT NULL AND due_at <= ? ORDER BY due_at",
+            (until,)).fetchall()
+
+    def _schedule_locally(self, user_id: int, due_at: float):
+        """Кладет запись в кучу, если она попадает в загруженное окно"""
+        if due_at <= self._loaded_until:
+            heapq.heappush(self._heap, (due_at, user_id))
+            if self._heap[0] == (due_at, user_id):
+                self._wakeup.set()
+
+    # --- события ---
+
+    async def enroll(self, user_id: int):
+        """Записывает нового пользователя на курс: первый раздел в ближайший слот"""
+        course = self.course()
+        if not course or await self._run(self._get, user_id) is not None:
+            return
+        due_at = self.next_slot(self.clock())
+        await self._run(self._upsert, user_id, course[0], due_at)
+        self._schedule_locally(user_id, due_at)
+
+    async def scenario_started(self, user_id: int, key: str):
+        """Пользователь начал назначенный раздел: напоминания о нем больше не нужны"""
+        row = await self._run(self._get, user_id)
+        if row is None or row[0] != key or row[1] is None:
+            return
+        # Раздел остается назначенным, чтобы по его прохождении назначить следующий;
+        # запись в куче устареет и будет пропущена в run_due
+        await self._run(self._upsert, user_id, key, None, row[2])
+
+    async def scenario_finished(self, user_id: int, key: str):
+        """
+        Пользователь прошел раздел: если это назначенный раздел (или первый раздел
+        курса у незаписанного пользователя), следующий назначается на ближайший слот.
+        Разделы, пройденные раньше срока, повторно или после конца курса, расписание не меняют
+        """
+        course = self.course()
+        if key not in course:
+            return
+        position = course.index(key)
+        row = await self._run(self._get, user_id)
+        if row is None:
+            if position != 0:
+                return
+        elif row[0] != key:
+            return
+
+        if position + 1 < len(course):
+            due_at = self.next_slot(self.clock())
+            await self._run(self._upsert, user_id, course[position + 1], due_at)
+            self._schedule_locally(user_id, due_at)
+        else:
+            # Курс пройден: запись остается, чтобы /start не записал пользователя заново
+            await self._run(self._upsert, user_id, None, None)
+
+    # --- выдача ---
+
+    async def run_due(self, bot: Bot) -> int:
+        """
+        Выдает все наступившие записи
+
+        Returns:
+            int: Сколько сообщений отправлено
+        """
+        now = self.clock()
+        if now + self.horizon > self._loaded_until:
+            # Подгружаем следующее окно; заодно видим записи других процессов бота
+            self._loaded_until = now + self.horizon
+            self._heap = await self._run(self._due_until, self._loaded_until)
+            heapq.heapify(self._heap)
+
+        sent = 0
+        while self._heap and self._heap[0][0] <= now:
+            due_at, user_id = heapq.heappop(self._heap)
+            row = await self._run(self._get, user_id)
+            if row is None or row[1] != due_at:
+                # Запись перенесена или удалена после загрузки в кучу
+                continue
+            if await self._deliver(bot, user_id, *row):
+                sent += 1
+        return sent
+
+    async def _deliver(self, bot: Bot, user_id: int, next_key: str, due_at: float, reminders: int) -> bool:
+        scenario = scenario_registry.get(next_key)
+        if scenario is None:
+            logger.error(f"Раздел {next_key} для пользователя {user_id} не найден, выдача остановлена")
+            await self._suspend(user_id, next_key, reminders)
+            return False
+
+        if reminders == 0:
+            text = f"📬 Доступен новый раздел курса: {scenario.name}"
+        else:
+            text = f"⏰ Напоминаем: вас ждет раздел «{scenario.name}»"
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[[
+            InlineKeyboardButton(text="▶️ Начать", callback_data=f"start_scenario_{scenario.key}")
+        ]])
+        try:
+            await bot.send_message(chat_id=user_id, text=text, reply_markup=keyboard)
+        except TelegramForbiddenError:
+            # Пользователь заблокировал бота
+            await self._suspend(user_id, next_key, reminders)
+            return False
+        except TelegramBadRequest as e:
+            logger.error(f"Не удалось отправить раздел пользователю {user_id}: {e}")
+            await self._suspend(user_id, next_key, reminders)
+            return False
+
+        if reminders < self.max_reminders:
+            next_due = self.next_slot(due_at)
+            await self._run(self._upsert, user_id, next_key, next_due, reminders + 1)
+            self._schedule_locally(user_id, next_due)
+        else:
+            await self._run(self._upsert, user_id, next_key, None, reminders)
+        return True
+
+    async def _suspend(self, user_id: int, next_key: str, reminders: int):
+        """
+        Останавливает выдачу, не удаляя запись: без нее /start записал бы пользователя
+        на курс заново, а прохождение раздела не засчитывалось бы с того места, где он остановился
+        """
+        await self._run(self._upsert, user_id, next_key, None, reminders)
+
+    async def run(self, bot: Bot):
+        """Цикл планировщика: спит до ближайшей записи или до конца окна"""
+        # Массовые сообщения уступают очередь ответам пользователям
+        outbound_priority.set(PRIORITY_BULK)
+        while True:
+            try:
+                await self.run_due(bot)
+            except Exception as e:
+                logger.error(f"Ошибка планировщика разделов: {e}")
+            now = self.clock()
+            wake_at = min(self._heap[0][0] if self._heap else self._loaded_until, self._loaded_until)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, wake_at - now))
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self, bot: Bot):
+        """Запускает цикл планировщика в фоне"""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run(bot))
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._run(self._close_connection)
+        self._executor.shutdown()
+
+    def _close_connection(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+drip_scheduler = DripScheduler(
+    DRIP_PATH,
+    weekdays=DRIP_WEEKDAYS,
+    hour=DRIP_HOUR,
+    utc_offset=DRIP_UTC_OFFSET,
+    max_reminders=DRIP_MAX_REMINDERS,
+)
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Awaitable, Callable
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, Message
+
+from bot.config import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+
+class FileIdCache:
+    """
+    Кэш file_id загруженных в Telegram картинок.
+
+    Ключ - sha256 содержимого файла, поэтому после правки картинки она будет
+    загружена заново. Кэш сохраняется в JSON и переживает перезапуски бота
+    """
+
+    def __init__(self, cache_file: str):
+        self.cache_file = cache_file
+        self._file_ids: dict[str, str] = {}
+        # Хэши файлов по пути, пересчитываются только при смене mtime или размера
+        self._hashes: dict[str, tuple[tuple, str]] = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                self._file_ids = json.load(f)
+        except FileNotFoundError:
+            self._file_ids = {}
+        except json.JSONDecodeError as e:
+            logger.error(f"Ошибка загрузки кэша file_id: {e}")
+            self._file_ids = {}
+
+    def _save(self):
+        """Атомарно сохраняет кэш на диск"""
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        tmp_file = f"{self.cache_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self._file_ids, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.cache_file)
+
+    def content_hash(self, path: str) -> str:
+        """sha256 содержимого файла"""
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        cached = self._hashes.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        file_hash = digest.hexdigest()
+        self._hashes[path] = (stamp, file_hash)
+        return file_hash
+
+    def get(self, file_hash: str) -> str | None:
+        return self._file_ids.get(file_hash)
+
+    def remember(self, file_hash: str, message: Message):
+        """Запоминает file_id из ответа Telegram на отправку фото"""
+        if not message.photo:
+            return
+        file_id = message.photo[-1].file_id
+        if self._file_ids.get(file_hash) != file_id:
+            self._file_ids[file_hash] = file_id
+            self._save()
+
+    def forget(self, file_hash: str):
+        if self._file_ids.pop(file_hash, None) is not None:
+            self._save()
+
+    async def send_photo(self, send: Callable[..., Awaitable[Message]], photo_path: str,
+                         file_hash: str | None = None, **kwargs) -> Message:
+        """
+        Отправляет фото по file_id, если картинка уже загружалась, иначе загружает файл
+
+        Args:
+            send: Метод отправки, принимающий photo=... (message.answer_photo, bot.send_photo с partial)
+            photo_path: Путь к локальному файлу картинки
+            file_hash: Заранее посчитанный sha256 файла (из манифеста картинок); без него файл проверяется на диске
+            kwargs: Остальные параметры отправки (caption, reply_markup, ...)
+        """
+        if file_hash is None:
+            file_hash = self.content_hash(photo_path)
+        file_id = self.get(file_hash)
+        if file_id is not None:
+            try:
+                return await send(photo=file_id, **kwargs)
+            except TelegramBadRequest as e:
+                # file_id мог стать недействительным (например, сменился токен бота)
+                logger.warning(f"file_id для {photo_path} не принят, загружаем заново: {e}")
+                self.forget(file_hash)
+
+        result = await send(photo=FSInputFile(photo_path), **kwargs)
+        self.remember(file_hash, result)
+        return result
+
+    async def warm_up(self, bot: Bot, chat_id: int | str, photo_paths: list[str]):
+        """Заранее загружает картинки в служебный чат, чтобы пользователи сразу получали их по file_id"""
+        uploaded = 0
+        for photo_path in photo_paths:
+            try:
+                if self.get(self.content_hash(photo_path)) is not None:
+                    continue
+                message = await self.send_photo(bot.send_photo, photo_path, chat_id=chat_id,
+                                                disable_notification=True)
+                uploaded += 1
+                try:
+                    await bot.delete_message(chat_id=chat_id, message_id=message.message_id)
+                except Exception:
+                    pass
+            except Exception as e:
+                logger.error(f"Не удалось загрузить {photo_path} при прогреве кэша: {e}")
+        logger.info(f"Прогрев кэша file_id: загружено {uploaded} из {len(photo_paths)}")
+
+
+file_id_cache = FileIdCache(os.path.join(CACHE_DIR, "file_ids.json"))
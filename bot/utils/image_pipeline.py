@@ -0,0 +1,184 @@
+"""
+Подготовка картинок сценариев к отправке в Telegram.
+
+Для каждой картинки, на которую ссылаются сценарии, строится уменьшенная копия
+(длинная сторона не больше 1280px, JPEG), которая кладется в кэш под именем из
+хэша исходника и параметров сжатия. Неизменившиеся исходники пропускаются.
+
+Запуск вручную: python -m bot.utils.image_pipeline
+"""
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass
+
+from bot.config import CACHE_DIR, IMAGE_DIR
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow не установлен: отправляем исходные файлы
+    Image = None
+
+OPTIMIZED_DIR = os.path.join(CACHE_DIR, "images")
+
+# Telegram показывает фото не больше 1280px по длинной стороне и все равно пережимает их в JPEG
+MAX_SIDE = 1280
+JPEG_QUALITY = 85
+PIPELINE_VERSION = f"{MAX_SIDE}q{JPEG_QUALITY}"
+
+
+@dataclass(frozen=True, slots=True)
+class OptimizedImage:
+    photo: str
+    path: str
+    source_bytes: int
+    optimized_bytes: int
+    skipped: bool
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.source_bytes - self.optimized_bytes
+
+
+class ImagePipeline:
+    """Собирает и хранит соответствие 'имя картинки -> оптимизированный файл'"""
+
+    def __init__(self, image_dir: str = IMAGE_DIR, output_dir: str = OPTIMIZED_DIR):
+        self.image_dir = image_dir
+        self.output_dir = output_dir
+        self.manifest_file = os.path.join(output_dir, "manifest.json")
+        self._manifest: dict[str, dict] = self._load_manifest()
+
+    def _load_manifest(self) -> dict:
+        try:
+            with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_manifest(self):
+        tmp_file = f"{self.manifest_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self._manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.manifest_file)
+
+    def photo_path(self, photo: str) -> str:
+        """Путь к файлу для отправки: оптимизированная копия, если она есть, иначе исходник"""
+        entry = self._manifest.get(photo)
+        if entry is not None and entry['file'] is not None:
+            return os.path.join(self.output_dir, entry['file'])
+        return os.path.join(self.image_dir, photo)
+
+    def build(self, photos: list[str]) -> list[OptimizedImage]:
+        """
+        Строит оптимизированные копии картинок
+
+        Args:
+            photos: Имена файлов в каталоге картинок
+
+        Returns:
+            list: Отчет по каждой обработанной картинке
+        """
+        if Image is None:
+            logger.warning("Pillow не установлен, картинки отправляются без оптимизации")
+            return []
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        report = []
+        for photo in photos:
+            source_path = os.path.join(self.image_dir, photo)
+            if not os.path.exists(source_path):
+                logger.error(f"Картинка не найдена: {photo}")
+                continue
+            try:
+                report.append(self._build_one(photo, source_path))
+            except Exception as e:
+                logger.error(f"Не удалось оптимизировать {photo}: {e}")
+                self._manifest.pop(photo, None)
+
+        self._save_manifest()
+        return report
+
+    def _build_one(self, photo: str, source_path: str) -> OptimizedImage:
+        st = os.stat(source_path)
+        entry = self._manifest.get(photo)
+
+        # Быстрая проверка без чтения файла: тот же размер, mtime и параметры сжатия
+        if (entry is not None and entry['mtime_ns'] == st.st_mtime_ns and entry['source_bytes'] == st.st_size
+                and entry['pipeline'] == PIPELINE_VERSION
+                and (entry['file'] is None or os.path.exists(os.path.join(self.output_dir, entry['file'])))):
+            return OptimizedImage(photo, self.photo_path(photo), entry['source_bytes'], entry['bytes'], True)
+
+        with open(source_path, 'rb') as f:
+            source_hash = hashlib.sha256(f.read()).hexdigest()
+        file_name = f"{source_hash[:24]}_{PIPELINE_VERSION}.jpg"
+        output_path = os.path.join(self.output_dir, file_name)
+
+        skipped = os.path.exists(output_path)
+        if not skipped:
+            self._encode(source_path, output_path)
+
+        optimized_bytes = os.path.getsize(output_path)
+        if optimized_bytes >= st.st_size:
+            # Исходник и так меньше: запоминаем это и отправляем его как есть
+            os.remove(output_path)
+            file_name = None
+            output_path = source_path
+            optimized_bytes = st.st_size
+
+        self._manifest[photo] = {
+            'file': file_name,
+            'source_hash': source_hash,
+            'mtime_ns': st.st_mtime_ns,
+            'source_bytes': st.st_size,
+            'bytes': optimized_bytes,
+            'pipeline': PIPELINE_VERSION,
+        }
+        return OptimizedImage(photo, output_path, st.st_size, optimized_bytes, skipped)
+
+    @staticmethod
+    def _encode(source_path: str, output_path: str):
+        """Уменьшает картинку и пересохраняет ее в JPEG"""
+        with Image.open(source_path) as image:
+            image.thumbnail((MAX_SIDE, MAX_SIDE), Image.LANCZOS)
+            if image.mode in ("RGBA", "LA", "P"):
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            elif image.mode != "RGB":
+                image = image.convert("RGB")
+
+            tmp_file = f"{output_path}.tmp"
+            image.save(tmp_file, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+        os.replace(tmp_file, output_path)
+
+
+def format_report(report: list[OptimizedImage]) -> str:
+    """Текстовый отчет об экономии по каждой картинке"""
+    lines = []
+    total_source = total_optimized = 0
+    for item in report:
+        total_source += item.source_bytes
+        total_optimized += item.optimized_bytes
+        status = "без изменений" if item.skipped else "пересобрано"
+        lines.append(f"{item.photo:20} {item.source_bytes / 1024:8.0f} КБ -> {item.optimized_bytes / 1024:6.0f} КБ "
+                     f"(-{item.saved_bytes / 1024:.0f} КБ, {status})")
+    lines.append(f"{'Итого':20} {total_source / 1024:8.0f} КБ -> {total_optimized / 1024:6.0f} КБ "
+                 f"(-{(total_source - total_optimized) / 1024:.0f} КБ)")
+    return "\n".join(lines)
+
+
+image_pipeline = ImagePipeline()
+
+
+if __name__ == "__main__":
+    from bot.utils.scenario_registry import scenario_registry
+    from bot.handlers.start_handler import WELCOME_PHOTO
+
+    logging.basicConfig(level=logging.INFO)
+    photos = list(dict.fromkeys([WELCOME_PHOTO, *scenario_registry.referenced_photos()]))
+    print(format_report(image_pipeline.build(photos)))
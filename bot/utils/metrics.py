@@ -0,0 +1,187 @@
+"""
+Метрики бота в формате Prometheus.
+
+Счетчики и гистограммы - обычные числа и списки без блокировок: бот
+работает в одном потоке event loop, а в режиме нескольких процессов у
+каждого рабочего свои метрики и свой порт (METRICS_PORT + номер рабочего).
+Гистограммы хранят число попаданий в каждую корзину, накопленные суммы
+считаются только при отдаче /metrics.
+"""
+import logging
+from bisect import bisect_left
+from typing import Callable, Iterable
+
+from aiohttp import web
+
+from bot.config import METRICS_ENABLED
+
+logger = logging.getLogger(__name__)
+
+# Корзины длительностей по умолчанию, в секундах
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Счетчик с метками; inc(value, *метки)"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, value: float = 1, *labels):
+        self.values[labels] = self.values.get(labels, 0) + value
+
+    def set(self, value: float, *labels):
+        """Подставляет значение, которое считает другой модуль"""
+        self.values[labels] = value
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in self.values.items():
+            yield f"{self.name}{_labels(self.labels, labels)} {_number(value)}"
+
+
+class Gauge(Counter):
+    """Текущее значение с метками; set(value, *метки) или inc/dec"""
+
+    kind = "gauge"
+
+    def dec(self, value: float = 1, *labels):
+        self.values[labels] = self.values.get(labels, 0) - value
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами и метками; observe(секунды, *метки)"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        # метки -> [число попаданий в каждую корзину (последняя - +Inf), сумма]
+        self.values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        item = self.values.get(labels)
+        if item is None:
+            item = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        item[0][bisect_left(self.buckets, value)] += 1
+        item[1] += value
+
+    def set_counts(self, counts: list[int], total: float, *labels):
+        """Подставляет готовые попадания по корзинам (для гистограмм, которые считает другой модуль)"""
+        self.values[labels] = [list(counts), total]
+
+    def samples(self) -> Iterable[str]:
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_labels(self.labels, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labels, labels)} {cumulative}"
+
+
+class MetricsRegistry:
+    """
+    Набор метрик процесса
+
+    Args:
+        enabled: Включен ли сбор; выключенный реестр не подключает middleware и не поднимает /metrics
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics: list = []
+        # Функции, обновляющие метрики перед отдачей (например, глубина очереди исходящих запросов)
+        self._collectors: list[Callable[[], None]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: tuple[str, ...] = (),
+                  buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def collector(self, func: Callable[[], None]):
+        self._collectors.append(func)
+        return func
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        for collect in self._collectors:
+            try:
+                collect()
+            except Exception as e:
+                logger.error(f"Ошибка сбора метрик: {e}")
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry(enabled=METRICS_ENABLED)
+
+updates_in_flight = metrics.gauge("bot_updates_in_flight", "Обновления, которые сейчас обрабатываются")
+update_duration = metrics.histogram("bot_update_duration_seconds", "Полное время обработки обновления", ("type",))
+access_check_duration = metrics.histogram("bot_access_check_duration_seconds", "Время проверки доступа (белый список)")
+handler_duration = metrics.histogram("bot_handler_duration_seconds", "Время работы обработчика",
+                                     ("router", "handler"))
+handler_errors = metrics.counter("bot_handler_errors_total", "Исключения в обработчиках", ("router", "handler"))
+storage_duration = metrics.histogram("bot_fsm_storage_duration_seconds", "Время операций FSM-хранилища",
+                                     ("operation",))
+api_duration = metrics.histogram("bot_api_request_duration_seconds", "Время запроса к Bot API (без ожидания в очереди)",
+                                 ("method",))
+api_errors = metrics.counter("bot_api_errors_total", "Ошибки запросов к Bot API", ("method", "error"))
+
+
+def metrics_app(registry: MetricsRegistry = metrics) -> web.Application:
+    """aiohttp-приложение с одним маршрутом GET /metrics"""
+
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(body=registry.render().encode("utf-8"),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    return app
+
+
+async def start_metrics_server(host: str, port: int, registry: MetricsRegistry = metrics) -> web.AppRunner:
+    """Поднимает /metrics на host:port; остановка - await runner.cleanup()"""
+    runner = web.AppRunner(metrics_app(registry), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,174 @@
+"""
+Собранные сценарии в одном файле (см. bot/utils/scenario_compiler.py).
+
+Формат (все числа little-endian):
+    заголовок:  b"SCNB", u16 версия формата, u16 число сценариев,
+                12 байт версия сборки, f64 время сборки (unix)
+    индекс:     на каждый сценарий u8 длина имени, имя (UTF-8),
+                12 байт версия сценария, u32 смещение и u32 длина данных,
+                u8 число картинок и для каждой u8 длина имени, имя (UTF-8)
+    данные:     сценарии подряд, каждый - компактный JSON-массив
+                [имя, описание, [шаг, ...]], шаг - массив [тип, текст, фото, ...]
+                (см. encode_step в bot/utils/scenario_registry.py)
+
+Шаги хранятся позиционными массивами без имен полей: такой JSON разбирается
+C-парсером стандартной библиотеки быстрее словарей и сразу раскладывается
+в неизменяемые объекты реестра, а индекс позволяет разбирать сценарии по
+одному (режим mmap). Картинки сценариев лежат в индексе, чтобы подготовить
+их при запуске, не разбирая сами сценарии.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+
+MAGIC = b"SCNB"
+FORMAT_VERSION = 2
+
+_HEADER = struct.Struct("<4sHH12sd")
+_ENTRY = struct.Struct("<12sII")
+
+
+class BundleError(ValueError):
+    """Файл сборки поврежден или собран другой версией формата"""
+
+
+def bundle_version(entries: list[tuple[str, str, bytes, tuple[str, ...]]]) -> str:
+    """Версия сборки: хэш имен и версий всех сценариев (не зависит от времени сборки)"""
+    digest = hashlib.sha1()
+    for key, version, *_ in sorted(entries):
+        digest.update(f"{key}:{version}\n".encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+def _pack_name(name: str, what: str) -> bytes:
+    raw = name.encode("utf-8")
+    if len(raw) > 255:
+        raise ValueError(f"Слишком длинное имя {what}: '{name}'")
+    return bytes((len(raw),)) + raw
+
+
+def write_bundle(path: str, entries: list[tuple[str, str, bytes, tuple[str, ...]]]) -> str:
+    """
+    Записывает сценарии в файл сборки (атомарно, через временный файл)
+
+    Args:
+        path: Путь к файлу сборки
+        entries: (имя, версия из 12 символов, данные, картинки) для каждого сценария
+
+    Returns:
+        str: Версия сборки
+    """
+    entries = sorted(entries)
+    version = bundle_version(entries)
+
+    heads = []
+    for key, scenario_version, payload, photos in entries:
+        if len(photos) > 255:
+            raise ValueError(f"Слишком много картинок в сценарии '{key}': {len(photos)}")
+        heads.append((_pack_name(key, "сценария"), scenario_version.encode("ascii"), len(payload),
+                       bytes((len(photos),)) + b"".join(_pack_name(photo, "картинки") for photo in photos)))
+
+    offset = _HEADER.size + sum(len(key) + _ENTRY.size + len(photos) for key, _, _, photos in heads)
+    parts = [_HEADER.pack(MAGIC, FORMAT_VERSION, len(entries), version.encode("ascii"), time.time())]
+    for key, scenario_version, length, photos in heads:
+        parts.append(key + _ENTRY.pack(scenario_version, offset, length) + photos)
+        offset += length
+    parts.extend(payload for _, _, payload, _ in entries)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(b"".join(parts))
+    os.replace(tmp_path, path)
+    return version
+
+
+def _unpack_name(data, pos: int) -> tuple[str, int]:
+    """Читает имя (u8 длина, UTF-8); возвращает имя и позицию за ним"""
+    end = pos + 1 + data[pos]
+    if end > len(data):
+        raise BundleError("Индекс сборки обрывается на середине имени")
+    return bytes(data[pos + 1:end]).decode("utf-8"), end
+
+
+class ScenarioBundle:
+    """
+    Открытый файл сборки
+
+    Args:
+        path: Путь к файлу сборки
+        use_mmap: Отобразить файл в память вместо чтения; сценарии тогда
+            разбираются по одному при первом обращении
+    """
+
+    def __init__(self, path: str, use_mmap: bool = False):
+        self.path = path
+        self._mmap = None
+        with open(path, "rb") as f:
+            if use_mmap:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._data = self._mmap
+            else:
+                self._data = f.read()
+
+        try:
+            self._read_index()
+        except Exception:
+            self.close()
+            raise
+
+    def _read_index(self):
+        data = self._data
+        if len(data) < _HEADER.size:
+            raise BundleError(f"Файл сборки слишком короткий: {self.path}")
+        magic, format_version, count, version, built_at = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise BundleError(f"Файл не является сборкой сценариев: {self.path}")
+        if format_version != FORMAT_VERSION:
+            raise BundleError(f"Версия формата сборки {format_version}, ожидается {FORMAT_VERSION}")
+
+        self.version = version.decode("ascii")
+        self.built_at = built_at
+        # имя -> (версия сценария, смещение, длина); имя -> картинки сценария
+        self.index: dict[str, tuple[str, int, int]] = {}
+        self.photos: dict[str, tuple[str, ...]] = {}
+        pos = _HEADER.size
+        for _ in range(count):
+            key, pos = _unpack_name(data, pos)
+            scenario_version, offset, length = _ENTRY.unpack_from(data, pos)
+            pos += _ENTRY.size
+            if offset + length > len(data):
+                raise BundleError(f"Данные сценария '{key}' выходят за конец файла")
+            self.index[key] = (scenario_version.decode("ascii"), offset, length)
+            photo_count = data[pos]
+            pos += 1
+            photos = []
+            for _ in range(photo_count):
+                photo, pos = _unpack_name(data, pos)
+                photos.append(photo)
+            self.photos[key] = tuple(photos)
+
+    def keys(self) -> list[str]:
+        return list(self.index)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.index
+
+    def payload(self, key: str) -> tuple[str, list]:
+        """
+        Разбирает данные одного сценария
+
+        Returns:
+            tuple: (версия сценария, [имя, описание, [шаг, ...]])
+        """
+        version, offset, length = self.index[key]
+        return version, json.loads(self._data[offset:offset + length])
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._data = b""
@@ -0,0 +1,212 @@
+"""
+Сборка сценариев в один файл для быстрого старта бота.
+
+Читает все json-файлы каталога сценариев, проверяет их целиком и печатает
+все найденные проблемы (а не первую, как при загрузке в боте): структуру
+шагов, наличие картинок в каталоге изображений, длину callback_data кнопок
+(Telegram принимает не больше 64 байт), длину текстов и подписей. Если
+ошибок нет, записывает сборку (см. bot/utils/scenario_bundle.py), которую
+бот читает одним чтением при SCENARIO_BUNDLE=<путь>.
+
+Запуск вручную: python -m bot.utils.scenario_compiler [--scenarios DIR] [--images DIR]
+                [--output FILE] [--check]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+from dataclasses import dataclass
+
+from bot.config import ROOT_DIR, SCENARIOS_DIR, IMAGE_DIR, SCENARIO_BUNDLE
+from bot.keyboards.scenario_keyboards import build_step_keyboard
+from bot.utils.callback_codec import CALLBACK_DATA_LIMIT
+from bot.utils.scenario_bundle import ScenarioBundle, write_bundle
+from bot.utils.scenario_loader import scenario_problems, step_problems
+from bot.utils.scenario_registry import (
+    Scenario, Step, Theory, TextAnswer, bundle_entry, compile_scenario, compile_step, decode_scenario,
+    scenario_photos
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OUTPUT = SCENARIO_BUNDLE or f"{ROOT_DIR}/data/scenarios.bundle"
+
+# Ограничения Telegram
+TEXT_LIMIT = 4096
+CAPTION_LIMIT = 1024
+
+
+@dataclass(slots=True)
+class Problem:
+    file: str
+    message: str
+    error: bool = True
+
+    def format(self) -> str:
+        return f"  {'ОШИБКА' if self.error else 'предупреждение'}: {self.message}"
+
+
+def check_steps(key: str, version: str, steps: list[Step | None], images: dict[str, str]) -> list[Problem]:
+    """
+    Проверки, которым нужны скомпилированные шаги: картинки, кнопки, длины текстов
+
+    Args:
+        key: Имя сценария (без .json)
+        version: Версия сценария (входит в callback_data кнопок)
+        steps: Скомпилированные шаги; None на месте шагов с ошибками структуры
+        images: Имена файлов каталога изображений: имя в нижнем регистре -> настоящее имя
+
+    Returns:
+        list: Найденные проблемы
+    """
+    file = f"{key}.json"
+    problems = []
+
+    start_data = f"start_scenario_{key}"
+    if len(start_data.encode("utf-8")) > CALLBACK_DATA_LIMIT:
+        problems.append(Problem(file, f"Имя файла слишком длинное для кнопки меню: "
+                                      f"'{start_data}' больше {CALLBACK_DATA_LIMIT} байт"))
+
+    for index, step in enumerate(steps):
+        if step is None:
+            continue
+        where = f"Шаг {index + 1}"
+
+        if step.photo:
+            actual = images.get(step.photo.lower())
+            if actual is None:
+                problems.append(Problem(file, f"{where}: картинка '{step.photo}' не найдена в каталоге изображений"))
+            elif actual != step.photo:
+                problems.append(Problem(file, f"{where}: картинка '{step.photo}' не найдена "
+                                              f"(есть '{actual}', регистр букв отличается)"))
+
+        text = step.prompt if isinstance(step, TextAnswer) else step.text
+        limit = CAPTION_LIMIT if step.photo else TEXT_LIMIT
+        if len(text) > limit:
+            kind = "подпись к картинке" if step.photo else "текст"
+            problems.append(Problem(file, f"{where}: {kind} длиннее {limit} символов ({len(text)}), "
+                                          f"Telegram может отклонить сообщение", error=False))
+
+        try:
+            keyboard = build_step_keyboard(step, index, version)
+        except ValueError as e:
+            problems.append(Problem(file, f"{where}: {e}"))
+            continue
+        seen = set()
+        for row in getattr(keyboard, "inline_keyboard", ()):
+            for button in row:
+                size = len(button.callback_data.encode("utf-8"))
+                if size > CALLBACK_DATA_LIMIT:
+                    problems.append(Problem(file, f"{where}: у кнопки '{button.text}' callback_data "
+                                                  f"{size} байт, больше {CALLBACK_DATA_LIMIT}"))
+                if button.text in seen:
+                    problems.append(Problem(file, f"{where}: кнопка '{button.text}' повторяется", error=False))
+                seen.add(button.text)
+
+        if isinstance(step, Theory) and step.is_final and index != len(steps) - 1:
+            problems.append(Problem(file, f"{where}: финальный шаг не последний, "
+                                          f"шаги после него недостижимы", error=False))
+
+    return problems
+
+
+def compile_directory(scenarios_dir: str, images_dir: str) -> tuple[list[Scenario], list[Problem]]:
+    """
+    Компилирует и проверяет все сценарии каталога
+
+    Returns:
+        tuple: (сценарии без ошибок, все найденные проблемы)
+    """
+    try:
+        images = {name.lower(): name for name in os.listdir(images_dir)}
+    except FileNotFoundError:
+        images = {}
+
+    scenarios = []
+    problems = []
+    for file in sorted(os.listdir(scenarios_dir)):
+        path = os.path.join(scenarios_dir, file)
+        if not file.endswith(".json") or not os.path.isfile(path):
+            continue
+        key = file[:-len(".json")]
+
+        with open(path, "rb") as f:
+            raw = f.read()
+        try:
+            data = json.loads(raw.decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            problems.append(Problem(file, f"Ошибка JSON: {e}"))
+            continue
+
+        structure = scenario_problems(data)
+        problems.extend(Problem(file, message) for message in structure)
+        if not isinstance(data, dict) or not isinstance(data.get('steps'), list):
+            continue
+
+        # Шаги без ошибок структуры проверяются дальше, чтобы за один запуск увидеть все проблемы
+        version = hashlib.sha1(raw).hexdigest()[:12]
+        steps = [compile_step(step) if not step_problems(step) else None for step in data['steps']]
+        checks = check_steps(key, version, steps, images)
+        problems.extend(checks)
+        if not structure and not any(problem.error for problem in checks):
+            scenarios.append(compile_scenario(key, data, version))
+
+    return scenarios, problems
+
+
+def format_problems(problems: list[Problem]) -> str:
+    """Проблемы, сгруппированные по файлам"""
+    lines = []
+    files = {}
+    for problem in problems:
+        files.setdefault(problem.file, []).append(problem)
+    for file, items in files.items():
+        lines.append(f"{file}:")
+        lines.extend(item.format() for item in items)
+    return "\n".join(lines)
+
+
+def verify_bundle(path: str, scenarios: list[Scenario]):
+    """Перечитывает записанную сборку и сравнивает с исходными сценариями"""
+    bundle = ScenarioBundle(path)
+    try:
+        for scenario in scenarios:
+            if decode_scenario(scenario.key, *bundle.payload(scenario.key)) != scenario:
+                raise ValueError(f"Сценарий '{scenario.key}' после сборки отличается от исходного")
+            if bundle.photos[scenario.key] != scenario_photos(scenario):
+                raise ValueError(f"Картинки сценария '{scenario.key}' в индексе сборки отличаются от исходных")
+    finally:
+        bundle.close()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Проверка и сборка сценариев в один файл")
+    parser.add_argument("--scenarios", default=SCENARIOS_DIR, help="Каталог json-файлов сценариев")
+    parser.add_argument("--images", default=IMAGE_DIR, help="Каталог картинок")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Файл сборки")
+    parser.add_argument("--check", action="store_true", help="Только проверить, сборку не записывать")
+    args = parser.parse_args(argv)
+
+    scenarios, problems = compile_directory(args.scenarios, args.images)
+    errors = sum(problem.error for problem in problems)
+    if problems:
+        print(format_problems(problems))
+    print(f"Сценариев: {len(scenarios)}, ошибок: {errors}, предупреждений: {len(problems) - errors}")
+
+    if errors:
+        print("Сборка не записана: исправьте ошибки")
+        return 1
+    if args.check:
+        return 0
+
+    version = write_bundle(args.output, [bundle_entry(scenario) for scenario in scenarios])
+    verify_bundle(args.output, scenarios)
+    print(f"Сборка {version}: {args.output} ({os.path.getsize(args.output) / 1024:.1f} КБ)")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
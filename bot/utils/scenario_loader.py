@@ -56,170 +56,166 @@ def validate_scenario_structure(data: dict) -> bool:
     Returns:
         bool: True если структура верная, False если есть ошибки
     """
+    problems = scenario_problems(data)
+    for problem in problems:
+        logger.error(problem)
+    return not problems
+
+
+def validate_step_structure(step: dict) -> bool:
+    """
+    Валидация структуры отдельного шага
+
+    Args:
+        step: Данные шага
+
+    Returns:
+        bool: True если структура верная, False если есть ошибки
+    """
+    problems = step_problems(step)
+    for problem in problems:
+        logger.error(problem)
+    return not problems
+
+
+def scenario_problems(data: dict) -> list[str]:
+    """
+    Все ошибки структуры сценария, а не только первая
+
+    Args:
+        data: Данные сценария
+
+    Returns:
+        list: Описания ошибок; пустой список - структура верная
+    """
+    if not isinstance(data, dict):
+        return ["Сценарий должен быть JSON-объектом"]
+
     # Проверка обязательных полей
     required_fields = ['name', 'steps']
     if not all(field in data for field in required_fields):
-        logger.error("Отсутствуют обязательные поля: 'name' или 'steps'")
-        return False
+        return ["Отсутствуют обязательные поля: 'name' или 'steps'"]
 
     # Проверка типа поля steps
     if not isinstance(data['steps'], list):
-        logger.error("Поле 'steps' должно быть списком")
-        return False
+        return ["Поле 'steps' должно быть списком"]
 
     # Проверка что steps не пустой
     if len(data['steps']) == 0:
-        logger.error("Сценарий не может быть пустым (steps пустой)")
-        return False
+        return ["Сценарий не может быть пустым (steps пустой)"]
 
     # Валидация каждого шага
+    problems = []
     for i, step in enumerate(data['steps']):
-        if not validate_step_structure(step):
-            logger.error(f"Ошибка в шаге {i + 1}")
-            return False
-
-    return True
+        problems.extend(f"Ошибка в шаге {i + 1}: {problem}" for problem in step_problems(step))
+    return problems
 
 
-def validate_step_structure(step: dict) -> bool:
+def step_problems(step: dict) -> list[str]:
     """
-    Валидация структуры отдельного шага
+    Все ошибки структуры отдельного шага
 
     Args:
         step: Данные шага
 
     Returns:
-        bool: True если структура верная, False если есть ошибки
+        list: Описания ошибок; пустой список - структура верная
     """
+    if not isinstance(step, dict):
+        return ["Шаг должен быть JSON-объектом"]
+
     # Проверка обязательных полей для любого шага
     if 'type' not in step or 'text' not in step:
-        logger.error("Отсутствуют обязательные поля: 'type' или 'text'")
-        return False
+        return ["Отсутствуют обязательные поля: 'type' или 'text'"]
 
+    problems = []
     step_type = step['type']
 
     # Проверка поля photo (если есть)
     if 'photo' in step and step['photo']:
         if not isinstance(step['photo'], str):
-            logger.error("Поле 'photo' должно быть строкой (имя файла)")
-            return False
+            problems.append("Поле 'photo' должно быть строкой (имя файла)")
 
     # Проверка поля button_text (если есть)
     if 'button_text' in step and step['button_text']:
         if not isinstance(step['button_text'], str):
-            logger.error("Поле 'button_text' должно быть строкой")
-            return False
+            problems.append("Поле 'button_text' должно быть строкой")
 
     # Валидация в зависимости от типа шага
     if step_type == "theory":
         # Проверяем is_final если есть
         if 'is_final' in step and not isinstance(step['is_final'], bool):
-            logger.error("Поле 'is_final' должно быть boolean")
-            return False
-        return True
+            problems.append("Поле 'is_final' должно быть boolean")
 
     elif step_type == "practice":
         # Практика требует кнопки и правильный ответ
         if 'buttons' not in step:
-            logger.error("Для типа 'practice' отсутствует поле 'buttons'")
-            return False
+            problems.append("Для типа 'practice' отсутствует поле 'buttons'")
+        elif not isinstance(step['buttons'], list) or len(step['buttons']) == 0:
+            problems.append("Поле 'buttons' должно быть непустым списком")
 
         if 'correct_answer' not in step:
-            logger.error("Для типа 'practice' отсутствует поле 'correct_answer'")
-            return False
-
-        if not isinstance(step['buttons'], list) or len(step['buttons']) == 0:
-            logger.error("Поле 'buttons' должно быть непустым списком")
-            return False
-
-        if step['correct_answer'] not in step['buttons']:
-            logger.error("correct_answer должен быть одним из элементов buttons")
-            return False
-
-        return True
+            problems.append("Для типа 'practice' отсутствует поле 'correct_answer'")
+        elif isinstance(step.get('buttons'), list) and step['correct_answer'] not in step['buttons']:
+            problems.append("correct_answer должен быть одним из элементов buttons")
 
     elif step_type == "text_answer":
-        return True  # Текстовый ответ требует только текст
-
+        pass  # Текстовый ответ требует только текст
 
     elif step_type == "branch":
-
-        if 'options' not in step:
-            logger.error("Для типа 'branch' отсутствует поле 'options'")
-
-            return False
-
-        if not isinstance(step['options'], list) or len(step['options']) == 0:
-            logger.error("Поле 'options' должно быть непустым списком")
-
-            return False
-
-        for i, option in enumerate(step['options']):
-
-            if 'text' not in option:
-                logger.error(f"Опция {i + 1} отсутствует поле 'text'")
-
-                return False
+        for problem in _options_problems(step, "branch"):
+            problems.append(problem)
+        for i, option in enumerate(step.get('options') or []):
+            if not isinstance(option, dict):
+                continue
 
             if 'response' not in option:
-                logger.error(f"Опция {i + 1} отсутствует поле 'response'")
-
-                return False
+                problems.append(f"Опция {i + 1} отсутствует поле 'response'")
 
             # Проверяем repeat_step если есть
-
             if 'repeat_step' in option and not isinstance(option['repeat_step'], bool):
-                logger.error(f"Опция {i + 1}: поле 'repeat_step' должно быть boolean")
-
-                return False
+                problems.append(f"Опция {i + 1}: поле 'repeat_step' должно быть boolean")
 
             # Проверяем show_continue_button если есть
-
             if 'show_continue_button' in option and not isinstance(option['show_continue_button'], bool):
-                logger.error(f"Опция {i + 1}: поле 'show_continue_button' должно быть boolean")
-
-                return False
-
-        return True
+                problems.append(f"Опция {i + 1}: поле 'show_continue_button' должно быть boolean")
 
     elif step_type == "survey":
         # Survey требует только buttons без correct_answer
         if 'buttons' not in step:
-            logger.error("Для типа 'survey' отсутствует поле 'buttons'")
-            return False
-
-        if not isinstance(step['buttons'], list) or len(step['buttons']) == 0:
-            logger.error("Поле 'buttons' должно быть непустым списком")
-            return False
-
-        return True
-
+            problems.append("Для типа 'survey' отсутствует поле 'buttons'")
+        elif not isinstance(step['buttons'], list) or len(step['buttons']) == 0:
+            problems.append("Поле 'buttons' должно быть непустым списком")
 
     elif step_type == "branch_with_input":
-        # Проверяем options
-        if 'options' not in step:
-            logger.error("Для типа 'branch_with_input' отсутствует поле 'options'")
-            return False
+        for problem in _options_problems(step, "branch_with_input"):
+            problems.append(problem)
+        # Проверяем каждую опцию
+        for i, option in enumerate(step.get('options') or []):
+            if isinstance(option, dict) and 'input_prompt' not in option:
+                problems.append(f"Опция {i + 1} отсутствует поле 'input_prompt'")
+
+    else:
+        problems.append(f"Неизвестный тип шага: '{step_type}'")
 
-        if not isinstance(step['options'], list) or len(step['options']) == 0:
-            logger.error("Поле 'options' должно быть непустым списком")
-            return False
+    return problems
 
-        # Проверяем каждую опцию
-        for i, option in enumerate(step['options']):
-            if 'text' not in option:
-                logger.error(f"Опция {i + 1} отсутствует поле 'text'")
-                return False
 
-            if 'input_prompt' not in option:
-                logger.error(f"Опция {i + 1} отсутствует поле 'input_prompt'")
-                return False
+def _options_problems(step: dict, step_type: str) -> list[str]:
+    """Общие проверки списка options для branch и branch_with_input"""
+    if 'options' not in step:
+        return [f"Для типа '{step_type}' отсутствует поле 'options'"]
 
-        return True
+    if not isinstance(step['options'], list) or len(step['options']) == 0:
+        return ["Поле 'options' должно быть непустым списком"]
 
-    else:
-        logger.error(f"Неизвестный тип шага: '{step_type}'")
-        return False
+    problems = []
+    for i, option in enumerate(step['options']):
+        if not isinstance(option, dict):
+            problems.append(f"Опция {i + 1} должна быть JSON-объектом")
+        elif 'text' not in option:
+            problems.append(f"Опция {i + 1} отсутствует поле 'text'")
+    return problems
 
 
 def get_available_scenarios() -> list:
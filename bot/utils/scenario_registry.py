@@ -0,0 +1,389 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable, ClassVar
+
+from bot.config import SCENARIOS_DIR, SCENARIO_BUNDLE, SCENARIO_BUNDLE_MMAP
+from bot.utils.scenario_bundle import ScenarioBundle
+from bot.utils.scenario_loader import validate_scenario_structure
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True, kw_only=True)
+class Step:
+    """Базовый шаг сценария: текст и необязательное фото"""
+    kind: ClassVar[str] = ""
+    text: str
+    photo: str | None = None
+
+
+@dataclass(frozen=True, slots=True, kw_only=True)
+class Theory(Step):
+    kind: ClassVar[str] = "theory"
+    button_text: str = "Дальше"
+    is_final: bool = False
+
+
+@dataclass(frozen=True, slots=True, kw_only=True)
+class Practice(Step):
+    kind: ClassVar[str] = "practice"
+    buttons: tuple[str, ...]
+    correct_answer: str
+
+
+@dataclass(frozen=True, slots=True, kw_only=True)
+class BranchOption:
+    text: str
+    response: str
+    repeat_step: bool = False
+    show_continue_button: bool = True
+
+
+@dataclass(frozen=True, slots=True, kw_only=True)
+class Branch(Step):
+    kind: ClassVar[str] = "branch"
+    options: tuple[BranchOption, ...]
+
+
+@dataclass(frozen=True, slots=True, kw_only=True)
+class InputOption:
+    text: str
+    input_prompt: str
+
+
+@dataclass(frozen=True, slots=True, kw_only=True)
+class BranchWithInput(Step):
+    kind: ClassVar[str] = "branch_with_input"
+    options: tuple[InputOption, ...]
+
+
+@dataclass(frozen=True, slots=True, kw_only=True)
+class Survey(Step):
+    kind: ClassVar[str] = "survey"
+    buttons: tuple[str, ...]
+
+
+@dataclass(frozen=True, slots=True, kw_only=True)
+class TextAnswer(Step):
+    kind: ClassVar[str] = "text_answer"
+    placeholder: str | None = None
+    prompt: str  # текст вместе с подсказкой, готовый к отправке
+
+
+@dataclass(frozen=True, slots=True, kw_only=True)
+class Scenario:
+    """Скомпилированный сценарий: неизменяемый, общий для всех пользователей"""
+    key: str
+    name: str
+    description: str
+    steps: tuple[Step, ...]
+    version: str
+
+
+def compile_step(step: dict) -> Step:
+    """
+    Превращает провалидированный шаг-словарь в типизированный объект
+
+    Args:
+        step: Данные шага (уже прошедшие validate_step_structure)
+
+    Returns:
+        Step: Объект шага соответствующего типа
+    """
+    step_type = step['type']
+    common = {'text': step['text'], 'photo': step.get('photo') or None}
+
+    if step_type == "theory":
+        return Theory(**common,
+                      button_text=step.get('button_text') or "Дальше",
+                      is_final=step.get('is_final', False))
+
+    elif step_type == "practice":
+        return Practice(**common,
+                        buttons=tuple(step['buttons']),
+                        correct_answer=step['correct_answer'])
+
+    elif step_type == "branch":
+        return Branch(**common, options=tuple(
+            BranchOption(text=option['text'],
+                         response=option['response'],
+                         repeat_step=option.get('repeat_step', False),
+                         show_continue_button=option.get('show_continue_button', True))
+            for option in step['options']))
+
+    elif step_type == "branch_with_input":
+        return BranchWithInput(**common, options=tuple(
+            InputOption(text=option['text'], input_prompt=option['input_prompt'])
+            for option in step['options']))
+
+    elif step_type == "survey":
+        return Survey(**common, buttons=tuple(step['buttons']))
+
+    elif step_type == "text_answer":
+        placeholder = step.get('placeholder')
+        prompt = step['text']
+        if placeholder:
+            prompt += f"\n\n💡 Подсказка: {placeholder}"
+        return TextAnswer(**common, placeholder=placeholder, prompt=prompt)
+
+    raise ValueError(f"Неизвестный тип шага: '{step_type}'")
+
+
+def compile_scenario(key: str, data: dict, version: str) -> Scenario:
+    """Компилирует провалидированные данные сценария"""
+    return Scenario(
+        key=key,
+        name=data['name'],
+        description=data.get('description', ''),
+        steps=tuple(compile_step(step) for step in data['steps']),
+        version=version,
+    )
+
+
+# Номера типов шагов в сборке сценариев; порядок менять нельзя, только добавлять в конец
+STEP_KINDS = ("theory", "practice", "branch", "branch_with_input", "survey", "text_answer")
+_STEP_CODES = {kind: code for code, kind in enumerate(STEP_KINDS)}
+
+
+def encode_step(step: Step) -> list:
+    """Шаг -> позиционный массив для сборки: [код типа, текст, фото, ...поля типа]"""
+    head = [_STEP_CODES[step.kind], step.text, step.photo]
+    if isinstance(step, Theory):
+        return head + [step.button_text, step.is_final]
+    elif isinstance(step, Practice):
+        return head + [list(step.buttons), step.correct_answer]
+    elif isinstance(step, Branch):
+        return head + [[[option.text, option.response, option.repeat_step, option.show_continue_button]
+                        for option in step.options]]
+    elif isinstance(step, BranchWithInput):
+        return head + [[[option.text, option.input_prompt] for option in step.options]]
+    elif isinstance(step, Survey):
+        return head + [list(step.buttons)]
+    elif isinstance(step, TextAnswer):
+        return head + [step.placeholder, step.prompt]
+    raise ValueError(f"Неизвестный тип шага: '{step.kind}'")
+
+
+def decode_step(item: list) -> Step:
+    """Позиционный массив из сборки -> шаг"""
+    code, text, photo = item[0], item[1], item[2]
+    if code == 0:
+        return Theory(text=text, photo=photo, button_text=item[3], is_final=item[4])
+    elif code == 1:
+        return Practice(text=text, photo=photo, buttons=tuple(item[3]), correct_answer=item[4])
+    elif code == 2:
+        return Branch(text=text, photo=photo, options=tuple(
+            BranchOption(text=o[0], response=o[1], repeat_step=o[2], show_continue_button=o[3]) for o in item[3]))
+    elif code == 3:
+        return BranchWithInput(text=text, photo=photo, options=tuple(
+            InputOption(text=o[0], input_prompt=o[1]) for o in item[3]))
+    elif code == 4:
+        return Survey(text=text, photo=photo, buttons=tuple(item[3]))
+    elif code == 5:
+        return TextAnswer(text=text, photo=photo, placeholder=item[3], prompt=item[4])
+    raise ValueError(f"Неизвестный код типа шага: {code}")
+
+
+def encode_scenario(scenario: Scenario) -> bytes:
+    """Данные сценария для сборки: компактный JSON [имя, описание, [шаг, ...]]"""
+    payload = [scenario.name, scenario.description, [encode_step(step) for step in scenario.steps]]
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def scenario_photos(scenario: Scenario) -> tuple[str, ...]:
+    """Имена картинок шагов сценария (без повторов, в порядке шагов)"""
+    return tuple(dict.fromkeys(step.photo for step in scenario.steps if step.photo))
+
+
+def bundle_entry(scenario: Scenario) -> tuple[str, str, bytes, tuple[str, ...]]:
+    """Запись сценария для write_bundle"""
+    return scenario.key, scenario.version, encode_scenario(scenario), scenario_photos(scenario)
+
+
+def decode_scenario(key: str, version: str, payload: list) -> Scenario:
+    name, description, steps = payload
+    return Scenario(key=key, name=name, description=description,
+                    steps=tuple(decode_step(step) for step in steps), version=version)
+
+
+class ScenarioRegistry:
+    """
+    Реестр сценариев: все файлы из каталога читаются, валидируются и
+    компилируются один раз, дальше поиск по имени стоит O(1) и не трогает диск.
+    Изменения в каталоге подхватываются по отпечатку (имена, mtime и размеры файлов),
+    который проверяется не чаще, чем раз в check_interval секунд.
+
+    Если задан bundle_path, сценарии берутся из готовой сборки (одно чтение файла,
+    без валидации), а отпечатком служат mtime и размер сборки. С bundle_mmap сборка
+    отображается в память и сценарий разбирается при первом обращении к нему;
+    картинки для подготовки при запуске берутся из индекса сборки
+    """
+
+    def __init__(self, scenarios_dir: str = SCENARIOS_DIR, check_interval: float = 5.0,
+                 bundle_path: str = SCENARIO_BUNDLE, bundle_mmap: bool = SCENARIO_BUNDLE_MMAP):
+        self.scenarios_dir = scenarios_dir
+        self.check_interval = check_interval
+        self.bundle_path = bundle_path
+        self.bundle_mmap = bundle_mmap
+        self.signature: tuple = ()
+        self._scenarios: dict[str, Scenario] = {}
+        # Открытая сборка в режиме mmap: из нее разбираются еще не запрошенные сценарии
+        self._bundle: ScenarioBundle | None = None
+        self._listeners: list[Callable[[list[Scenario]], None]] = []
+        self._next_check = 0.0
+        self.load()
+
+    def _scan(self) -> tuple:
+        """Отпечаток каталога: отсортированные (имя, mtime, размер) json-файлов (или файла сборки)"""
+        if self.bundle_path:
+            try:
+                st = os.stat(self.bundle_path)
+            except OSError:
+                return ()
+            return ((os.path.basename(self.bundle_path), st.st_mtime_ns, st.st_size),)
+
+        os.makedirs(self.scenarios_dir, exist_ok=True)
+        files = []
+        with os.scandir(self.scenarios_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith('.json') and entry.is_file():
+                    st = entry.stat()
+                    files.append((entry.name, st.st_mtime_ns, st.st_size))
+        return tuple(sorted(files))
+
+    def load(self):
+        """(Пере)загружает все сценарии из каталога или сборки"""
+        signature = self._scan()
+        old_bundle = self._bundle
+
+        if self.bundle_path:
+            self._load_bundle()
+        else:
+            self._scenarios = self._load_directory([file for file, _, _ in signature])
+
+        if old_bundle is not None and old_bundle is not self._bundle:
+            old_bundle.close()
+        self.signature = signature
+        self._next_check = time.monotonic() + self.check_interval
+        logger.info(f"Загружено сценариев: {len(self.names())}")
+
+        for listener in self._listeners:
+            listener(self.loaded())
+
+    def refresh_if_changed(self) -> bool:
+        """
+        Перезагружает реестр, если файлы в каталоге изменились
+
+        Returns:
+            bool: True если реестр был перезагружен
+        """
+        now = time.monotonic()
+        if now < self._next_check:
+            return False
+        self._next_check = now + self.check_interval
+
+        if self._scan() == self.signature:
+            return False
+        self.load()
+        return True
+
+    def on_reload(self, listener: Callable[[list[Scenario]], None]):
+        """
+        Подписывает функцию на каждую (пере)загрузку; сразу вызывает ее для текущих сценариев.
+        Функция получает сценарии, уже разобранные в память (см. loaded)
+        """
+        self._listeners.append(listener)
+        listener(self.loaded())
+
+    def _load_directory(self, files: list[str]) -> dict[str, Scenario]:
+        scenarios = {}
+        for file in files:
+            key = file[:-len('.json')]
+            scenario = self._load_file(key, os.path.join(self.scenarios_dir, file))
+            if scenario is not None:
+                scenarios[key] = scenario
+        return scenarios
+
+    def _load_file(self, key: str, file_path: str) -> Scenario | None:
+        try:
+            with open(file_path, 'rb') as f:
+                raw = f.read()
+            data = json.loads(raw.decode('utf-8'))
+
+            if not validate_scenario_structure(data):
+                logger.error(f"Неверная структура сценария '{key}'")
+                return None
+
+            return compile_scenario(key, data, hashlib.sha1(raw).hexdigest()[:12])
+
+        except json.JSONDecodeError as e:
+            logger.error(f"Ошибка JSON в файле '{key}': {e}")
+        except Exception as e:
+            logger.error(f"Ошибка загрузки сценария '{key}': {e}")
+        return None
+
+    def _load_bundle(self):
+        """Читает сборку; если ее нет или она повреждена, остаются прежние сценарии"""
+        try:
+            bundle = ScenarioBundle(self.bundle_path, use_mmap=self.bundle_mmap)
+        except (OSError, ValueError) as e:
+            logger.error(f"Не удалось открыть сборку сценариев '{self.bundle_path}': {e}")
+            if not self._scenarios and self._bundle is None:
+                # Бот не должен остаться без сценариев: читаем каталог, сборка подхватится, когда появится
+                logger.warning(f"Сценарии загружаются из каталога '{self.scenarios_dir}'")
+                self._scenarios = self._load_directory(
+                    sorted(file for file in os.listdir(self.scenarios_dir) if file.endswith('.json')))
+            return
+
+        if self.bundle_mmap:
+            self._scenarios = {}
+            self._bundle = bundle
+            return
+        try:
+            self._scenarios = {key: decode_scenario(key, *bundle.payload(key)) for key in bundle.keys()}
+            self._bundle = None
+        except Exception as e:
+            logger.error(f"Ошибка разбора сборки сценариев '{self.bundle_path}': {e}")
+        finally:
+            bundle.close()
+
+    def _lookup(self, key: str) -> Scenario | None:
+        scenario = self._scenarios.get(key)
+        if scenario is None and self._bundle is not None and key in self._bundle:
+            scenario = self._scenarios[key] = decode_scenario(key, *self._bundle.payload(key))
+        return scenario
+
+    def get(self, key: str) -> Scenario | None:
+        """Возвращает сценарий по имени файла (без .json) или None"""
+        self.refresh_if_changed()
+        return self._lookup(key)
+
+    def names(self) -> list[str]:
+        """Имена всех загруженных сценариев"""
+        if self._bundle is not None:
+            return self._bundle.keys()
+        return list(self._scenarios)
+
+    def loaded(self) -> list[Scenario]:
+        """Сценарии, уже разобранные в память; в режиме mmap - только те, к которым обращались"""
+        return list(self._scenarios.values())
+
+    def all(self) -> list[Scenario]:
+        """Все загруженные сценарии (в режиме mmap разбирает еще не разобранные)"""
+        if self._bundle is not None:
+            return [self._lookup(key) for key in self._bundle.keys()]
+        return list(self._scenarios.values())
+
+    def referenced_photos(self) -> list[str]:
+        """Имена всех картинок, на которые ссылаются шаги сценариев (без повторов)"""
+        if self._bundle is not None:
+            # Из индекса сборки: сценарии не разбираются
+            return list(dict.fromkeys(photo for key in self._bundle.keys() for photo in self._bundle.photos[key]))
+        return list(dict.fromkeys(photo for scenario in self.all() for photo in scenario_photos(scenario)))
+
+
+scenario_registry = ScenarioRegistry()
@@ -0,0 +1,252 @@
+"""
+Режим нескольких процессов: один входной процесс (polling или webhook)
+получает обновления и раздает их N рабочим процессам по хэшу id пользователя.
+Все обновления одного пользователя попадают в один и тот же процесс в порядке
+получения, поэтому его сессия и порядок шагов не зависят от числа процессов.
+Внутри рабочего процесса обновления выполняются задачами, а по очереди их
+выстраивает UserOrderMiddleware диспетчера (bot/middlewares/user_order.py).
+
+Рабочие процессы создаются через fork до запуска цикла событий и наследуют уже
+загруженные сценарии (страницы памяти общие, пока их никто не меняет).
+Входной процесс следит за ними: если рабочий завершился (в том числе при
+запуске, еще не подключившись), бот останавливается с ошибкой, а не ждет его.
+Связь - локальные TCP-сокеты, кадры вида <длина: 4 байта><JSON обновления>.
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import secrets
+import signal
+import socket
+import struct
+from typing import Awaitable, Callable
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+FRAME_HEADER = struct.Struct(">I")
+
+# Типы обновлений, в которых есть пользователь-отправитель
+USER_UPDATE_TYPES = ("message", "callback_query", "edited_message", "inline_query",
+                     "chosen_inline_result", "my_chat_member", "chat_member", "pre_checkout_query",
+                     "shipping_query", "chat_join_request", "poll_answer")
+
+
+def extract_user_id(update: dict) -> int | None:
+    """Id пользователя из сырого обновления Telegram"""
+    for update_type in USER_UPDATE_TYPES:
+        event = update.get(update_type)
+        if event:
+            sender = event.get("from") or event.get("user")
+            if sender:
+                return sender["id"]
+    return None
+
+
+def shard_for(update: dict, workers: int) -> int:
+    """Номер рабочего процесса для обновления"""
+    user_id = extract_user_id(update)
+    key = user_id if user_id is not None else update.get("update_id", 0)
+    return key % workers
+
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes:
+    """Читает один кадр: длина и тело"""
+    header = await reader.readexactly(FRAME_HEADER.size)
+    return await reader.readexactly(FRAME_HEADER.unpack(header)[0])
+
+
+def write_frame(writer: asyncio.StreamWriter, payload: bytes):
+    """Пишет один кадр в буфер сокета"""
+    writer.write(FRAME_HEADER.pack(len(payload)) + payload)
+
+
+class ShardedRunner:
+    """
+    Входной процесс и его рабочие процессы
+
+    Args:
+        workers: Число рабочих процессов
+        create_bot: Фабрика бота (вызывается в каждом процессе)
+        create_dispatcher: Фабрика диспетчера с роутерами (вызывается в каждом процессе)
+        on_worker_start: Необязательная корутина (номер, бот), выполняется в рабочем после запуска
+    """
+
+    def __init__(self, workers: int, create_bot: Callable[[], Bot], create_dispatcher: Callable[[], Dispatcher],
+                 on_worker_start: Callable[[int, Bot], Awaitable] | None = None):
+        self.workers = workers
+        self.create_bot = create_bot
+        self.create_dispatcher = create_dispatcher
+        self.on_worker_start = on_worker_start
+        self._writers: list[asyncio.StreamWriter | None] = [None] * workers
+        self._processes: list[multiprocessing.Process] = []
+        # События создаются в serve(), уже внутри цикла событий входного процесса
+        self._connected: asyncio.Event | None = None
+        self._failed: asyncio.Event | None = None
+        self._stopping = False
+
+    # --- рабочий процесс ---
+
+    def _worker_main(self, index: int, port: int):
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        asyncio.run(self._worker(index, port))
+
+    async def _worker(self, index: int, port: int):
+        bot = self.create_bot()
+        dp = self.create_dispatcher()
+        await dp.emit_startup(bot=bot, dispatcher=dp)
+        if self.on_worker_start is not None:
+            await self.on_worker_start(index, bot)
+
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(FRAME_HEADER.pack(index))
+        await writer.drain()
+        logger.info(f"Рабочий процесс {index} (pid {os.getpid()}) подключен")
+
+        tasks = set()
+        try:
+            while True:
+                payload = await read_frame(reader)
+                update = Update.model_validate_json(payload, context={"bot": bot})
+                # Задачи создаются в порядке кадров и до замка очереди пользователя
+                # не переключаются, поэтому обновления пользователя выполняются в порядке получения
+                task = asyncio.create_task(dp.feed_update(bot, update))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            logger.info(f"Рабочий процесс {index}: входной процесс закрыл соединение")
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            await dp.emit_shutdown(bot=bot, dispatcher=dp)
+            await bot.session.close()
+
+    # --- входной процесс ---
+
+    def start_workers(self) -> socket.socket:
+        """Открывает сокет для рабочих и форкает их; вызывается до запуска цикла событий"""
+        listener = socket.create_server(("127.0.0.1", 0))
+        port = listener.getsockname()[1]
+
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+        for index in range(self.workers):
+            process = context.Process(target=self._worker_main, args=(index, port),
+                                      name=f"bot-worker-{index}", daemon=True)
+            process.start()
+            self._processes.append(process)
+        return listener
+
+    async def _accept_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        index = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))[0]
+        self._writers[index] = writer
+        if all(self._writers):
+            self._connected.set()
+        try:
+            await reader.read()
+        finally:
+            if not self._stopping:
+                # Обновления его пользователей больше некому обработать: останавливаем весь бот
+                logger.error(f"Рабочий процесс {index} отключился")
+                self._failed.set()
+
+    async def _watch_processes(self):
+        """Отмечает сбой, если какой-либо рабочий процесс завершился до остановки бота"""
+        sentinels = {process.sentinel: process for process in self._processes}
+        while not self._stopping:
+            # Ожидание с таймаутом: поток не переживает остановку входного процесса
+            ready = await asyncio.to_thread(multiprocessing.connection.wait, list(sentinels), 1.0)
+            if ready and not self._stopping:
+                process = sentinels[ready[0]]
+                await asyncio.to_thread(process.join, 1.0)
+                logger.error(f"Рабочий процесс {process.name} (pid {process.pid}) "
+                             f"завершился с кодом {process.exitcode}")
+                self._failed.set()
+                return
+
+    async def dispatch(self, update: dict, raw: bytes | None = None):
+        """Передает обновление рабочему процессу его пользователя"""
+        writer = self._writers[shard_for(update, self.workers)]
+        write_frame(writer, raw if raw is not None else json.dumps(update).encode())
+        # drain ждет, только если буфер сокета переполнен: естественное обратное давление
+        await writer.drain()
+
+    async def serve(self, listener: socket.socket, ingress: Callable[["ShardedRunner"], Awaitable]):
+        """Ждет подключения всех рабочих и запускает прием обновлений до остановки или сбоя рабочего"""
+        self._connected = asyncio.Event()
+        self._failed = asyncio.Event()
+        server = await asyncio.start_server(self._accept_worker, sock=listener)
+        watch_task = asyncio.create_task(self._watch_processes())
+        failed_task = asyncio.create_task(self._failed.wait())
+        connected_task = asyncio.create_task(self._connected.wait())
+        ingress_task = None
+        try:
+            # Рабочий может упасть еще при запуске (emit_startup, on_worker_start), до подключения
+            await asyncio.wait({connected_task, failed_task}, return_when=asyncio.FIRST_COMPLETED)
+            if not self._connected.is_set():
+                raise RuntimeError("Рабочий процесс завершился, не успев подключиться")
+            logger.info(f"Подключено рабочих процессов: {self.workers}")
+            ingress_task = asyncio.create_task(ingress(self))
+            await asyncio.wait({ingress_task, failed_task}, return_when=asyncio.FIRST_COMPLETED)
+            if ingress_task.done():
+                ingress_task.result()
+        finally:
+            for task in (ingress_task, failed_task, connected_task, watch_task):
+                if task is not None and not task.done():
+                    task.cancel()
+            self._stopping = True
+            for writer in self._writers:
+                if writer is not None:
+                    writer.close()
+            server.close()
+            for process in self._processes:
+                await asyncio.to_thread(process.join, 10)
+                if process.is_alive():
+                    # Например, рабочий, который так и не подключился
+                    logger.warning(f"Рабочий процесс {process.name} не завершился сам, останавливаем его")
+                    process.terminate()
+                    await asyncio.to_thread(process.join, 5)
+
+    def run(self, ingress: Callable[["ShardedRunner"], Awaitable]):
+        """Форкает рабочих и обслуживает их до остановки"""
+        listener = self.start_workers()
+        asyncio.run(self.serve(listener, ingress))
+
+
+async def polling_ingress(runner: ShardedRunner, bot: Bot, allowed_updates: list[str], timeout: int = 30):
+    """Получает обновления через getUpdates и раздает их рабочим процессам"""
+    await bot.delete_webhook()
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=timeout, allowed_updates=allowed_updates)
+        except Exception as e:
+            logger.error(f"Ошибка получения обновлений: {e}")
+            await asyncio.sleep(1)
+            continue
+        for update in updates:
+            raw = update.model_dump_json(exclude_unset=True, by_alias=True).encode()
+            await runner.dispatch(json.loads(raw), raw)
+            offset = update.update_id + 1
+
+
+def webhook_ingress_app(runner: ShardedRunner, path: str, secret: str | None) -> web.Application:
+    """Webhook входного процесса: проверяет секрет, сразу отвечает и пересылает тело рабочему"""
+
+    async def handle(request: web.Request) -> web.Response:
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if secret and not secrets.compare_digest(token, secret):
+            return web.Response(status=401, text="Unauthorized")
+        raw = await request.read()
+        await runner.dispatch(json.loads(raw), raw)
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_post(path, handle)
+    return app
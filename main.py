@@ -1,33 +1,244 @@
 import asyncio
 import logging
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 
-from bot.config import BOT_TOKEN, ROOT_DIR
+from bot.config import (
+    BOT_TOKEN, ROOT_DIR, FILE_CACHE_CHAT_ID, IMAGE_PIPELINE, DELIVERY_MODE,
+    WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT, TELEGRAM_API_URL,
+    WORKERS, FSM_STORAGE, DRIP_ENABLED, METRICS_HOST, METRICS_PORT,
+)
+from bot.handlers.callback_handler import router as callback_router
 from bot.handlers.start_handler import router as start_router
 from bot.handlers.scenario_handler import router as scenario_router
-from bot.handlers.admin_handler import router as admin_router
+from bot.handlers.admin_handler import router as admin_router, resume_broadcast
 from bot.middlewares import exist_middleware
+from bot.middlewares.outbound_queue import outbound_queue
+from bot.middlewares.user_order import user_order
+from bot.middlewares.metrics_middleware import UpdateMetricsMiddleware, handler_metrics, api_metrics
+from bot.utils.metrics import metrics, start_metrics_server
+from bot.utils.scenario_registry import scenario_registry
+from bot.keyboards.scenario_keyboards import warm_scenario_keyboards
+from bot.utils.file_id_cache import file_id_cache
+from bot.utils.image_pipeline import image_pipeline, format_report
+from bot.utils.asset_manifest import asset_manifest
+from bot.storage import create_storage
+from bot.storage.instrumented import InstrumentedStorage
+from bot.utils.answer_recorder import answer_recorder
+from bot.utils.analytics import analytics
+from bot.utils.drip_scheduler import drip_scheduler
+from bot.utils.broadcast import broadcast_engine
+from bot.handlers.start_handler import WELCOME_PHOTO
+from bot.utils.sharding import ShardedRunner, polling_ingress, webhook_ingress_app
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 
 
-async def main():
-    # Инициализация бота и диспетчера
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher()
+def create_bot(token: str = BOT_TOKEN, api_url: str = TELEGRAM_API_URL) -> Bot:
+    """Создает бота; api_url позволяет направить запросы на свой Bot API сервер"""
+    if api_url:
+        bot = Bot(token=token, session=AiohttpSession(api=TelegramAPIServer.from_base(api_url)))
+    else:
+        bot = Bot(token=token)
+    # Все исходящие запросы идут через общую очередь с учетом лимитов Telegram
+    bot.session.middleware(outbound_queue)
+    if metrics.enabled:
+        # После очереди: меряется сам запрос, без ожидания в очереди
+        bot.session.middleware(api_metrics)
+    return bot
+
 
+def create_dispatcher() -> Dispatcher:
+    """Диспетчер со всеми роутерами и middleware"""
+    # Хранилище сессий выбирается настройкой FSM_STORAGE (memory, sqlite, redis)
+    storage = create_storage()
+    if metrics.enabled:
+        storage = InstrumentedStorage(storage)
+    # FSM-middleware подключается ниже вручную, после очереди пользователя;
+    # хранилище при остановке закрывает сам диспетчер (dp.fsm.close)
+    dp = Dispatcher(storage=storage, disable_fsm=True)
+    # Ответы пользователей из очереди дописываются при остановке
+    dp.shutdown.register(answer_recorder.close)
+    dp.shutdown.register(analytics.close)
+    dp.shutdown.register(drip_scheduler.close)
+    dp.shutdown.register(broadcast_engine.close)
+    dp.shutdown.register(outbound_queue.close)
 
-    dp.update.outer_middleware(exist_middleware)
+    if metrics.enabled:
+        # Метрики оборачивают проверку доступа, чтобы мерить ее отдельно от обработчиков
+        dp.update.outer_middleware(UpdateMetricsMiddleware(access_check=exist_middleware))
+        dp.message.middleware(handler_metrics)
+        dp.callback_query.middleware(handler_metrics)
+    else:
+        dp.update.outer_middleware(exist_middleware)
+    # После проверки доступа: обновления пользователя по очереди, повторные нажатия отсекаются
+    dp.update.outer_middleware(user_order)
+    # Состояние читается уже под замком очереди: обновление, ждавшее предыдущее,
+    # видит состояние после него (StateFilter, raw_state в resolve_callback_step)
+    dp.update.outer_middleware(dp.fsm)
 
-    # Регистрация роутеров
+    # Клавиатуры шагов и манифест картинок строим один раз при загрузке (и перезагрузке) контента
+    scenario_registry.on_reload(warm_scenario_keyboards)
+    scenario_registry.on_reload(lambda scenarios: asset_manifest.build(referenced_photos()))
+
+    # Регистрация роутеров; нажатия на кнопки разбираются одной таблицей (bot/handlers/callback_handler.py)
+    dp.include_router(callback_router)
     dp.include_router(start_router)
     dp.include_router(scenario_router)
     dp.include_router(admin_router)
+    return dp
+
+
+def referenced_photos() -> list[str]:
+    return list(dict.fromkeys([WELCOME_PHOTO, *scenario_registry.referenced_photos()]))
+
+
+def optimize_images(photos: list[str]):
+    # Сжатие картинок: пересобираются только изменившиеся исходники
+    if IMAGE_PIPELINE:
+        report = image_pipeline.build(photos)
+        if report:
+            logging.info("Оптимизация картинок:\n" + format_report(report))
+
+
+async def prepare_assets(bot: Bot, optimize: bool = True):
+    photos = referenced_photos()
+    if optimize:
+        await asyncio.to_thread(optimize_images, photos)
+        # Сжатые копии появились после первой сборки манифеста: пути и хэши меняются
+        await asyncio.to_thread(asset_manifest.build, photos)
+
+    # Прогрев кэша file_id: картинки загружаются в служебный чат в фоне
+    if FILE_CACHE_CHAT_ID:
+        photo_paths = [asset.path for asset in asset_manifest.assets()]
+        return asyncio.create_task(file_id_cache.warm_up(bot, FILE_CACHE_CHAT_ID, photo_paths))
+
+
+async def start_metrics(index: int = 0):
+    """Поднимает /metrics; рабочий процесс N слушает METRICS_PORT + N"""
+    if metrics.enabled and METRICS_PORT:
+        return await start_metrics_server(METRICS_HOST, METRICS_PORT + index)
+
+
+async def run_polling(bot: Bot, dp: Dispatcher):
+    # Запрашиваем только те типы обновлений, на которые есть обработчики
+    await bot.delete_webhook()
+    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+
+
+def create_webhook_app(bot: Bot, dp: Dispatcher, secret: str = WEBHOOK_SECRET) -> web.Application:
+    """
+    aiohttp-приложение для приема обновлений по webhook.
+    Telegram получает ответ сразу, а обработка идет в фоновой задаче
+    """
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=secret or None,
+        handle_in_background=True,
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    if not WEBHOOK_BASE_URL:
+        raise RuntimeError("Для режима webhook нужно указать WEBHOOK_BASE_URL")
+    if not WEBHOOK_SECRET:
+        logging.warning("WEBHOOK_SECRET не задан: запросы к webhook не проверяются")
+
+    await bot.set_webhook(
+        url=f"{WEBHOOK_BASE_URL.rstrip('/')}{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET or None,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+
+    runner = web.AppRunner(create_webhook_app(bot, dp))
+    await runner.setup()
+    await web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT).start()
+    logging.info(f"Webhook слушает {WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+async def on_worker_start(index: int, bot: Bot):
+    await start_metrics(index)
+    # Картинки уже сжаты до запуска рабочих; file_id прогревает и расписание ведет только первый рабочий
+    if index == 0:
+        await prepare_assets(bot, optimize=False)
+        if DRIP_ENABLED:
+            drip_scheduler.start(bot)
+        await resume_broadcast(bot)
+
+
+async def run_sharded_ingress(runner: ShardedRunner):
+    """Входной процесс: получает обновления и раздает их рабочим"""
+    bot = create_bot()
+    # Диспетчер нужен только для списка используемых типов обновлений
+    dp = create_dispatcher()
+    allowed_updates = dp.resolve_used_update_types()
+    await dp.storage.close()
+    try:
+        if DELIVERY_MODE == "webhook":
+            if not WEBHOOK_BASE_URL:
+                raise RuntimeError("Для режима webhook нужно указать WEBHOOK_BASE_URL")
+            await bot.set_webhook(
+                url=f"{WEBHOOK_BASE_URL.rstrip('/')}{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET or None,
+                allowed_updates=allowed_updates,
+            )
+            app_runner = web.AppRunner(webhook_ingress_app(runner, WEBHOOK_PATH, WEBHOOK_SECRET or None))
+            await app_runner.setup()
+            await web.TCPSite(app_runner, WEBAPP_HOST, WEBAPP_PORT).start()
+            logging.info(f"Webhook слушает {WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH}")
+            try:
+                await asyncio.Event().wait()
+            finally:
+                await app_runner.cleanup()
+        else:
+            await polling_ingress(runner, bot, allowed_updates)
+    finally:
+        await bot.session.close()
+
+
+def main_sharded():
+    if FSM_STORAGE == "memory":
+        logging.warning("FSM_STORAGE=memory: сессии живут в памяти своего рабочего процесса "
+                        "и теряются при его перезапуске; для нескольких процессов лучше sqlite или redis")
+
+    # Сжимаем картинки до fork, чтобы рабочие унаследовали готовый манифест
+    optimize_images(referenced_photos())
+
+    runner = ShardedRunner(WORKERS, create_bot, create_dispatcher, on_worker_start=on_worker_start)
+    runner.run(run_sharded_ingress)
+
+
+async def main():
+    # Инициализация бота и диспетчера
+    bot = create_bot()
+    dp = create_dispatcher()
+
+    warm_up_task = await prepare_assets(bot)
+    await start_metrics()
+    if DRIP_ENABLED:
+        drip_scheduler.start(bot)
+    await resume_broadcast(bot)
 
-    # Запуск polling
-    await dp.start_polling(bot)
+    if DELIVERY_MODE == "webhook":
+        await run_webhook(bot, dp)
+    else:
+        await run_polling(bot, dp)
 
 
 if __name__ == "__main__":
     print(ROOT_DIR)
-    asyncio.run(main())
\ No newline at end of file
+    if WORKERS > 1:
+        main_sharded()
+    else:
+        asyncio.run(main())